@@ -0,0 +1,93 @@
+"""
+Compares roof color and mask construction against the original implementation.
+
+Usage:
+    python -m benchmarks.bench_bounding_boxes [--image data/street_map.png] [--tile 2]
+"""
+import argparse
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+from skimage.color import rgb2gray
+
+from src.bounding_boxes import (
+    RoofMaskBuffers,
+    _get_roof_color,
+    _replace_roof_colors,
+    _roof_mask,
+)
+from src.utils import load_image
+
+
+def legacy_get_roof_color(gray_image):
+    """
+    The original Counter based roof color, kept as a baseline.
+    """
+    return Counter(gray_image.flat).most_common(3)[1][0]
+
+
+def peak_bytes(function):
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def best_time(function, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--image", default="data/street_map.png")
+    parser.add_argument(
+        "--tile", type=int, default=2, help="repeat the image to reach tile size"
+    )
+    args = parser.parse_args()
+
+    image = np.tile(load_image(args.image), (args.tile, args.tile, 1))
+    gray_image = rgb2gray(image)
+    print(f"image {image.shape[0]}x{image.shape[1]}")
+
+    def legacy_mask():
+        gray = rgb2gray(image)
+        return _replace_roof_colors(gray, legacy_get_roof_color(gray))
+
+    buffers = RoofMaskBuffers.for_shape(image.shape)
+
+    def palette_mask():
+        return _roof_mask(image, buffers=buffers)
+
+    for name, legacy, current in [
+        (
+            "roof color",
+            lambda: legacy_get_roof_color(gray_image),
+            lambda: _get_roof_color(gray_image),
+        ),
+        ("roof mask", legacy_mask, palette_mask),
+    ]:
+        legacy_seconds = best_time(legacy)
+        current_seconds = best_time(current)
+        print(
+            f"{name:>12}: legacy {legacy_seconds:.4f}s, numpy {current_seconds:.4f}s, "
+            f"{legacy_seconds / current_seconds:.1f}x"
+        )
+
+    pixels = image.shape[0] * image.shape[1]
+    legacy_peak, current_peak = peak_bytes(legacy_mask), peak_bytes(palette_mask)
+    print(
+        f"   mask peak: legacy {legacy_peak / pixels:.1f} B/px, "
+        f"numpy {current_peak / pixels:.1f} B/px"
+    )
+
+
+if __name__ == "__main__":
+    main()
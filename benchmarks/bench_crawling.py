@@ -0,0 +1,77 @@
+"""
+Compares get_crawl_locations against the original OrderedDict implementation.
+
+Usage:
+    python -m benchmarks.bench_crawling [--sizes 1000 100000 1000000]
+"""
+import argparse
+import time
+from collections import OrderedDict
+
+from src.crawling import DEFAULT_DELTA, DEFAULT_PRECISION, get_crawl_locations
+
+DEFAULT_SIZES = [10**3, 10**5, 10**6]
+START_LOCATION = (28.76584641574725, -81.26798109985344)
+
+
+def legacy_get_crawl_locations(
+    locations,
+    max_requests,
+    max_crawl_depth,
+    jump_distance=DEFAULT_DELTA,
+    precision=DEFAULT_PRECISION,
+):
+    """
+    The original tuple-based crawl, kept as a baseline.
+    """
+    visited = OrderedDict()
+    stack = [(round(lat, precision), round(lon, precision)) for lat, lon in locations]
+
+    depth = 0
+    requests_made = 0
+
+    while stack and requests_made < max_requests and depth < max_crawl_depth:
+        new_stack = []
+
+        for location in stack:
+            if location not in visited:
+                visited[location] = True
+                requests_made += 1
+
+                lat, lon = location
+
+                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
+                    new_lat = round(lat + dx * jump_distance, precision)
+                    new_lon = round(lon + dy * jump_distance, precision)
+                    new_stack.append((new_lat, new_lon))
+
+        stack = new_stack
+        depth += 1
+
+    return list(visited.keys())[:max_requests]
+
+
+def time_crawl(crawl, cells):
+    start = time.perf_counter()
+    result = crawl([START_LOCATION], max_requests=cells, max_crawl_depth=cells)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    args = parser.parse_args()
+
+    print(f"{'cells':>10} {'legacy (s)':>12} {'grid (s)':>12} {'speedup':>9}")
+    for cells in args.sizes:
+        legacy_seconds, legacy_result = time_crawl(legacy_get_crawl_locations, cells)
+        grid_seconds, grid_result = time_crawl(get_crawl_locations, cells)
+        assert legacy_result == grid_result, "crawl orders differ"
+        print(
+            f"{cells:>10} {legacy_seconds:>12.4f} {grid_seconds:>12.4f} "
+            f"{legacy_seconds / grid_seconds:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Compares find_roof_boxes segmentation methods for speed and agreement with Canny.
+
+Usage:
+    python -m benchmarks.bench_segmentation [--images data/street_map.png ...]
+"""
+import argparse
+import time
+
+from src.bounding_boxes import box_iou, find_roof_boxes
+from src.utils import load_image
+
+DEFAULT_IMAGES = ["data/street_map.png", "data/street_map_close.png"]
+CONFIGURATIONS = [
+    ("canny", 1),
+    ("canny", 2),
+    ("components", 1),
+    ("components", 2),
+    ("components", 4),
+]
+MATCH_IOU = 0.5
+
+
+def timed_boxes(image, method, downsample, repeat=3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, boxes = find_roof_boxes(image, method=method, downsample=downsample)
+        times.append(time.perf_counter() - start)
+    return min(times), boxes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    args = parser.parse_args()
+
+    for path in args.images:
+        image = load_image(path)
+        baseline_seconds, baseline = timed_boxes(image, "canny", 1)
+        print(f"{path}: {len(baseline)} canny boxes in {baseline_seconds:.3f}s")
+
+        for method, downsample in CONFIGURATIONS:
+            seconds, boxes = timed_boxes(image, method, downsample)
+            ious = box_iou(baseline, boxes).max(axis=1) if len(boxes) else [0]
+            matched = sum(iou >= MATCH_IOU for iou in ious)
+            print(
+                f"  {method:>10} x{downsample}: {seconds:.3f}s "
+                f"({baseline_seconds / seconds:.1f}x), {len(boxes)} boxes, "
+                f"{matched}/{len(baseline)} matched, mean IoU {sum(ious) / len(ious):.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
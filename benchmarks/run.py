@@ -0,0 +1,142 @@
+"""
+Runs the benchmark suite, writing results to JSON and comparing them to a baseline.
+
+Usage:
+    python -m benchmarks.run [--filter find_roof_boxes] [--output results.json]
+    python -m benchmarks.run --compare .benchmarks/<baseline commit>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from benchmarks.suite import BENCHMARKS, Benchmark
+
+RESULTS_DIR = ".benchmarks"
+DEFAULT_THRESHOLD = 0.1  # slowdown of the fastest round reported as a regression
+WARMUP_ROUNDS = 1
+
+
+def _git(*args) -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", *args], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_info() -> dict:
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmark(benchmark: Benchmark, rounds: Optional[int] = None) -> dict:
+    times = []
+    with benchmark.setup() as function:
+        for _ in range(WARMUP_ROUNDS):
+            function()
+        for _ in range(rounds or benchmark.rounds):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+
+    return {
+        "rounds": len(times),
+        "items": benchmark.items,
+        "min_per_item": min(times) / benchmark.items,
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.mean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+    }
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float):
+    """
+    Prints the fastest round of each benchmark relative to the baseline, which is less
+    sensitive to noise than the median, and returns the names of benchmarks slower by
+    more than threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<40} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, stats in results.items():
+        if name not in baseline:
+            print(f"{name:<40} {'-':>10} {stats['min']:>10.4f} {'new':>8}")
+            continue
+        before = baseline[name]["min"]
+        change = stats["min"] / before - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<40} {before:>10.4f} {stats['min']:>10.4f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--filter", help="only run benchmarks containing this text")
+    parser.add_argument("--rounds", type=int, help="override every benchmark's rounds")
+    parser.add_argument(
+        "--output", help=f"results file, {RESULTS_DIR}/<commit>.json by default"
+    )
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    selected = [
+        benchmark
+        for name, benchmark in BENCHMARKS.items()
+        if not args.filter or args.filter in name
+    ]
+    if args.list:
+        print("\n".join(benchmark.name for benchmark in selected))
+        return
+
+    results = {}
+    print(
+        f"{'benchmark':<40} {'median (s)':>12} {'min (s)':>12} {'stdev':>10} "
+        f"{'per item (ms)':>14}"
+    )
+    for benchmark in selected:
+        stats = run_benchmark(benchmark, args.rounds)
+        results[benchmark.name] = stats
+        print(
+            f"{benchmark.name:<40} {stats['median']:>12.4f} {stats['min']:>12.4f} "
+            f"{stats['stdev']:>10.4f} {stats['min_per_item'] * 1000:>14.4f}"
+        )
+
+    info = machine_info()
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{(info['commit'] or 'unknown')[:12]}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({"machine_info": info, "benchmarks": results}, f, indent=2)
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["benchmarks"]
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
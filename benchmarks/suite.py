@@ -0,0 +1,217 @@
+"""
+Benchmarks of the scrape-and-segment hot paths, run by benchmarks.run.
+
+Each benchmark is a context manager yielding the function to time, so setup such as
+loading images or starting a server is excluded from the timings.
+"""
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from contextlib import contextmanager
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, ContextManager, Dict
+
+from skimage import io
+from skimage.color import rgb2gray
+
+from src.bounding_boxes import _get_roof_color, _replace_roof_colors, find_roof_boxes
+from src.box_cache import RoofBoxCache
+from src.classification import classify_crops
+from src.crawling import get_crawl_locations, scrape_image_from_locations_async
+from src.features import extract_features
+from src.postprocessing import crop_images, save_images
+from src.scraping import FileSystem, GoogleMapsScraper
+from src.utils import load_image
+
+START_LOCATION = (28.76584641574725, -81.26798109985344)
+CRAWL_SIZES = [10**3, 10**4, 10**5]
+STREET_MAPS = ["data/street_map.png", "data/street_map_close.png"]
+SERVER_LATENCY = 0.02  # seconds the fake Static Maps server waits per request
+SCRAPE_LOCATIONS = 16
+SCRAPE_CONCURRENCY = 8
+FEATURE_CROPS = 512
+
+
+@dataclass(frozen=True)
+class Benchmark:
+    name: str
+    setup: Callable[[], ContextManager[Callable[[], object]]]
+    rounds: int = 5
+    items: int = 1  # items processed per call, for per-item costs
+
+
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, rounds=5, items=1):
+    def register(setup):
+        BENCHMARKS[name] = Benchmark(name, contextmanager(setup), rounds, items)
+        return setup
+
+    return register
+
+
+def _register_crawl(cells: int):
+    @benchmark(f"crawl/{cells}", rounds=3 if cells >= 10**5 else 5)
+    def crawl():
+        yield lambda: get_crawl_locations([START_LOCATION], cells, cells)
+
+
+for _cells in CRAWL_SIZES:
+    _register_crawl(_cells)
+
+
+def _register_street_map(path: str):
+    name = path.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+
+    @benchmark(f"roof_color/{name}")
+    def roof_color():
+        gray_image = rgb2gray(load_image(path))
+        yield lambda: _get_roof_color(gray_image)
+
+    @benchmark(f"replace_roof_colors/{name}")
+    def replace_roof_colors():
+        gray_image = rgb2gray(load_image(path))
+        house_color = _get_roof_color(gray_image)
+        out = gray_image.astype(bool)
+        yield lambda: _replace_roof_colors(gray_image, house_color, out=out)
+
+    @benchmark(f"find_roof_boxes/{name}", rounds=3)
+    def roof_boxes():
+        image = load_image(path)
+        yield lambda: find_roof_boxes(image)
+
+
+for _path in STREET_MAPS:
+    _register_street_map(_path)
+
+
+@benchmark("crop_and_save/satellite_map_close", rounds=3)
+def crop_and_save():
+    _, bboxes = find_roof_boxes(load_image("data/street_map_close.png"))
+    satellite_image = load_image("data/satellite_map_close.png")
+    directory = tempfile.mkdtemp()
+    try:
+        yield lambda: save_images(
+            io, crop_images(satellite_image, bboxes, 30), directory, "satellite"
+        )
+    finally:
+        shutil.rmtree(directory)
+
+
+@benchmark("box_cache_hit/street_map_close", rounds=100)
+def box_cache_hit():
+    directory = tempfile.mkdtemp()
+    cache = RoofBoxCache(f"{directory}/boxes.sqlite")
+    cache.find_path("data/street_map_close.png")
+    try:
+        yield lambda: cache.find_path("data/street_map_close.png")
+    finally:
+        cache.close()
+        shutil.rmtree(directory)
+
+
+@benchmark("classify_batches/satellite_map_close")
+def classify_batches():
+    _, bboxes = find_roof_boxes(load_image("data/street_map_close.png"))
+    crops = crop_images(load_image("data/satellite_map_close.png"), bboxes, 30)
+    keyed = [(("tile", box), crop) for box, crop in enumerate(crops)]
+
+    class MeanClassifier:
+        def predict(self, batch):
+            return batch.reshape(len(batch), -1, 3).mean(axis=1)
+
+    yield lambda: list(classify_crops(keyed, MeanClassifier()))
+
+
+@benchmark(f"features/{FEATURE_CROPS}_crops", items=FEATURE_CROPS)
+def features():
+    _, bboxes = find_roof_boxes(load_image("data/street_map_close.png"))
+    crops = crop_images(load_image("data/satellite_map_close.png"), bboxes, 30)
+    keyed = [(("tile", box), crops[box % len(crops)]) for box in range(FEATURE_CROPS)]
+    yield lambda: extract_features(keyed)
+
+
+class _FakeStaticMapsHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    payload = b""
+    latency = SERVER_LATENCY
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(self.payload)))
+        self.end_headers()
+        self.wfile.write(self.payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@dataclass
+class _Response:
+    status_code: int
+    content: bytes
+
+
+class LocalRequests:
+    """
+    A minimal stand-in for the requests module that sends every GET to a local server.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+
+    def get(self, url, params, timeout=None):
+        path = urllib.parse.urlsplit(url).path
+        query = urllib.parse.urlencode(params)
+        try:
+            with urllib.request.urlopen(
+                f"{self.base_url}{path}?{query}", timeout=timeout
+            ) as response:
+                return _Response(response.status, response.read())
+        except urllib.error.HTTPError as error:
+            return _Response(error.code, b"")
+
+
+@contextmanager
+def fake_static_maps_server(payload: bytes, latency=SERVER_LATENCY):
+    handler = type(
+        "Handler", (_FakeStaticMapsHandler,), {"payload": payload, "latency": latency}
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@benchmark(f"scrape/{SCRAPE_LOCATIONS}_locations", rounds=3)
+def scrape():
+    with open("data/street_map_close.png", "rb") as f:
+        payload = f.read()
+    directory = tempfile.mkdtemp()
+    locations = get_crawl_locations([START_LOCATION], SCRAPE_LOCATIONS, 100)
+
+    try:
+        with fake_static_maps_server(payload) as base_url:
+            scraper = GoogleMapsScraper(
+                "API_KEY", directory, LocalRequests(base_url), FileSystem()
+            )
+            yield lambda: asyncio.run(
+                scrape_image_from_locations_async(
+                    locations, scraper, max_concurrency=SCRAPE_CONCURRENCY
+                )
+            )
+    finally:
+        shutil.rmtree(directory)
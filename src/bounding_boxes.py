@@ -1,39 +1,92 @@
-from collections import Counter
+from dataclasses import dataclass
 
-from matplotlib import pyplot as plt
-from skimage import feature, filters, measure
-from skimage.color import rgb2gray
+import numpy as np
 
+from src.profiling import timed, timer
 
-def _filter_small_regions(regions, min_area=500):
+MASK_CHUNK_ROWS = 64  # rows per chunk when a mask needs temporaries
+DEFAULT_GAUSSIAN_SIGMA = 10
+DEFAULT_CANNY_SIGMA = 1
+SEGMENTATION_METHODS = ("canny", "components")
+DEFAULT_SEGMENTATION = "canny"
+DEFAULT_MIN_AREA = 500
+DEFAULT_BORDER_BUFFER = 5
+DEFAULT_LOGO_MARGIN = 100  # rows at the bottom of the image holding the logo
+DEFAULT_EPSILON = 0.0001  # gray level distance within which colors match the roof
+
+
+def _box_areas(bboxes):
+    return (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+
+
+def _large_regions(bboxes, min_area=DEFAULT_MIN_AREA):
+    """
+    Flags regions that are big enough to be houses. Minimum area defaults to avoid
+    noise from capturing sheds, small roofs and road objects.
+    """
+    return _box_areas(bboxes) >= min_area
+
+
+def _inner_regions(bboxes, image_shape, buffer=DEFAULT_BORDER_BUFFER):
+    """
+    Flags regions away from the edge of the image. Regions within buffer pixels of the
+    edge are likely cut off by it.
+    """
+    return (
+        (bboxes[:, 0] > buffer)
+        & (bboxes[:, 1] > buffer)
+        & (bboxes[:, 2] < image_shape[0] - buffer)
+        & (bboxes[:, 3] < image_shape[1] - buffer)
+    )
+
+
+def _regions_above_google_maps_logo(bboxes, image_shape, margin=DEFAULT_LOGO_MARGIN):
     """
-    Removes regions that are too small or have unrealistic dimensions. Minimum area
-    defaults to avoid noise from capturing sheds, small roofs and road objects.
+    Flags regions ending above the bottom margin of the image because copyright logo
+    is often placed there.
     """
-    return [region for region in regions if region.area_bbox >= min_area]
+    return bboxes[:, 2] < image_shape[0] - margin
 
 
-def _filter_border_regions(regions, image, buffer=5):
+def _filter_regions(
+    bboxes,
+    image_shape,
+    min_area=DEFAULT_MIN_AREA,
+    buffer=DEFAULT_BORDER_BUFFER,
+    logo_margin=DEFAULT_LOGO_MARGIN,
+):
     """
-    Removes regions that are too close to the edge of the image. Removes regions cut
-    off by the edge of the image.
+    Keeps the (N, 4) bounding boxes passing every region filter, evaluated as a single
+    NumPy predicate.
     """
-    return [
-        region
-        for region in regions
-        if region.bbox[0] > buffer
-        and region.bbox[1] > buffer
-        and region.bbox[2] < image.shape[0] - buffer
-        and region.bbox[3] < image.shape[1] - buffer
+    return bboxes[
+        _large_regions(bboxes, min_area)
+        & _inner_regions(bboxes, image_shape, buffer)
+        & _regions_above_google_maps_logo(bboxes, image_shape, logo_margin)
     ]
 
 
-def _filter_google_maps_logo(regions, image):
+def _rank_by_count(counts, get_first_indices, n):
+    """
+    Gets the indices of the n largest counts in descending order. Ties are broken by
+    first occurrence, which is only computed when the top counts actually tie.
+    """
+    order = np.argsort(-counts, kind="stable")
+    top_counts = counts[order[: n + 1]]
+    if np.any(top_counts[:-1] == top_counts[1:]):
+        order = np.lexsort((get_first_indices(), -counts))
+    return order[:n]
+
+
+def _most_common_colors(values, n=3):
     """
-    Removes regions that overlap with the bottom of the image because copyright logo is
-    often placed there.
+    Gets the n most common values and their counts, like Counter.most_common but
+    counted with a single np.unique sort. Ties are broken by first occurrence.
     """
-    return [region for region in regions if region.bbox[2] < image.shape[1] - 100]
+    values = np.ravel(values)
+    colors, counts = np.unique(values, return_counts=True)
+    order = _rank_by_count(counts, lambda: np.unique(values, return_index=True)[1], n)
+    return list(zip(colors[order].tolist(), counts[order].tolist()))
 
 
 def _get_roof_color(gray_image):
@@ -41,57 +94,297 @@ def _get_roof_color(gray_image):
     Gets the color identifying roofs in the gray image. Most common color is the white
     of the background, followed by the gray of the houses.
     """
-    top_colors = Counter(gray_image.flat).most_common(3)
+    top_colors = _most_common_colors(gray_image)
     if not top_colors:
         raise BaseException("No colors found in image")
     return top_colors[1][0]
 
 
-def _replace_roof_colors(image, house_color, epsilon=0.0001):
+def _pack_rgb(image, out=None):
+    """
+    Packs the channels of a uint8 RGB image into one uint32 code per pixel, optionally
+    into a preallocated buffer.
+    """
+    codes = np.empty(image.shape[:2], dtype=np.uint32) if out is None else out
+    np.copyto(codes, image[..., 0])
+    codes <<= 8
+    codes |= image[..., 1]
+    codes <<= 8
+    codes |= image[..., 2]
+    return codes
+
+
+def _unpack_rgb(codes):
+    return np.stack([(codes >> 16) & 0xFF, (codes >> 8) & 0xFF, codes & 0xFF], axis=-1)
+
+
+def _get_roof_codes(codes, epsilon=DEFAULT_EPSILON):
+    """
+    Gets the RGB codes of roof pixels from a packed street map.
+
+    Street maps use a small palette, so grays are computed per palette color instead of
+    per pixel. Palette counts are merged by gray value to pick the same roof color as
+    _get_roof_color on the full gray image.
+    """
+    from skimage.color import rgb2gray
+
+    palette, counts = np.unique(codes, return_counts=True)
+    if not palette.size:
+        raise BaseException("No colors found in image")
+
+    palette_gray = rgb2gray(_unpack_rgb(palette)[:, None, :].astype(np.uint8))[:, 0]
+    grays, groups = np.unique(palette_gray, return_inverse=True)
+    if len(grays) < 2:
+        raise BaseException("No roof color found in image")
+
+    def get_first_indices():
+        gray_first_indices = np.full(len(grays), codes.size)
+        first_indices = np.unique(codes, return_index=True)[1]
+        np.minimum.at(gray_first_indices, groups, first_indices)
+        return gray_first_indices
+
+    order = _rank_by_count(np.bincount(groups, weights=counts), get_first_indices, 2)
+    roof_color = grays[order[1]]
+
+    return palette[abs(palette_gray - roof_color) <= epsilon]
+
+
+def _roof_code_mask(codes, roof_codes, out=None):
+    """
+    Builds the background mask of a packed street map: True for background, False for
+    roofs. Extra roof codes are merged in row chunks to keep temporaries small.
+    """
+    mask = np.empty(codes.shape, dtype=bool) if out is None else out
+    np.not_equal(codes, roof_codes[0], out=mask)
+    for start in range(0, len(codes), MASK_CHUNK_ROWS):
+        rows = slice(start, start + MASK_CHUNK_ROWS)
+        for roof_code in roof_codes[1:]:
+            mask[rows] &= codes[rows] != roof_code
+    return mask
+
+
+def _replace_roof_colors(image, house_color, epsilon=DEFAULT_EPSILON, out=None):
     """
     Replaces background colors with black and house colors with white. Colors within
     epsilon of the house color are considered the same color.
+
+    Writes into image by default without allocating temporaries. A separate bool or
+    uint8 out buffer leaves image untouched and is filled in row chunks.
+    """
+    if out is None or out is image:
+        # BLACK = 1 where farther than epsilon from the house color, WHITE = 0 otherwise
+        np.subtract(image, house_color, out=image)
+        np.abs(image, out=image)
+        np.greater(image, epsilon, out=image)
+        return image
+
+    for start in range(0, len(image), MASK_CHUNK_ROWS):
+        rows = slice(start, start + MASK_CHUNK_ROWS)
+        np.greater(abs(image[rows] - house_color), epsilon, out=out[rows])
+    return out
+
+
+@dataclass
+class RoofMaskBuffers:
+    """
+    Preallocated buffers for building roof masks, reusable across tiles of one shape.
     """
-    BLACK, WHITE = 1, 0
-    image[abs(image - house_color) > epsilon] = BLACK
-    image[abs(image - house_color) <= epsilon] = WHITE
-    return image
+
+    codes: np.ndarray
+    mask: np.ndarray
+
+    @classmethod
+    def for_shape(cls, shape):
+        return cls(
+            codes=np.empty(shape[:2], dtype=np.uint32),
+            mask=np.empty(shape[:2], dtype=bool),
+        )
 
 
-def find_roof_boxes(image):
+def _roof_mask(image, epsilon=DEFAULT_EPSILON, buffers=None):
     """
-    Finds the bounding boxes around the houses in the image.
+    Builds the background mask of a street map, True for background and False for
+    roofs. uint8 RGB street maps go through the packed palette; other images through
+    their gray conversion.
     """
+    if image.ndim == 3 and image.shape[-1] == 3 and image.dtype == np.uint8:
+        codes = _pack_rgb(image, out=buffers.codes if buffers else None)
+        return _roof_code_mask(
+            codes,
+            _get_roof_codes(codes, epsilon),
+            out=buffers.mask if buffers else None,
+        )
+
+    from skimage.color import rgb2gray
+
     gray_image = rgb2gray(image)
-    gray_image = _replace_roof_colors(
+    return _replace_roof_colors(
         gray_image,
         _get_roof_color(gray_image),
+        epsilon,
     )
 
-    # smooth edges
-    edges = filters.gaussian(gray_image, sigma=10)
 
-    # Apply Canny edge detection
-    edges = feature.canny(edges, sigma=1)
+def _downsample_mask(mask, factor):
+    """
+    Averages factor x factor blocks of the mask, dropping rows and columns that don't
+    fill a whole block.
+    """
+    if factor == 1:
+        return mask
+    rows, cols = mask.shape[0] // factor, mask.shape[1] // factor
+    blocks = mask[: rows * factor, : cols * factor].reshape(rows, factor, cols, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
 
-    # Join overlapping edges
-    regions = measure.regionprops(measure.label(edges))
 
-    # Filter out invalid regions
-    filtered_regions = _filter_small_regions(regions)
-    filtered_regions = _filter_border_regions(filtered_regions, image)
-    filtered_regions = _filter_google_maps_logo(filtered_regions, image)
+def _label_boxes(labels, image_shape, factor=1):
+    """
+    Gets the bounding box of every label as an (N, 4) int32 array of (min_row, min_col,
+    max_row, max_col), read with ndimage.find_objects instead of full RegionProperties
+    objects and rescaled when found on a downsampled mask.
+    """
+    from scipy import ndimage
+
+    slices = [region for region in ndimage.find_objects(labels) if region]
+    bboxes = np.array(
+        [[rows.start, cols.start, rows.stop, cols.stop] for rows, cols in slices],
+        dtype=np.int32,
+    ).reshape(-1, 4)
+    bboxes *= factor
+    np.minimum(bboxes[:, 2], image_shape[0], out=bboxes[:, 2])
+    np.minimum(bboxes[:, 3], image_shape[1], out=bboxes[:, 3])
+    return bboxes
+
+
+def _blur_mask(mask, method, gaussian_sigma):
+    """
+    Smooths the background mask before segmentation. For "components" the roof mask is
+    blurred instead, so roof pixels closer than about gaussian_sigma are joined, like
+    the edges joined by Canny.
+    """
+    with timer("find_roof_boxes.gaussian"):
+        if method == "canny":
+            from skimage import filters
+
+            return filters.gaussian(mask, sigma=gaussian_sigma)
+
+        from scipy import ndimage
+
+        return ndimage.gaussian_filter(
+            1 - np.asarray(mask, dtype=np.float32), gaussian_sigma, mode="nearest"
+        )
+
+
+def _label_blurred(blurred, method, canny_sigma):
+    """
+    Labels the roofs of a mask smoothed by _blur_mask, as regions of joined Canny edges
+    or as connected components.
+    """
+    if method == "canny":
+        from skimage import feature, measure
+
+        with timer("find_roof_boxes.canny"):
+            edges = feature.canny(blurred, sigma=canny_sigma)
+        # Join overlapping edges
+        with timer("find_roof_boxes.label"):
+            return measure.label(edges)
+
+    from scipy import ndimage
+
+    with timer("find_roof_boxes.label"):
+        labels, _ = ndimage.label(blurred > 0.5, structure=np.ones((3, 3)))
+    return labels
+
 
-    # Get bounding boxes
-    bboxes = [region.bbox for region in filtered_regions]
+def _mask_regions(
+    mask,
+    method=DEFAULT_SEGMENTATION,
+    downsample=1,
+    gaussian_sigma=DEFAULT_GAUSSIAN_SIGMA,
+    canny_sigma=DEFAULT_CANNY_SIGMA,
+):
+    """
+    Segments a background mask into the unfiltered bounding boxes of its roofs.
+    """
+    if method not in SEGMENTATION_METHODS:
+        raise ValueError(f"Unknown segmentation method: {method}")
+
+    blurred = _blur_mask(
+        _downsample_mask(mask, downsample), method, gaussian_sigma / downsample
+    )
+    labels = _label_blurred(blurred, method, canny_sigma / downsample)
+    return _label_boxes(labels, mask.shape, downsample)
+
+
+@timed("find_roof_boxes")
+def find_roof_boxes(
+    image,
+    buffers=None,
+    method=DEFAULT_SEGMENTATION,
+    downsample=1,
+    gaussian_sigma=DEFAULT_GAUSSIAN_SIGMA,
+    canny_sigma=DEFAULT_CANNY_SIGMA,
+    min_area=DEFAULT_MIN_AREA,
+    buffer=DEFAULT_BORDER_BUFFER,
+    logo_margin=DEFAULT_LOGO_MARGIN,
+    epsilon=DEFAULT_EPSILON,
+):
+    """
+    Finds the bounding boxes around the houses in the image, returned as an (N, 4)
+    int32 array of (min_row, min_col, max_row, max_col). Optional RoofMaskBuffers
+    avoid reallocating the roof mask for every tile.
+
+    method selects the segmentation: "canny" traces edges of the blurred roof mask,
+    "components" labels the blurred roof mask directly and is several times faster.
+    Either can run on a mask downsampled by an integer factor, with sigmas and boxes
+    rescaled to the full image.
+    """
+    if method not in SEGMENTATION_METHODS:
+        raise ValueError(f"Unknown segmentation method: {method}")
+
+    with timer("find_roof_boxes.mask"):
+        mask = _roof_mask(image, epsilon, buffers=buffers)
+
+    bboxes = _mask_regions(mask, method, downsample, gaussian_sigma, canny_sigma)
+
+    # Filter out invalid regions
+    with timer("find_roof_boxes.filter"):
+        bboxes = _filter_regions(bboxes, image.shape, min_area, buffer, logo_margin)
 
     return image, bboxes
 
 
+def box_iou(boxes, other_boxes):
+    """
+    Gets the intersection over union of every pair of (min_row, min_col, max_row,
+    max_col) boxes as an (N, M) matrix.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)[:, None, :]
+    other_boxes = np.asarray(other_boxes, dtype=np.float64).reshape(-1, 4)[None, :, :]
+
+    heights = np.minimum(boxes[..., 2], other_boxes[..., 2]) - np.maximum(
+        boxes[..., 0], other_boxes[..., 0]
+    )
+    widths = np.minimum(boxes[..., 3], other_boxes[..., 3]) - np.maximum(
+        boxes[..., 1], other_boxes[..., 1]
+    )
+    intersection = np.clip(heights, 0, None) * np.clip(widths, 0, None)
+
+    def area(b):
+        return (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+
+    union = area(boxes) + area(other_boxes) - intersection
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
 def display_bounding_boxes(image, boxes):
     """
     Displays the bounding boxes around the houses in the image.
     """
+    from matplotlib import pyplot as plt
+
     fig, ax = plt.subplots(figsize=(5, 5))
     ax.set_axis_off()
     ax.imshow(image)
@@ -0,0 +1,254 @@
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from src.bounding_boxes import find_roof_boxes
+from src.utils import load_image
+
+DEFAULT_MAX_BYTES = 64 * 1024**2  # evict least recently used results past this size
+DEFAULT_BUSY_TIMEOUT = 60  # seconds to wait for another process's write lock
+# bump when find_roof_boxes changes its results, so cached boxes are invalidated
+ALGORITHM_VERSION = 2
+UNCACHED_PARAMETERS = ("image", "buffers")  # don't change the boxes found
+
+
+@dataclass
+class BoxCacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    seconds_saved: float = 0.0  # segmentation time the hits would have taken
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.hits} hits, {self.misses} misses ({self.hit_rate:.1%} hit rate), "
+            f"{self.evictions} evictions, {self.seconds_saved:.1f}s saved"
+        )
+
+
+def image_digest(image: np.ndarray) -> str:
+    """
+    Hashes a decoded image's pixels, shape and dtype.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"{image.shape}{image.dtype.str}".encode())
+    digest.update(memoryview(np.ascontiguousarray(image)).cast("B"))
+    return digest.hexdigest()
+
+
+def params_key(**params) -> str:
+    """
+    Normalizes find_roof_boxes parameters into a key, filling in the defaults so that
+    passing a default explicitly doesn't change the key. Unknown parameters raise a
+    TypeError, as they would when calling find_roof_boxes.
+    """
+    bound = inspect.signature(find_roof_boxes).bind(None, **params)
+    bound.apply_defaults()
+    normalized = {
+        name: value
+        for name, value in bound.arguments.items()
+        if name not in UNCACHED_PARAMETERS
+    }
+    normalized["version"] = ALGORITHM_VERSION
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+def encode_boxes(bboxes: np.ndarray):
+    """
+    Packs boxes into little-endian bytes for storage, returning the bytes and their
+    dtype for decode_boxes.
+    """
+    # tiles are smaller than 65536 pixels, so boxes usually fit in half the bytes
+    dtype = (
+        "<u2"
+        if not len(bboxes) or 0 <= bboxes.min() <= bboxes.max() < 2**16
+        else "<i4"
+    )
+    return np.ascontiguousarray(bboxes, dtype=dtype).tobytes(), dtype
+
+
+def decode_boxes(payload: bytes, dtype: str) -> np.ndarray:
+    return np.frombuffer(payload, dtype=dtype).astype(np.int32).reshape(-1, 4)
+
+
+class RoofBoxCache:
+    """
+    A persistent, size-bounded cache of find_roof_boxes results in one SQLite file.
+
+    Results are keyed by the hash of the street map's pixels plus every parameter of
+    find_roof_boxes, so changing any parameter misses the cache instead of returning
+    stale boxes. Boxes are stored as packed little-endian integers, and once they
+    outgrow max_bytes the least recently used results are evicted. Several processes
+    can share one cache file.
+
+    find_path also remembers the hash of every file by its size and modification time,
+    so a repeated lookup costs a stat and two queries rather than decoding and hashing
+    the image.
+    """
+
+    def __init__(self, path: str, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.stats = BoxCacheStats()
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            path, timeout=DEFAULT_BUSY_TIMEOUT, check_same_thread=False
+        )
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS results (
+                image TEXT NOT NULL,
+                params TEXT NOT NULL,
+                boxes BLOB NOT NULL,
+                dtype TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                last_used INTEGER NOT NULL,
+                PRIMARY KEY (image, params)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS results_by_last_used ON results (last_used);
+            CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO usage VALUES (0, 0);
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                image TEXT NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()
+        return count
+
+    @property
+    def total_bytes(self) -> int:
+        with self.lock:
+            return self._total_bytes()
+
+    def _total_bytes(self) -> int:
+        return self.connection.execute("SELECT bytes FROM usage").fetchone()[0]
+
+    def _add_bytes(self, num_bytes: int):
+        self.connection.execute("UPDATE usage SET bytes = bytes + ?", (num_bytes,))
+
+    def _lookup(self, image_hash: str, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT boxes, dtype, seconds FROM results WHERE image = ? AND params = ?",
+                (image_hash, key),
+            ).fetchone()
+            if row is None:
+                self.stats.misses += 1
+                return None
+            # recency is a shared counter rather than a timestamp, so it never ties
+            self.connection.execute(
+                "UPDATE results SET last_used = "
+                "(SELECT MAX(last_used) + 1 FROM results) WHERE image = ? AND params = ?",
+                (image_hash, key),
+            )
+            self.connection.commit()
+            self.stats.hits += 1
+            self.stats.seconds_saved += row[2]
+        return decode_boxes(row[0], row[1])
+
+    def _store(self, image_hash: str, key: str, bboxes: np.ndarray, seconds: float):
+        payload, dtype = encode_boxes(bboxes)
+        with self.lock:
+            # take the write lock first, another process may store the same result
+            self.connection.execute("BEGIN IMMEDIATE")
+            previous = self.connection.execute(
+                "SELECT LENGTH(boxes) FROM results WHERE image = ? AND params = ?",
+                (image_hash, key),
+            ).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, "
+                "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM results))",
+                (image_hash, key, payload, dtype, seconds),
+            )
+            self._add_bytes(len(payload) - (previous[0] if previous else 0))
+            self._evict(keep=(image_hash, key))
+            self.connection.commit()
+
+    def _evict(self, keep: tuple):
+        while self._total_bytes() > self.max_bytes:
+            row = self.connection.execute(
+                "SELECT image, params, LENGTH(boxes) FROM results "
+                "WHERE NOT (image = ? AND params = ?) ORDER BY last_used LIMIT 1",
+                keep,
+            ).fetchone()
+            if row is None:
+                return
+            self.connection.execute(
+                "DELETE FROM results WHERE image = ? AND params = ?", row[:2]
+            )
+            self._add_bytes(-row[2])
+            self.stats.evictions += 1
+
+    def find(self, image: np.ndarray, **params) -> np.ndarray:
+        """
+        Returns find_roof_boxes(image, **params)[1], computing it on a miss.
+        """
+        key = params_key(**params)
+        return self._find(image_digest(image), key, lambda: image, params)
+
+    def find_path(self, path: str, **params) -> np.ndarray:
+        """
+        Like find, for the street map saved at path, which is only loaded on a miss.
+        """
+        key = params_key(**params)
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT image FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is not None:
+            return self._find(row[0], key, lambda: load_image(path), params)
+
+        image = load_image(path)
+        image_hash = image_digest(image)
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, image_hash),
+            )
+            self.connection.commit()
+        return self._find(image_hash, key, lambda: image, params)
+
+    def _find(self, image_hash: str, key: str, load, params: dict) -> np.ndarray:
+        bboxes = self._lookup(image_hash, key)
+        if bboxes is not None:
+            return bboxes
+
+        start = time.perf_counter()
+        _, bboxes = find_roof_boxes(load(), **params)
+        self._store(image_hash, key, bboxes, time.perf_counter() - start)
+        return bboxes
@@ -0,0 +1,421 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from src.bounding_boxes import find_roof_boxes
+from src.box_cache import decode_boxes, encode_boxes
+from src.classification import classify_crops
+from src.extraction import DEFAULT_CROP_BUFFER, TilePair
+from src.features import GRAY_WEIGHTS
+from src.postprocessing import crop_images
+from src.utils import load_image
+
+DEFAULT_GRID = 64  # rows and columns of cells in a tile's thumbnail
+DEFAULT_CELL_THRESHOLD = 4  # mean gray level change of a cell counted as a change
+DEFAULT_COMMIT_BATCH = 100  # tile records written per transaction
+HASH_CHUNK_BYTES = 1024**2
+UNCHANGED, NEW, RESEGMENTED, RECLASSIFIED = (
+    "unchanged",
+    "new",
+    "resegmented",
+    "reclassified",
+)
+
+
+@dataclass
+class TileRecord:
+    """
+    What an epoch knows about a tile: content hashes and thumbnails of both images to
+    compare later epochs against, the roofs found on it and, if a classifier was given,
+    their labels and confidences.
+    """
+
+    tile: str
+    street_hash: str
+    satellite_hash: str
+    street_thumbnail: np.ndarray
+    satellite_thumbnail: np.ndarray
+    bboxes: np.ndarray
+    labels: Optional[np.ndarray] = None
+    confidences: Optional[np.ndarray] = None
+
+
+@dataclass
+class ChangeReport:
+    tiles: int = 0
+    new: int = 0
+    unchanged: int = 0  # tiles carried forward without segmentation or classification
+    resegmented: int = 0
+    reclassified: int = 0  # tiles whose boxes were kept but some crops reclassified
+    boxes_carried: int = 0  # boxes kept from the previous epoch without segmentation
+    boxes_classified: int = 0
+    failed: int = 0
+    seconds: float = 0.0
+
+    @property
+    def skipped_fraction(self) -> float:
+        """
+        Fraction of the tiles that didn't go back through segmentation.
+        """
+        return (self.unchanged + self.reclassified) / self.tiles if self.tiles else 0.0
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def thumbnail(image: np.ndarray, grid=DEFAULT_GRID) -> np.ndarray:
+    """
+    Averages the gray levels of an image over a grid x grid array of cells, dropping
+    rows and columns that don't fill a whole cell. Images smaller than the grid are
+    padded with their edge pixels, so each pixel is a cell of its own.
+    """
+    padding = [(0, max(grid - size, 0)) for size in image.shape[:2]]
+    if any(after for _, after in padding):
+        image = np.pad(image, padding + [(0, 0)] * (image.ndim - 2), mode="edge")
+    rows, cols = image.shape[0] // grid, image.shape[1] // grid
+    cropped = image[: rows * grid, : cols * grid]
+    if cropped.ndim == 3:
+        gray = np.matmul(cropped[..., :3], GRAY_WEIGHTS)
+    else:
+        gray = cropped.astype(np.float32)
+    cells = gray.reshape(grid, rows, grid, cols).mean(axis=(1, 3))
+    return np.round(cells).astype(np.uint8)
+
+
+def changed_cells(
+    before: np.ndarray, after: np.ndarray, threshold=DEFAULT_CELL_THRESHOLD
+) -> np.ndarray:
+    """
+    Flags the thumbnail cells whose mean gray level moved by more than threshold.
+    """
+    if before.shape != after.shape:
+        return np.ones(after.shape, dtype=bool)
+    return np.abs(before.astype(np.int16) - after.astype(np.int16)) > threshold
+
+
+def boxes_in_cells(bboxes, cells: np.ndarray, image_shape) -> np.ndarray:
+    """
+    Flags the (min_row, min_col, max_row, max_col) boxes overlapping any flagged cell,
+    summing each box's cells from an integral image of the flags.
+    """
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+    grid_rows, grid_cols = cells.shape
+    # images smaller than the grid have a cell per pixel, as padded by thumbnail
+    cell_rows = max(image_shape[0] // grid_rows, 1)
+    cell_cols = max(image_shape[1] // grid_cols, 1)
+    integral = np.zeros((grid_rows + 1, grid_cols + 1), dtype=np.int32)
+    integral[1:, 1:] = cells.cumsum(axis=0).cumsum(axis=1)
+
+    top = np.clip(bboxes[:, 0] // cell_rows, 0, grid_rows - 1)
+    left = np.clip(bboxes[:, 1] // cell_cols, 0, grid_cols - 1)
+    bottom = np.clip((bboxes[:, 2] - 1) // cell_rows, top, grid_rows - 1) + 1
+    right = np.clip((bboxes[:, 3] - 1) // cell_cols, left, grid_cols - 1) + 1
+    counts = (
+        integral[bottom, right]
+        - integral[top, right]
+        - integral[bottom, left]
+        + integral[top, left]
+    )
+    return counts > 0
+
+
+class EpochStore:
+    """
+    Tile records of every crawl epoch in one SQLite file, keyed by epoch and tile name.
+    Epochs are ordered by name, so names like "2024-05" sort chronologically.
+    """
+
+    def __init__(self, path=":memory:"):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                epoch TEXT NOT NULL,
+                tile TEXT NOT NULL,
+                street_hash TEXT NOT NULL,
+                satellite_hash TEXT NOT NULL,
+                street_thumbnail BLOB NOT NULL,
+                satellite_thumbnail BLOB NOT NULL,
+                grid INTEGER NOT NULL,
+                boxes BLOB NOT NULL,
+                boxes_dtype TEXT NOT NULL,
+                labels BLOB,
+                confidences BLOB,
+                PRIMARY KEY (epoch, tile)
+            ) WITHOUT ROWID;
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def epochs(self) -> List[str]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT DISTINCT epoch FROM tiles ORDER BY epoch"
+            ).fetchall()
+        return [epoch for (epoch,) in rows]
+
+    def previous_epoch(self, epoch: str) -> Optional[str]:
+        earlier = [other for other in self.epochs() if other < epoch]
+        return earlier[-1] if earlier else None
+
+    def put(self, epoch: str, record: TileRecord):
+        self.put_many(epoch, [record])
+
+    def put_many(self, epoch: str, records: Iterable[TileRecord]):
+        """
+        Writes the records of an epoch's tiles in one transaction.
+        """
+        rows = []
+        for record in records:
+            payload, dtype = encode_boxes(record.bboxes)
+            rows.append(
+                (
+                    epoch,
+                    record.tile,
+                    record.street_hash,
+                    record.satellite_hash,
+                    record.street_thumbnail.tobytes(),
+                    record.satellite_thumbnail.tobytes(),
+                    record.street_thumbnail.shape[0],
+                    payload,
+                    dtype,
+                    None
+                    if record.labels is None
+                    else record.labels.astype("<i4").tobytes(),
+                    None
+                    if record.confidences is None
+                    else record.confidences.astype("<f4").tobytes(),
+                )
+            )
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+
+    def get(self, epoch: str, tile: str) -> Optional[TileRecord]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT street_hash, satellite_hash, street_thumbnail, "
+                "satellite_thumbnail, grid, boxes, boxes_dtype, labels, confidences "
+                "FROM tiles WHERE epoch = ? AND tile = ?",
+                (epoch, tile),
+            ).fetchone()
+        if row is None:
+            return None
+
+        (
+            street_hash,
+            satellite_hash,
+            street_thumbnail,
+            satellite_thumbnail,
+            grid,
+            boxes,
+            boxes_dtype,
+            labels,
+            confidences,
+        ) = row
+        return TileRecord(
+            tile,
+            street_hash,
+            satellite_hash,
+            np.frombuffer(street_thumbnail, dtype=np.uint8).reshape(grid, grid),
+            np.frombuffer(satellite_thumbnail, dtype=np.uint8).reshape(grid, grid),
+            decode_boxes(boxes, boxes_dtype),
+            None if labels is None else np.frombuffer(labels, dtype="<i4"),
+            None if confidences is None else np.frombuffer(confidences, dtype="<f4"),
+        )
+
+
+def _classify(satellite_image, bboxes, classifier, buffer: int, tile: str):
+    crops = crop_images(satellite_image, bboxes, buffer)
+    predictions = list(
+        classify_crops(
+            (((tile, box), crop) for box, crop in enumerate(crops)), classifier
+        )
+    )
+    return (
+        np.array([p.label for p in predictions], dtype=np.int32),
+        np.array([p.confidence for p in predictions], dtype=np.float32),
+    )
+
+
+def update_tile(
+    pair: TilePair,
+    previous: Optional[TileRecord],
+    classifier=None,
+    grid=DEFAULT_GRID,
+    cell_threshold=DEFAULT_CELL_THRESHOLD,
+    buffer=DEFAULT_CROP_BUFFER,
+    **find_kwargs,
+):
+    """
+    Builds a tile's record for a new epoch from its previous record, doing as little
+    work as the changes allow. Returns the record, what was done to the tile and how
+    many crops were classified.
+
+    Images whose files hash the same as before are not even decoded. Otherwise their
+    thumbnails are compared cell by cell: if the street map changed anywhere, the tile
+    is segmented and classified again. If only the satellite image changed, the boxes
+    are kept and only the crops overlapping changed cells are classified again.
+    Everything else is carried forward from the previous record.
+    """
+    street_hash = file_hash(pair.street_path)
+    satellite_hash = file_hash(pair.satellite_path)
+    classify = classifier is not None
+
+    # thumbnails are reused on a hash match unless the grid changed between epochs
+    reuse = previous is not None and previous.street_thumbnail.shape == (grid, grid)
+    street_image = satellite_image = None
+    if reuse and street_hash == previous.street_hash:
+        street_thumbnail = previous.street_thumbnail
+    else:
+        street_image = load_image(pair.street_path)
+        street_thumbnail = thumbnail(street_image, grid)
+    if reuse and satellite_hash == previous.satellite_hash:
+        satellite_thumbnail = previous.satellite_thumbnail
+    else:
+        satellite_image = load_image(pair.satellite_path)
+        satellite_thumbnail = thumbnail(satellite_image, grid)
+
+    record = TileRecord(
+        pair.name,
+        street_hash,
+        satellite_hash,
+        street_thumbnail,
+        satellite_thumbnail,
+        np.empty((0, 4), dtype=np.int32),
+    )
+
+    street_changed = (
+        previous is None
+        or changed_cells(
+            previous.street_thumbnail, street_thumbnail, cell_threshold
+        ).any()
+    )
+    # carried forward labels are missing if the previous epoch wasn't classified
+    if previous is not None and classify and previous.labels is None:
+        street_changed = True
+
+    if street_changed:
+        if street_image is None:
+            street_image = load_image(pair.street_path)
+        _, record.bboxes = find_roof_boxes(street_image, **find_kwargs)
+        if classify:
+            if satellite_image is None:
+                satellite_image = load_image(pair.satellite_path)
+            record.labels, record.confidences = _classify(
+                satellite_image, record.bboxes, classifier, buffer, pair.name
+            )
+        outcome = NEW if previous is None else RESEGMENTED
+        return record, outcome, len(record.bboxes) if classify else 0
+
+    # keep the reference cells, so changes under the threshold can't add up unnoticed
+    record.street_thumbnail = previous.street_thumbnail
+    record.bboxes = previous.bboxes
+    if not classify:
+        return record, UNCHANGED, 0
+    record.labels = previous.labels.copy()
+    record.confidences = previous.confidences.copy()
+
+    cells = changed_cells(
+        previous.satellite_thumbnail, satellite_thumbnail, cell_threshold
+    )
+    record.satellite_thumbnail = np.where(
+        cells, satellite_thumbnail, previous.satellite_thumbnail
+    )
+    if not cells.any():
+        return record, UNCHANGED, 0
+
+    if satellite_image is None:
+        satellite_image = load_image(pair.satellite_path)
+    # crops include the buffer around their box, so changes there count too
+    cropped = record.bboxes + np.array([-buffer, -buffer, buffer, buffer])
+    stale = np.flatnonzero(boxes_in_cells(cropped, cells, satellite_image.shape[:2]))
+    if len(stale):
+        labels, confidences = _classify(
+            satellite_image, record.bboxes[stale], classifier, buffer, pair.name
+        )
+        record.labels[stale] = labels
+        record.confidences[stale] = confidences
+    return record, RECLASSIFIED if len(stale) else UNCHANGED, len(stale)
+
+
+def run_incremental(
+    pairs: Iterable[TilePair],
+    store: EpochStore,
+    epoch: str,
+    previous_epoch: Optional[str] = None,
+    classifier=None,
+    grid=DEFAULT_GRID,
+    cell_threshold=DEFAULT_CELL_THRESHOLD,
+    buffer=DEFAULT_CROP_BUFFER,
+    commit_batch=DEFAULT_COMMIT_BATCH,
+    **find_kwargs,
+) -> ChangeReport:
+    """
+    Records the tiles of a new crawl epoch, only segmenting and classifying what
+    changed since previous_epoch, by default the latest epoch before this one. Records
+    are written commit_batch tiles at a time.
+    """
+    if previous_epoch is None:
+        previous_epoch = store.previous_epoch(epoch)
+    report = ChangeReport()
+    start = time.perf_counter()
+    records = []
+
+    for pair in pairs:
+        previous = store.get(previous_epoch, pair.name) if previous_epoch else None
+        try:
+            record, outcome, classified = update_tile(
+                pair,
+                previous,
+                classifier,
+                grid,
+                cell_threshold,
+                buffer,
+                **find_kwargs,
+            )
+        except Exception as error:
+            print(f"Updating tile {pair.name} failed: {error!r}")
+            report.failed += 1
+            continue
+
+        records.append(record)
+        if len(records) == commit_batch:
+            store.put_many(epoch, records)
+            records = []
+        report.tiles += 1
+        setattr(report, outcome, getattr(report, outcome) + 1)
+        report.boxes_classified += classified
+        if outcome in (UNCHANGED, RECLASSIFIED):
+            report.boxes_carried += len(record.bboxes)
+    store.put_many(epoch, records)
+
+    report.seconds = time.perf_counter() - start
+    print(
+        f"Updated {report.tiles} tiles for epoch {epoch}: {report.unchanged} "
+        f"unchanged, {report.reclassified} reclassified, {report.resegmented} "
+        f"resegmented, {report.new} new, {report.failed} failed "
+        f"({report.skipped_fraction:.1%} skipped segmentation)"
+    )
+    return report
@@ -0,0 +1,219 @@
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.crop_store import CropShardReader, crop_id
+from src.extraction import DEFAULT_CROP_BUFFER, TilePair, crop_tile
+from src.parallel import imap_bounded
+from src.profiling import timer
+
+DEFAULT_INPUT_SIZE = 224  # rows and columns of the classifier input
+DEFAULT_BATCH_SIZE = 64
+DEFAULT_TILES_PER_TASK = 8  # tiles segmented per pool task, enough to fill batches
+PROGRESS_INTERVAL = 100  # tasks between progress reports
+
+# the classifier of the current pool worker, built once by _init_worker
+_classifier = None
+
+
+@dataclass(frozen=True)
+class Prediction:
+    tile: str
+    box: int
+    label: int
+    confidence: float
+
+
+@dataclass
+class ClassificationReport:
+    tiles: int = 0
+    failed: int = 0
+    crops: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def crops_per_second(self) -> float:
+        return self.crops / self.seconds if self.seconds else 0.0
+
+
+def letterbox(crop: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """
+    Resizes a crop with nearest neighbour sampling to fit the square out, keeping its
+    aspect ratio, and centers it on a black background. Only the RGB channels are kept.
+    """
+    size = out.shape[0]
+    height, width = crop.shape[:2]
+    scale = size / max(height, width)
+    new_height = max(min(round(height * scale), size), 1)
+    new_width = max(min(round(width * scale), size), 1)
+    rows = np.arange(new_height) * height // new_height
+    cols = np.arange(new_width) * width // new_width
+    top = (size - new_height) // 2
+    left = (size - new_width) // 2
+
+    out[:top] = 0
+    out[top + new_height :] = 0
+    out[top : top + new_height, :left] = 0
+    out[top : top + new_height, left + new_width :] = 0
+    out[top : top + new_height, left : left + new_width] = crop[rows[:, None], cols, :3]
+    return out
+
+
+def iter_batches(
+    crops: Iterable[Tuple[crop_id, np.ndarray]],
+    batch_size=DEFAULT_BATCH_SIZE,
+    size=DEFAULT_INPUT_SIZE,
+) -> Iterator[Tuple[List[crop_id], np.ndarray]]:
+    """
+    Letterboxes crops into fixed-shape (batch_size, size, size, 3) uint8 batches.
+
+    Every batch is a view of the same preallocated array, so it's only valid until the
+    next batch is requested. The last batch is cut to the remaining crops.
+    """
+    batch = np.zeros((batch_size, size, size, 3), dtype=np.uint8)
+    keys = []
+    for key, crop in crops:
+        with timer("classify.letterbox"):
+            letterbox(crop, batch[len(keys)])
+        keys.append(key)
+        if len(keys) == batch_size:
+            yield keys, batch
+            keys = []
+    if keys:
+        yield keys, batch[: len(keys)]
+
+
+def classify_crops(
+    crops: Iterable[Tuple[crop_id, np.ndarray]],
+    classifier,
+    batch_size=DEFAULT_BATCH_SIZE,
+    size=DEFAULT_INPUT_SIZE,
+) -> Iterator[Prediction]:
+    """
+    Classifies (tile, box) keyed crops in batches.
+
+    classifier.predict takes an (N, size, size, 3) uint8 batch and returns (N, classes)
+    scores. Each crop is labelled with its highest scoring class.
+    """
+    for keys, batch in iter_batches(crops, batch_size, size):
+        with timer("classify.predict"):
+            scores = np.asarray(classifier.predict(batch))
+        if scores.ndim != 2 or len(scores) != len(keys):
+            raise ValueError(
+                f"Expected scores of shape ({len(keys)}, classes), got {scores.shape}"
+            )
+        labels = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(keys)), labels]
+        for (tile, box), label, confidence in zip(
+            keys, labels.tolist(), confidences.tolist()
+        ):
+            yield Prediction(tile, box, label, confidence)
+
+
+def iter_tile_crops(
+    pairs: Iterable[TilePair], buffer=DEFAULT_CROP_BUFFER, **find_kwargs
+) -> Iterator[Tuple[crop_id, np.ndarray]]:
+    """
+    Segments tile pairs and yields their satellite crops keyed by (tile, box), without
+    writing them anywhere.
+    """
+    for pair in pairs:
+        _, crops = crop_tile(pair, buffer, **find_kwargs)
+        for box, crop in enumerate(crops):
+            yield (pair.name, box), crop
+
+
+def iter_shard_crops(reader: CropShardReader) -> Iterator[Tuple[crop_id, np.ndarray]]:
+    """
+    Yields the crops of CropShardReader shards keyed by (tile, box).
+    """
+    for key in sorted(reader.keys()):
+        yield key, reader.get(*key)
+
+
+def _init_worker(classifier_factory: Callable):
+    global _classifier
+    _classifier = classifier_factory()
+
+
+def _classify_tiles_task(
+    pairs: List[TilePair], batch_size: int, size: int, buffer: int, find_kwargs: dict
+) -> List[Prediction]:
+    return list(
+        classify_crops(
+            iter_tile_crops(pairs, buffer, **find_kwargs),
+            _classifier,
+            batch_size,
+            size,
+        )
+    )
+
+
+def classify_tiles(
+    pairs: List[TilePair],
+    classifier_factory: Callable,
+    sink: Callable[[List[Prediction]], None],
+    processes: Optional[int] = None,
+    batch_size=DEFAULT_BATCH_SIZE,
+    size=DEFAULT_INPUT_SIZE,
+    tiles_per_task=DEFAULT_TILES_PER_TASK,
+    buffer=DEFAULT_CROP_BUFFER,
+    **find_kwargs,
+) -> ClassificationReport:
+    """
+    Segments tile pairs and classifies their roof crops straight from memory, passing
+    the predictions of every group of tiles_per_task tiles to sink.
+
+    Each pool worker builds its own classifier with the picklable classifier_factory
+    and batches the crops of several tiles together, so batches stay full. At most two
+    tasks per process are in flight, keeping memory bounded on a city's worth of tiles.
+    """
+    tasks = [
+        pairs[start : start + tiles_per_task]
+        for start in range(0, len(pairs), tiles_per_task)
+    ]
+    report = ClassificationReport()
+    start = time.perf_counter()
+    finished = 0
+
+    classify = partial(
+        _classify_tiles_task,
+        batch_size=batch_size,
+        size=size,
+        buffer=buffer,
+        find_kwargs=find_kwargs,
+    )
+    for task, predictions, error in imap_bounded(
+        classify,
+        tasks,
+        processes,
+        initializer=_init_worker,
+        initargs=(classifier_factory,),
+    ):
+        finished += 1
+        if error is not None:
+            print(f"Classifying tiles {task[0].name}... failed: {error!r}")
+            report.failed += len(task)
+            report.failures.extend(pair.name for pair in task)
+            continue
+        report.tiles += len(task)
+        report.crops += len(predictions)
+        report.batches += -(-len(predictions) // batch_size)
+        sink(predictions)
+        if finished % PROGRESS_INTERVAL == 0:
+            elapsed = time.perf_counter() - start
+            print(
+                f"Classified {report.crops} crops, {report.crops / elapsed:.2f} crops/s"
+            )
+
+    report.seconds = time.perf_counter() - start
+    print(
+        f"Classified {report.crops} crops from {report.tiles} tiles ({report.failed} "
+        f"failed) in {report.batches} batches at {report.crops_per_second:.2f} crops/s"
+    )
+    return report
@@ -0,0 +1,449 @@
+"""
+Command line interface to EstateVision.
+
+Usage:
+    python -m src.cli crawl --start 28.765846 -81.267981 --max-requests 100 > locations.csv
+    python -m src.cli scrape locations.csv --save-dir data/static_maps
+    python -m src.cli extract data/static_maps data/roof_images --format shards
+    python -m src.cli classify data/static_maps --classifier models.roof_age:load > ages.csv
+    python -m src.cli sweep data/static_maps --gaussian-sigma 5 10 --min-area 300 500
+    python -m src.cli bench --filter find_roof_boxes
+
+Subcommands import what they need when they run, so starting the CLI stays cheap.
+Options left unset fall back to the defaults of the functions they are passed to.
+"""
+import argparse
+import contextlib
+import sys
+from typing import Iterator, List, Optional, TextIO
+
+DEFAULT_SAVE_DIR = "data/static_maps"
+
+
+def _given(args: argparse.Namespace, *names) -> dict:
+    """
+    Gets the options the user set, so unset ones keep the library defaults.
+    """
+    values = {name: getattr(args, name) for name in names}
+    return {name: value for name, value in values.items() if value is not None}
+
+
+def _read_locations(lines: TextIO) -> Iterator[tuple]:
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            lat, lon = line.split(",")[:2]
+            yield float(lat), float(lon)
+
+
+def _default_params() -> dict:
+    from src.scraping import GoogleMapsScraper, MapType
+
+    return GoogleMapsScraper("unused", None, None, None)._create_params(
+        MapType.STREET, 0, 0
+    )
+
+
+def crawl(args: argparse.Namespace, output: TextIO) -> int:
+    if args.area:
+        from src.coverage import estimate_coverage, plan_coverage
+
+        area = tuple(args.area)
+        if args.estimate:
+            estimate = estimate_coverage(
+                area, _default_params(), **_given(args, "overlap")
+            )
+            print(
+                f"{estimate.tiles} tiles, {estimate.requests} requests, "
+                f"${estimate.cost:.2f}",
+                file=output,
+            )
+            return 0
+        locations = plan_coverage(area, _default_params(), **_given(args, "overlap"))
+    else:
+        from src.crawling import iter_crawl_locations
+
+        locations = iter_crawl_locations(
+            [tuple(start) for start in args.start],
+            **_given(args, "max_requests", "max_crawl_depth", "jump_distance"),
+        )
+
+    for lat, lon in locations:
+        output.write(f"{lat},{lon}\n")
+    return 0
+
+
+def scrape(args: argparse.Namespace, output: TextIO) -> int:
+    import asyncio
+
+    from src.settings import get_setting
+
+    api_key = get_setting("GOOGLE_MAPS_API_KEY")
+    if not api_key:
+        print("Set GOOGLE_MAPS_API_KEY to scrape", file=sys.stderr)
+        return 1
+
+    try:
+        import requests
+    except ImportError:
+        print("Scraping needs the requests package", file=sys.stderr)
+        return 1
+
+    from src.crawling import get_missing_locations, scrape_image_from_locations_async
+    from src.manifest import ScrapeManifest
+    from src.rate_limiting import RateLimitScheduler, TokenBucket
+    from src.scraping import DEFAULT_TIMEOUT, FileSystem, GoogleMapsScraper
+    from src.tile_cache import TileCache
+
+    if args.locations == "-":
+        locations = list(_read_locations(sys.stdin))
+    else:
+        with open(args.locations) as f:
+            locations = list(_read_locations(f))
+
+    manifest = ScrapeManifest(args.manifest) if args.manifest else None
+    cache = TileCache(args.cache) if args.cache else None
+    try:
+        scraper = GoogleMapsScraper(
+            api_key,
+            args.save_dir,
+            requests.Session(),
+            FileSystem(),
+            timeout=DEFAULT_TIMEOUT if args.timeout is None else args.timeout,
+            scheduler=RateLimitScheduler(TokenBucket(**_given(args, "rate"))),
+            manifest=manifest,
+            cache=cache,
+        )
+        if manifest is not None:
+            skipped = len(locations)
+            locations = get_missing_locations(scraper, manifest, locations)
+            skipped -= len(locations)
+            print(f"Skipping {skipped} locations already in the manifest", file=output)
+
+        filenames = asyncio.run(
+            scrape_image_from_locations_async(
+                locations,
+                scraper,
+                **_given(args, "max_concurrency", "retries"),
+            )
+        )
+        print(f"Saved {len(filenames)} map images to {args.save_dir}", file=output)
+        if cache is not None:
+            stats = cache.stats
+            print(
+                f"Tile cache: {stats.hits} hits, {stats.misses} misses, "
+                f"${stats.cost_saved():.2f} saved",
+                file=output,
+            )
+        return 0
+    finally:
+        if manifest is not None:
+            manifest.close()
+        if cache is not None:
+            cache.close()
+
+
+def extract(args: argparse.Namespace, output: TextIO) -> int:
+    from src.extraction import run_extraction
+
+    report = run_extraction(
+        args.tile_dir,
+        args.output_dir,
+        **_given(
+            args,
+            "processes",
+            "buffer",
+            "crop_format",
+            "method",
+            "downsample",
+            "box_cache",
+        ),
+    )
+    return 1 if report.failed else 0
+
+
+def _load_object(spec: str):
+    """
+    Imports the object named by a "package.module:attribute" spec.
+    """
+    import importlib
+
+    module, _, attribute = spec.partition(":")
+    if not attribute:
+        raise ValueError(f"Expected package.module:attribute, got {spec}")
+    return getattr(importlib.import_module(module), attribute)
+
+
+def classify(args: argparse.Namespace, output: TextIO) -> int:
+    import os
+
+    from src.classification import classify_tiles
+    from src.extraction import pair_tiles
+
+    def write(predictions):
+        for prediction in predictions:
+            output.write(
+                f"{prediction.tile},{prediction.box},{prediction.label},"
+                f"{prediction.confidence}\n"
+            )
+
+    pairs = pair_tiles(
+        os.path.join(args.tile_dir, name) for name in os.listdir(args.tile_dir)
+    )
+    output.write("tile,box,label,confidence\n")
+    # progress goes to stderr so predictions can be piped
+    with contextlib.redirect_stdout(sys.stderr):
+        report = classify_tiles(
+            pairs,
+            _load_object(args.classifier),
+            write,
+            **_given(
+                args,
+                "processes",
+                "batch_size",
+                "size",
+                "tiles_per_task",
+                "buffer",
+                "method",
+                "downsample",
+            ),
+        )
+    return 1 if report.failed else 0
+
+
+def update(args: argparse.Namespace, output: TextIO) -> int:
+    import os
+
+    from src.change_detection import EpochStore, run_incremental
+    from src.extraction import pair_tiles
+
+    pairs = pair_tiles(
+        os.path.join(args.tile_dir, name) for name in os.listdir(args.tile_dir)
+    )
+    store = EpochStore(args.store)
+    try:
+        report = run_incremental(
+            pairs,
+            store,
+            args.epoch,
+            classifier=_load_object(args.classifier)() if args.classifier else None,
+            **_given(
+                args,
+                "previous_epoch",
+                "grid",
+                "cell_threshold",
+                "buffer",
+                "method",
+                "downsample",
+            ),
+        )
+    finally:
+        store.close()
+    return 1 if report.failed else 0
+
+
+def sweep(args: argparse.Namespace, output: TextIO) -> int:
+    import glob
+    import os
+
+    from src.sweep import param_grid, run_sweep, write_table
+
+    grid = param_grid(
+        **_given(
+            args,
+            "epsilon",
+            "method",
+            "downsample",
+            "gaussian_sigma",
+            "canny_sigma",
+            "min_area",
+            "buffer",
+            "logo_margin",
+        )
+    )
+    paths = sorted(glob.glob(os.path.join(args.tile_dir, "street_*.png")))
+    with contextlib.redirect_stdout(sys.stderr):
+        results = run_sweep(paths, grid, **_given(args, "processes"))
+    write_table(results, output)
+    return 0
+
+
+def bench(args: argparse.Namespace, output: TextIO) -> int:
+    from benchmarks import run
+
+    run.main(args.bench_args)
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="estatevision",
+        description="Scrape Google Maps tiles and extract roof images.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print stage timings as JSON to stderr when done",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    crawl_parser = commands.add_parser(
+        "crawl", help="print the locations to scrape, one lat,lon per line"
+    )
+    start = crawl_parser.add_mutually_exclusive_group(required=True)
+    start.add_argument(
+        "--start",
+        nargs=2,
+        type=float,
+        action="append",
+        metavar=("LAT", "LON"),
+        help="crawl outwards in a grid from this location, may be repeated",
+    )
+    start.add_argument(
+        "--area",
+        nargs=4,
+        type=float,
+        metavar=("MIN_LAT", "MIN_LON", "MAX_LAT", "MAX_LON"),
+        help="plan the tiles covering a bounding box instead",
+    )
+    crawl_parser.add_argument("--max-requests", type=int)
+    crawl_parser.add_argument("--max-crawl-depth", type=int)
+    crawl_parser.add_argument("--jump-distance", type=float)
+    crawl_parser.add_argument(
+        "--overlap", type=float, help="fraction of a tile shared with neighbours"
+    )
+    crawl_parser.add_argument(
+        "--estimate",
+        action="store_true",
+        help="print the tiles, requests and cost of covering --area",
+    )
+    crawl_parser.set_defaults(handler=crawl)
+
+    scrape_parser = commands.add_parser(
+        "scrape", help="scrape street and satellite maps at each location"
+    )
+    scrape_parser.add_argument(
+        "locations", help="file of lat,lon lines from crawl, or - for stdin"
+    )
+    scrape_parser.add_argument("--save-dir", default=DEFAULT_SAVE_DIR)
+    scrape_parser.add_argument(
+        "--manifest", help="SQLite manifest used to skip already scraped locations"
+    )
+    scrape_parser.add_argument("--cache", help="tile cache directory")
+    scrape_parser.add_argument("--max-concurrency", type=int)
+    scrape_parser.add_argument("--timeout", type=float, help="seconds per HTTP request")
+    scrape_parser.add_argument("--retries", type=int)
+    scrape_parser.add_argument("--rate", type=float, help="requests per second")
+    scrape_parser.set_defaults(handler=scrape)
+
+    extract_parser = commands.add_parser(
+        "extract", help="extract roof crops from scraped tile pairs"
+    )
+    extract_parser.add_argument("tile_dir")
+    extract_parser.add_argument("output_dir")
+    extract_parser.add_argument("--processes", type=int)
+    extract_parser.add_argument("--buffer", type=int)
+    extract_parser.add_argument(
+        "--format", dest="crop_format", choices=["jpeg", "shards"]
+    )
+    extract_parser.add_argument("--method", choices=["canny", "components"])
+    extract_parser.add_argument("--downsample", type=int)
+    extract_parser.add_argument(
+        "--box-cache", help="SQLite cache of roof boxes reused across runs"
+    )
+    extract_parser.set_defaults(handler=extract)
+
+    classify_parser = commands.add_parser(
+        "classify",
+        help="classify the roofs of scraped tile pairs, printing tile,box,label rows",
+    )
+    classify_parser.add_argument("tile_dir")
+    classify_parser.add_argument(
+        "--classifier",
+        required=True,
+        help="package.module:factory returning an object with a predict(batch) method",
+    )
+    classify_parser.add_argument("--processes", type=int)
+    classify_parser.add_argument("--batch-size", type=int)
+    classify_parser.add_argument("--size", type=int, help="classifier input size")
+    classify_parser.add_argument("--tiles-per-task", type=int)
+    classify_parser.add_argument("--buffer", type=int)
+    classify_parser.add_argument("--method", choices=["canny", "components"])
+    classify_parser.add_argument("--downsample", type=int)
+    classify_parser.set_defaults(handler=classify)
+
+    update_parser = commands.add_parser(
+        "update",
+        help="record a crawl epoch of scraped tile pairs, only segmenting and "
+        "classifying the tiles that changed since the previous epoch",
+    )
+    update_parser.add_argument("tile_dir")
+    update_parser.add_argument("--epoch", required=True, help="e.g. 2024-05")
+    update_parser.add_argument(
+        "--store", required=True, help="SQLite file of every epoch's tiles"
+    )
+    update_parser.add_argument(
+        "--previous", dest="previous_epoch", help="defaults to the latest earlier epoch"
+    )
+    update_parser.add_argument(
+        "--classifier",
+        help="package.module:factory returning an object with a predict(batch) method",
+    )
+    update_parser.add_argument("--grid", type=int, help="thumbnail cells per side")
+    update_parser.add_argument("--cell-threshold", type=int)
+    update_parser.add_argument("--buffer", type=int)
+    update_parser.add_argument("--method", choices=["canny", "components"])
+    update_parser.add_argument("--downsample", type=int)
+    update_parser.set_defaults(handler=update)
+
+    sweep_parser = commands.add_parser(
+        "sweep",
+        help="run find_roof_boxes over every combination of the given parameter "
+        "values, printing a CSV table of the roofs found",
+    )
+    sweep_parser.add_argument("tile_dir", help="directory of street_*.png maps")
+    sweep_parser.add_argument("--epsilon", nargs="+", type=float)
+    sweep_parser.add_argument("--method", nargs="+", choices=["canny", "components"])
+    sweep_parser.add_argument("--downsample", nargs="+", type=int)
+    sweep_parser.add_argument("--gaussian-sigma", nargs="+", type=float)
+    sweep_parser.add_argument("--canny-sigma", nargs="+", type=float)
+    sweep_parser.add_argument("--min-area", nargs="+", type=int)
+    sweep_parser.add_argument("--buffer", nargs="+", type=int)
+    sweep_parser.add_argument("--logo-margin", nargs="+", type=int)
+    sweep_parser.add_argument("--processes", type=int)
+    sweep_parser.set_defaults(handler=sweep)
+
+    bench_parser = commands.add_parser(
+        "bench",
+        help="run the benchmark suite, see python -m benchmarks.run --help",
+        add_help=False,
+    )
+    bench_parser.set_defaults(handler=bench)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None, output: TextIO = sys.stdout) -> int:
+    parser = build_parser()
+    # everything after bench is passed on to the benchmark runner
+    args, extra = parser.parse_known_args(argv)
+    if args.command == "bench":
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+
+    if not args.profile:
+        return args.handler(args, output)
+
+    from src import profiling
+
+    registry = profiling.enable()
+    try:
+        return args.handler(args, output)
+    finally:
+        profiling.disable()
+        print(registry.to_json(indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,228 @@
+import math
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+
+from src.crawling import DEFAULT_PRECISION, location
+from src.settings import DEFAULT_COST_PER_1000
+
+TILE_SIZE = 256  # Web Mercator world width in pixels at zoom 0
+MAX_LATITUDE = 85.05112878  # Web Mercator latitude cutoff
+DEFAULT_OVERLAP = 0.05  # fraction of a tile shared with each neighbour
+DEFAULT_MAP_TYPES = 2  # street and satellite requests per tile
+
+bounding_box = Tuple[float, float, float, float]  # (min_lat, min_lon, max_lat, max_lon)
+point = Tuple[float, float]
+
+
+@dataclass(frozen=True)
+class CoverageEstimate:
+    tiles: int
+    requests: int
+    cost: float
+
+
+def lat_lon_to_pixel(lat: float, lon: float, zoom: int) -> point:
+    """
+    Projects a coordinate to Web Mercator pixel coordinates at the given zoom.
+    """
+    world_size = TILE_SIZE * 2**zoom
+    sin_lat = math.sin(math.radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))))
+    x = (lon + 180) / 360 * world_size
+    y = (0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * world_size
+    return x, y
+
+
+def pixel_to_lat_lon(x: float, y: float, zoom: int) -> location:
+    """
+    Inverse of lat_lon_to_pixel.
+    """
+    world_size = TILE_SIZE * 2**zoom
+    lon = x / world_size * 360 - 180
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / world_size))))
+    return lat, lon
+
+
+def pixels_to_lat_lon(xs, ys, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized pixel_to_lat_lon over arrays of pixel coordinates.
+    """
+    world_size = TILE_SIZE * 2**zoom
+    lons = np.asarray(xs, dtype=np.float64) / world_size * 360 - 180
+    ys = np.asarray(ys, dtype=np.float64)
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ys / world_size))))
+    return lats, lons
+
+
+def tile_footprint(params: dict) -> Tuple[int, int, int]:
+    """
+    Gets (zoom, width, height) from GoogleMapsScraper._create_params. Width and height
+    are in Web Mercator pixels; scale only changes resolution, not the area covered.
+    """
+    width, height = (int(value) for value in params["size"].split("x"))
+    return int(params["zoom"]), width, height
+
+
+def _grid_axis(start: float, end: float, tile: float, step: float) -> Tuple[float, int]:
+    """
+    Gets the first center and count of the fewest tiles covering [start, end], centering
+    the grid so any slack is split evenly between both sides.
+    """
+    span = end - start
+    count = max(1, math.ceil((span - tile) / step - 1e-9) + 1)
+    slack = (count - 1) * step + tile - span
+    return start - slack / 2 + tile / 2, count
+
+
+def _bounding_box_pixels(area: bounding_box, zoom: int):
+    min_lat, min_lon, max_lat, max_lon = area
+    x0, y0 = lat_lon_to_pixel(max_lat, min_lon, zoom)
+    x1, y1 = lat_lon_to_pixel(min_lat, max_lon, zoom)
+    return x0, y0, x1, y1
+
+
+def _polygon_ring(area: dict) -> List[point]:
+    """
+    Gets the outer ring of a GeoJSON Polygon geometry or Feature as (lat, lon) points.
+    """
+    geometry = area.get("geometry", area)
+    if geometry.get("type") != "Polygon":
+        raise ValueError("Only GeoJSON Polygon areas are supported")
+    return [(lat, lon) for lon, lat, *_ in geometry["coordinates"][0]]
+
+
+def _segment_intersects_rect(start: point, end: point, rect) -> bool:
+    """
+    Liang-Barsky clipping of a segment against an (x0, y0, x1, y1) rectangle.
+    """
+    (x, y), (end_x, end_y) = start, end
+    dx, dy = end_x - x, end_y - y
+    low, high = 0.0, 1.0
+
+    for p, q in [
+        (-dx, x - rect[0]),
+        (dx, rect[2] - x),
+        (-dy, y - rect[1]),
+        (dy, rect[3] - y),
+    ]:
+        if p == 0:
+            if q < 0:
+                return False
+        elif p < 0:
+            low = max(low, q / p)
+        else:
+            high = min(high, q / p)
+        if low > high:
+            return False
+
+    return True
+
+
+def _point_in_polygon(x: float, y: float, polygon: List[point]) -> bool:
+    inside = False
+    for (x0, y0), (x1, y1) in zip(polygon, polygon[1:] + polygon[:1]):
+        if (y0 > y) != (y1 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+    return inside
+
+
+def _rect_intersects_polygon(rect, polygon: List[point]) -> bool:
+    edges = zip(polygon, polygon[1:] + polygon[:1])
+    if any(_segment_intersects_rect(start, end, rect) for start, end in edges):
+        return True
+    # no edge crosses the rect, so it is either fully inside or fully outside
+    return _point_in_polygon((rect[0] + rect[2]) / 2, (rect[1] + rect[3]) / 2, polygon)
+
+
+def _band_extent(polygon: List[point], y0: float, y1: float):
+    """
+    Gets the x range of the polygon's edges clipped to the horizontal band [y0, y1].
+    """
+    xs = []
+    for (ax, ay), (bx, by) in zip(polygon, polygon[1:] + polygon[:1]):
+        if max(ay, by) < y0 or min(ay, by) > y1:
+            continue
+        for y in [max(min(ay, by), y0), min(max(ay, by), y1)]:
+            xs.append(ax if ay == by else ax + (y - ay) * (bx - ax) / (by - ay))
+    return (min(xs), max(xs)) if xs else None
+
+
+def plan_coverage(
+    area: Union[bounding_box, dict],
+    params: dict,
+    overlap=DEFAULT_OVERLAP,
+    precision=DEFAULT_PRECISION,
+) -> Iterator[location]:
+    """
+    Lazily yields the tile centers covering an area, row by row from north to south.
+
+    The area is a (min_lat, min_lon, max_lat, max_lon) bounding box or a GeoJSON Polygon.
+    Tiles are laid out in Web Mercator pixel space using the zoom and size from
+    GoogleMapsScraper._create_params, so neighbouring tiles share exactly overlap of
+    their width and height at every latitude. Areas crossing the antimeridian are not
+    supported.
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError("overlap must be in [0, 1)")
+
+    zoom, width, height = tile_footprint(params)
+    step_x, step_y = width * (1 - overlap), height * (1 - overlap)
+    polygon = None
+
+    if isinstance(area, dict):
+        polygon = [lat_lon_to_pixel(lat, lon, zoom) for lat, lon in _polygon_ring(area)]
+        xs, ys = zip(*polygon)
+        x0, x1, y0, y1 = min(xs), max(xs), min(ys), max(ys)
+    else:
+        x0, y0, x1, y1 = _bounding_box_pixels(area, zoom)
+
+    first_x, columns = _grid_axis(x0, x1, width, step_x)
+    first_y, rows = _grid_axis(y0, y1, height, step_y)
+
+    for row in range(rows):
+        y = first_y + row * step_y
+        row_top, row_bottom = y - height / 2, y + height / 2
+
+        if polygon is not None:
+            extent = _band_extent(polygon, row_top, row_bottom)
+            if extent is None:
+                continue
+
+        for column in range(columns):
+            x = first_x + column * step_x
+            if polygon is not None:
+                rect = (x - width / 2, row_top, x + width / 2, row_bottom)
+                if rect[2] < extent[0] or rect[0] > extent[1]:
+                    continue
+                if not _rect_intersects_polygon(rect, polygon):
+                    continue
+
+            lat, lon = pixel_to_lat_lon(x, y, zoom)
+            yield round(lat, precision), round(lon, precision)
+
+
+def estimate_coverage(
+    area: Union[bounding_box, dict],
+    params: dict,
+    overlap=DEFAULT_OVERLAP,
+    map_types=DEFAULT_MAP_TYPES,
+    cost_per_1000=DEFAULT_COST_PER_1000,
+) -> CoverageEstimate:
+    """
+    Counts the tiles, requests and API cost of covering an area before fetching
+    anything. Bounding boxes are counted in closed form, polygons by streaming the plan.
+    """
+    if isinstance(area, dict):
+        tiles = sum(1 for _ in plan_coverage(area, params, overlap))
+    else:
+        if not 0 <= overlap < 1:
+            raise ValueError("overlap must be in [0, 1)")
+        zoom, width, height = tile_footprint(params)
+        x0, y0, x1, y1 = _bounding_box_pixels(area, zoom)
+        _, columns = _grid_axis(x0, x1, width, width * (1 - overlap))
+        _, rows = _grid_axis(y0, y1, height, height * (1 - overlap))
+        tiles = columns * rows
+
+    requests = tiles * map_types
+    return CoverageEstimate(tiles, requests, requests / 1000 * cost_per_1000)
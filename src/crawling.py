@@ -1,7 +1,12 @@
+import asyncio
 import re
-from collections import OrderedDict
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 
+import numpy as np
+
+from src.manifest import ScrapeManifest
+from src.profiling import timed, timer
 from src.scraping import GoogleMapsScraper, MapType
 
 location = Tuple[float, float]
@@ -10,46 +15,114 @@ DEFAULT_MAX_CRAWL_DEPTH = 4
 DEFAULT_MAX_REQUESTS = 10
 DEFAULT_DELTA = 0.001533  # delta in coordinates
 DEFAULT_PRECISION = 6  # number of coordinate decimals to keep
+MAX_GRID_PRECISION = 7  # coordinate decimals that fit a packed int64 grid key
+NEIGHBOR_DIRECTIONS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+DEFAULT_MAX_CONCURRENCY = 8  # simultaneous map requests
+DEFAULT_RETRIES = 2  # extra attempts after a failed map request
 
 
-def get_crawl_locations(
-    locations=List[location],
+def _pack_cells(lat_cells: np.ndarray, lon_cells: np.ndarray) -> np.ndarray:
+    """
+    Packs integer grid coordinates into single int64 keys.
+    """
+    return (lat_cells << 32) + lon_cells
+
+
+def _unpack_cells(keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Inverse of _pack_cells.
+    """
+    lon_cells = ((keys + (1 << 31)) & 0xFFFFFFFF) - (1 << 31)
+    return (keys - lon_cells) >> 32, lon_cells
+
+
+def _first_occurrences(keys: np.ndarray) -> np.ndarray:
+    """
+    Removes duplicate keys, keeping the first occurrence of each in its original order.
+    """
+    _, first_indices = np.unique(keys, return_index=True)
+    return keys[np.sort(first_indices)]
+
+
+def iter_crawl_locations(
+    locations: List[location],
     max_requests=DEFAULT_MAX_REQUESTS,
     max_crawl_depth=DEFAULT_MAX_CRAWL_DEPTH,
     jump_distance=DEFAULT_DELTA,
     precision=DEFAULT_PRECISION,
-) -> List[location]:
+) -> Iterator[location]:
     """
-    Crawls locations starting from a list of locations outwards in a grid.
+    Lazily crawls locations starting from a list of locations outwards in a grid,
+    yielding one BFS ring at a time so only the last two rings are held in memory.
 
-    A naive implementation not accounting for shape distortion of Earth's surface and shape.
+    Coordinates are mapped once onto an integer grid of 10^-precision degrees and each
+    BFS ring is expanded with NumPy. Since every ring only touches cells of the previous,
+    current and next ring, deduplication only checks the last two rings instead of every
+    visited cell.
     """
-    visited = OrderedDict()
-    stack = [(round(lat, precision), round(lon, precision)) for lat, lon in locations]
-
-    depth = 0
+    if precision > MAX_GRID_PRECISION:
+        raise ValueError(f"precision must be at most {MAX_GRID_PRECISION} decimals")
+
+    scale = 10**precision
+    step = round(jump_distance * scale)
+    neighbor_offsets = _pack_cells(
+        np.array([dx * step for dx, _ in NEIGHBOR_DIRECTIONS], dtype=np.int64),
+        np.array([dy * step for _, dy in NEIGHBOR_DIRECTIONS], dtype=np.int64),
+    )
+
+    frontier = _first_occurrences(
+        _pack_cells(
+            np.array(
+                [round(round(lat, precision) * scale) for lat, _ in locations],
+                dtype=np.int64,
+            ),
+            np.array(
+                [round(round(lon, precision) * scale) for _, lon in locations],
+                dtype=np.int64,
+            ),
+        )
+    )
+    previous = np.empty(0, dtype=np.int64)
     requests_made = 0
+    depth = 0
 
-    while stack and requests_made < max_requests and depth < max_crawl_depth:
-        new_stack = []
-
-        for location in stack:
-            if location not in visited:
-                visited[location] = True
-                requests_made += 1
+    while frontier.size and requests_made < max_requests and depth < max_crawl_depth:
+        lat_cells, lon_cells = _unpack_cells(frontier[: max_requests - requests_made])
+        yield from zip((lat_cells / scale).tolist(), (lon_cells / scale).tolist())
+        requests_made += frontier.size
 
-                lat, lon = location
+        # crawl new locations from the ring, keeping only unseen cells
+        with timer("crawl.ring"):
+            candidates = _first_occurrences(
+                (frontier[:, None] + neighbor_offsets[None, :]).ravel()
+            )
+            seen = np.concatenate([previous, frontier])
+            previous, frontier = frontier, candidates[~np.isin(candidates, seen)]
+        depth += 1
 
-                # crawl new locations from origin
-                for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                    new_lat = round(lat + dx * jump_distance, precision)
-                    new_lon = round(lon + dy * jump_distance, precision)
-                    new_stack.append((new_lat, new_lon))
 
-        stack = new_stack
-        depth += 1
+@timed("crawl")
+def get_crawl_locations(
+    locations=List[location],
+    max_requests=DEFAULT_MAX_REQUESTS,
+    max_crawl_depth=DEFAULT_MAX_CRAWL_DEPTH,
+    jump_distance=DEFAULT_DELTA,
+    precision=DEFAULT_PRECISION,
+) -> List[location]:
+    """
+    Crawls locations starting from a list of locations outwards in a grid.
 
-    return list(visited.keys())[:max_requests]
+    A naive implementation not accounting for shape distortion of Earth's surface and shape.
+    """
+    return list(
+        iter_crawl_locations(
+            locations,
+            max_requests,
+            max_crawl_depth,
+            jump_distance,
+            precision,
+        )
+    )
 
 
 def scrape_image_from_locations(
@@ -73,6 +146,93 @@ def scrape_image_from_locations(
             if filename:
                 output_files.append(filename)
 
+    return output_files
+
+
+async def _scrape_with_retries(
+    scraper: GoogleMapsScraper,
+    executor: ThreadPoolExecutor,
+    semaphore: asyncio.Semaphore,
+    map_type: MapType,
+    location: location,
+    retries: int,
+) -> Optional[str]:
+    """
+    Runs a blocking scrape_map_image call on the executor, retrying when the request
+    raises.
+
+    Timeouts are left to the scraper's HTTP requests rather than cancelling the await,
+    since that would leave the thread running the request while a retry starts another.
+    Every attempt has returned or raised before the next one starts.
+    """
+    loop = asyncio.get_running_loop()
+    lat, lon = location
+
+    async with semaphore:
+        for attempt in range(retries + 1):
+            try:
+                return await loop.run_in_executor(
+                    executor,
+                    scraper.scrape_map_image,
+                    map_type,
+                    lat,
+                    lon,
+                )
+            except OSError as error:
+                print(
+                    f"Map Image request at ({lat}, {lon}) failed on attempt {attempt + 1}: {error!r}"
+                )
+
+    return None
+
+
+async def scrape_image_from_locations_async(
+    locations: List[location],
+    scraper: GoogleMapsScraper,
+    max_concurrency=DEFAULT_MAX_CONCURRENCY,
+    retries=DEFAULT_RETRIES,
+) -> List[str]:
+    """
+    Scrapes street and satellite images from a list of locations concurrently.
+
+    At most max_concurrency requests are in flight at once, all sharing one thread pool
+    and the scraper's requests object, so passing a requests.Session to the scraper pools
+    connections across workers. Returns the saved files in the same order as
+    scrape_image_from_locations.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+        filenames = await asyncio.gather(
+            *[
+                _scrape_with_retries(
+                    scraper,
+                    executor,
+                    semaphore,
+                    map_type,
+                    location,
+                    retries,
+                )
+                for location in locations
+                for map_type in [MapType.STREET, MapType.SATELLITE]
+            ]
+        )
+
+    return [filename for filename in filenames if filename]
+
+
+def get_missing_locations(
+    scraper: GoogleMapsScraper,
+    manifest: ScrapeManifest,
+    locations: List[location],
+) -> List[location]:
+    """
+    Returns the locations still missing a street or satellite image at the scraper's
+    zoom, size and scale, according to the manifest.
+    """
+    params = scraper._create_params(MapType.STREET, 0, 0)
+    return manifest.missing_locations(locations, params)
+
 
 def get_existing_locations(
     scraper: GoogleMapsScraper,
@@ -0,0 +1,166 @@
+import glob
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_SHARD_BYTES = 256 * 1024 * 1024  # roll over to a new shard past this size
+DATA_SUFFIX = ".bin"
+INDEX_SUFFIX = ".idx"
+
+crop_id = Tuple[str, int]  # (tile, box)
+
+INDEX_DTYPE = np.dtype(
+    [
+        ("tile", "S64"),  # tile ids, such as "lat_lon", of up to 64 bytes
+        ("box", "<i4"),
+        ("offset", "<i8"),
+        ("ndim", "<i1"),
+        ("shape", "<i4", (3,)),
+        ("dtype", "S8"),
+    ]
+)
+
+
+def _write_array(f, array: np.ndarray):
+    """
+    Writes an array's bytes without first copying it into a contiguous buffer. Crops
+    sliced from a tile are written row by row, each row being contiguous.
+    """
+    if array.flags.c_contiguous:
+        f.write(memoryview(array).cast("B"))
+        return
+    for row in array:
+        _write_array(f, row)
+
+
+class CropShardWriter:
+    """
+    Appends crops to large shard files instead of writing one image file per crop.
+
+    Each shard is a raw data file of concatenated crop bytes plus an append-only index
+    of fixed-size (tile, box, offset, shape, dtype) records. Records are written after
+    their data, so a crash never leaves an index entry pointing at missing bytes. Every
+    writer uses its own shard names, so several processes can write to one directory.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        shard_bytes=DEFAULT_SHARD_BYTES,
+        prefix: Optional[str] = None,
+    ):
+        self.directory = directory
+        self.shard_bytes = shard_bytes
+        self.prefix = prefix or f"crops-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.shard_number = -1
+        self.data_file = None
+        self.index_file = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_next_shard(self):
+        self.close()
+        self.shard_number += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self.shard_number:05d}")
+        self.data_file = open(path + DATA_SUFFIX, "ab")
+        self.index_file = open(path + INDEX_SUFFIX, "ab")
+
+    def write(self, tile: str, crops: List[np.ndarray]):
+        """
+        Appends the crops of a tile, numbering boxes in order, and flushes the shard.
+        """
+        if self.data_file is None or self.data_file.tell() >= self.shard_bytes:
+            self._open_next_shard()
+
+        if len(tile.encode()) > INDEX_DTYPE["tile"].itemsize:
+            raise ValueError(f"Tile id is too long for the shard index: {tile}")
+
+        records = np.zeros(len(crops), dtype=INDEX_DTYPE)
+        for box, crop in enumerate(crops):
+            if crop.ndim > 3:
+                raise ValueError("Crops must have at most 3 dimensions")
+            records[box] = (
+                tile.encode(),
+                box,
+                self.data_file.tell(),
+                crop.ndim,
+                crop.shape + (1,) * (3 - crop.ndim),
+                crop.dtype.str.encode(),
+            )
+            _write_array(self.data_file, crop)
+
+        self.data_file.flush()
+        self.index_file.write(records.tobytes())
+        self.index_file.flush()
+
+    def close(self):
+        for f in [self.data_file, self.index_file]:
+            if f is not None:
+                f.close()
+        self.data_file = self.index_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CropShardReader:
+    """
+    Memory-maps every shard in a directory and looks up crops by (tile, box) in O(1).
+    Returned crops are read-only views into the memory-mapped shard.
+    """
+
+    def __init__(self, directory: str):
+        self.shards: List[np.memmap] = []
+        self.indexes: List[np.ndarray] = []
+        self.locations: Dict[crop_id, Tuple[int, int]] = {}
+
+        for index_path in sorted(
+            glob.glob(os.path.join(directory, "*" + INDEX_SUFFIX))
+        ):
+            data_path = index_path[: -len(INDEX_SUFFIX)] + DATA_SUFFIX
+            if not os.path.getsize(data_path):
+                continue
+
+            with open(index_path, "rb") as f:
+                payload = f.read()
+            # ignore a partially written trailing record
+            usable = len(payload) - len(payload) % INDEX_DTYPE.itemsize
+            records = np.frombuffer(payload[:usable], dtype=INDEX_DTYPE)
+
+            shard = len(self.shards)
+            self.shards.append(np.memmap(data_path, dtype=np.uint8, mode="r"))
+            self.indexes.append(records)
+            for row, (tile, box) in enumerate(
+                zip(records["tile"].tolist(), records["box"].tolist())
+            ):
+                self.locations[(tile.decode(), box)] = (shard, row)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __contains__(self, key: crop_id):
+        return key in self.locations
+
+    def keys(self) -> Iterator[crop_id]:
+        return iter(self.locations)
+
+    def get(self, tile: str, box: int) -> np.ndarray:
+        shard, row = self.locations[(tile, box)]
+        record = self.indexes[shard][row]
+        dtype = np.dtype(record["dtype"].decode())
+        shape = tuple(int(size) for size in record["shape"][: record["ndim"]])
+        num_bytes = int(np.prod(shape)) * dtype.itemsize
+        offset = int(record["offset"])
+
+        crop = self.shards[shard][offset : offset + num_bytes].view(dtype)
+        return crop.reshape(shape)
+
+    def tile_crops(self, tile: str) -> List[np.ndarray]:
+        crops = []
+        while (tile, len(crops)) in self.locations:
+            crops.append(self.get(tile, len(crops)))
+        return crops
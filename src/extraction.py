@@ -0,0 +1,257 @@
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Iterable, List, Optional
+
+from src.bounding_boxes import find_roof_boxes
+from src.box_cache import RoofBoxCache
+from src.crop_store import CropShardWriter
+from src.parallel import imap_bounded
+from src.postprocessing import crop_images, save_images
+from src.scraping import GoogleMapsScraper, MapType
+from src.utils import load_image
+
+DEFAULT_CROP_BUFFER = 30  # pixels of context kept around each roof
+PROGRESS_INTERVAL = 100  # tiles between progress reports
+PROCESSED_LOG = "processed.log"
+JPEG, SHARDS = "jpeg", "shards"  # crop output formats
+
+# shard writers and box caches of the current process, one per path
+_crop_stores = {}
+_box_caches = {}
+
+
+@dataclass(frozen=True)
+class TilePair:
+    lat: float
+    lon: float
+    street_path: str
+    satellite_path: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.lat}_{self.lon}"
+
+
+@dataclass(frozen=True)
+class TileResult:
+    name: str
+    crops: int
+    cached: bool = False  # boxes came from the RoofBoxCache
+
+
+@dataclass
+class ExtractionReport:
+    tiles: int = 0
+    skipped: int = 0
+    failed: int = 0
+    crops: int = 0
+    cached: int = 0
+    seconds: float = 0.0
+    failures: List[str] = field(default_factory=list)
+
+    @property
+    def tiles_per_second(self) -> float:
+        return self.tiles / self.seconds if self.seconds else 0.0
+
+
+def pair_tiles(filenames: Iterable[str]) -> List[TilePair]:
+    """
+    Pairs street and satellite images scraped at the same location, using the
+    filenames from GoogleMapsScraper._generate_filename. Unpaired images are skipped.
+    """
+    pattern = re.compile(
+        f"^({'|'.join(map_type.value for map_type in MapType)})_"
+        f"{GoogleMapsScraper._filename_parser_regex()}\\.png$"
+    )
+    paths = {}
+
+    for filename in filenames:
+        match = pattern.match(os.path.basename(filename))
+        if match:
+            map_type, lat, lon = match.groups()
+            paths.setdefault((lat, lon), {})[MapType(map_type)] = filename
+
+    return [
+        TilePair(
+            float(lat),
+            float(lon),
+            found[MapType.STREET],
+            found[MapType.SATELLITE],
+        )
+        for (lat, lon), found in sorted(paths.items())
+        if len(found) == len(MapType)
+    ]
+
+
+def _crop_store(output_dir: str) -> CropShardWriter:
+    if output_dir not in _crop_stores:
+        _crop_stores[output_dir] = CropShardWriter(output_dir)
+    return _crop_stores[output_dir]
+
+
+def _box_cache(path: str) -> RoofBoxCache:
+    if path not in _box_caches:
+        _box_caches[path] = RoofBoxCache(path)
+    return _box_caches[path]
+
+
+def _close_stores():
+    while _crop_stores:
+        _crop_stores.popitem()[1].close()
+    while _box_caches:
+        _box_caches.popitem()[1].close()
+
+
+def _init_worker():
+    from multiprocessing.util import Finalize
+
+    # pool workers skip atexit handlers on exit, but run multiprocessing finalizers
+    Finalize(None, _close_stores, exitpriority=10)
+
+
+def crop_roofs(
+    street_image, satellite_image, buffer=DEFAULT_CROP_BUFFER, **find_kwargs
+):
+    """
+    Finds roofs on a decoded street map and crops them from the matching satellite
+    image, returning the bounding boxes and the crops.
+    """
+    _, bboxes = find_roof_boxes(street_image, **find_kwargs)
+    return bboxes, crop_images(satellite_image, bboxes, buffer)
+
+
+def crop_tile(
+    pair: TilePair,
+    buffer=DEFAULT_CROP_BUFFER,
+    box_cache: Optional[RoofBoxCache] = None,
+    **find_kwargs,
+):
+    """
+    Like crop_roofs, loading the images of a saved tile pair. The satellite image is
+    only loaded once the street map has been segmented. With a box_cache, the street
+    map isn't even loaded when its boxes are cached.
+    """
+    if box_cache is not None:
+        bboxes = box_cache.find_path(pair.street_path, **find_kwargs)
+    else:
+        _, bboxes = find_roof_boxes(load_image(pair.street_path), **find_kwargs)
+    return bboxes, crop_images(load_image(pair.satellite_path), bboxes, buffer)
+
+
+def extract_tile(
+    pair: TilePair,
+    output_dir: str,
+    buffer=DEFAULT_CROP_BUFFER,
+    filesystem=None,
+    crop_format=JPEG,
+    box_cache: Optional[str] = None,
+    **find_kwargs,
+) -> TileResult:
+    """
+    Finds roofs on the street map of a tile pair and saves their satellite crops, as
+    one JPEG per crop or appended to the process's crop shards. Only one decoded image
+    is held at a time. box_cache is the path of a RoofBoxCache shared by processes.
+    """
+    cache = _box_cache(box_cache) if box_cache else None
+    hits = cache.stats.hits if cache else 0
+    _, crops = crop_tile(pair, buffer, cache, **find_kwargs)
+
+    if crop_format == SHARDS:
+        _crop_store(output_dir).write(pair.name, crops)
+    else:
+        if filesystem is None:
+            from skimage import io as filesystem
+        save_images(filesystem, crops, output_dir, f"satellite_{pair.name}")
+
+    return TileResult(pair.name, len(crops), bool(cache and cache.stats.hits > hits))
+
+
+def _load_processed(output_dir: str) -> set:
+    path = os.path.join(output_dir, PROCESSED_LOG)
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+def run_extraction(
+    tile_dir: str,
+    output_dir: str,
+    processes: Optional[int] = None,
+    max_tiles_in_flight: Optional[int] = None,
+    buffer=DEFAULT_CROP_BUFFER,
+    crop_format=JPEG,
+    box_cache: Optional[str] = None,
+    **find_kwargs,
+) -> ExtractionReport:
+    """
+    Extracts roof crops from every street/satellite tile pair in tile_dir.
+
+    Tiles fan out over a process pool sized to the machine's cores, with at most
+    max_tiles_in_flight tiles submitted at once so decoded images never pile up in
+    memory. Finished tiles are appended to a processed log in output_dir, and tiles
+    already in it are skipped, so an interrupted run can be resumed. With crop_format
+    "shards" crops are appended to CropShardWriter shards instead of JPEG files. With
+    the path of a box_cache, boxes found before with the same parameters are reused.
+    """
+    if crop_format not in (JPEG, SHARDS):
+        raise ValueError(f"Unknown crop format: {crop_format}")
+
+    processes = processes or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    processed = _load_processed(output_dir)
+    pairs = pair_tiles(os.path.join(tile_dir, name) for name in os.listdir(tile_dir))
+    pending = [pair for pair in pairs if pair.name not in processed]
+    report = ExtractionReport(skipped=len(pairs) - len(pending))
+    start = time.perf_counter()
+    extract = partial(
+        extract_tile,
+        output_dir=output_dir,
+        buffer=buffer,
+        crop_format=crop_format,
+        box_cache=box_cache,
+        **find_kwargs,
+    )
+
+    with open(os.path.join(output_dir, PROCESSED_LOG), "a") as log:
+        try:
+            for pair, result, error in imap_bounded(
+                extract,
+                pending,
+                processes,
+                max_tiles_in_flight,
+                # in this process the stores are closed below instead
+                initializer=None if processes == 1 else _init_worker,
+            ):
+                if error is not None:
+                    print(f"Extracting tile {pair.name} failed: {error!r}")
+                    report.failed += 1
+                    report.failures.append(pair.name)
+                    continue
+                report.tiles += 1
+                report.crops += result.crops
+                report.cached += result.cached
+                log.write(f"{result.name}\n")
+                log.flush()
+                if report.tiles % PROGRESS_INTERVAL == 0:
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"Extracted {report.tiles} tiles, "
+                        f"{report.tiles / elapsed:.2f} tiles/s"
+                    )
+        finally:
+            if processes == 1:
+                _close_stores()
+
+    report.seconds = time.perf_counter() - start
+    print(
+        f"Extracted {report.tiles} tiles ({report.skipped} skipped, {report.failed} "
+        f"failed) into {report.crops} crops at {report.tiles_per_second:.2f} tiles/s"
+    )
+    if box_cache:
+        print(f"Box cache: {report.cached} of {report.tiles} tiles cached")
+    return report
@@ -0,0 +1,258 @@
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.crop_store import crop_id
+from src.profiling import timer
+
+DEFAULT_FEATURE_SIZE = 64  # crops are resized to size x size before describing them
+DEFAULT_BATCH_SIZE = 256
+COLOR_BINS = 8  # histogram bins per RGB channel, a power of two
+GLCM_LEVELS = 8  # gray levels of the co-occurrence matrices, a power of two
+GLCM_OFFSETS = [(0, 1), (1, 1), (1, 0), (1, -1)]  # 0, 45, 90 and 135 degrees
+LBP_BINS = 10  # rotation invariant uniform patterns of 8 neighbours, plus the rest
+DEFAULT_EDGE_THRESHOLD = 32  # gray level difference across 2 pixels counted as an edge
+GRAY_WEIGHTS = np.array([0.2125, 0.7154, 0.0721], dtype=np.float32)  # as rgb2gray
+
+# neighbours of the local binary pattern, clockwise from the top left, taken from the
+# 3 x 3 grid rather than interpolated on a circle as skimage does
+LBP_NEIGHBOURS = [(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (2, 1), (2, 0), (1, 0)]
+
+FEATURE_NAMES = (
+    [f"color_hist_{channel}{bin}" for channel in "rgb" for bin in range(COLOR_BINS)]
+    + [f"color_mean_{channel}" for channel in "rgb"]
+    + [f"color_std_{channel}" for channel in "rgb"]
+    + [f"lbp_{bin}" for bin in range(LBP_BINS)]
+    + ["glcm_contrast", "glcm_homogeneity", "glcm_energy", "glcm_correlation"]
+    + ["edge_density", "edge_strength"]
+)
+
+
+def _lbp_bins() -> np.ndarray:
+    """
+    Maps every 8 bit pattern to its rotation invariant uniform bin: the number of set
+    bits when the pattern has at most two 0/1 transitions, LBP_BINS - 1 otherwise.
+    """
+    codes = np.arange(256, dtype=np.uint8)
+    bits = np.unpackbits(codes[:, None], axis=1)
+    transitions = (bits != np.roll(bits, 1, axis=1)).sum(axis=1)
+    return np.where(transitions <= 2, bits.sum(axis=1), LBP_BINS - 1).astype(np.uint8)
+
+
+LBP_LOOKUP = _lbp_bins()
+
+
+@dataclass
+class FeatureBuffers:
+    """
+    Preallocated scratch arrays for describing batches of up to batch_size crops.
+    """
+
+    batch: np.ndarray
+    gray: np.ndarray
+    levels: np.ndarray
+    codes: np.ndarray
+    bits: np.ndarray
+    indices: np.ndarray
+
+    @classmethod
+    def for_shape(cls, batch_size=DEFAULT_BATCH_SIZE, size=DEFAULT_FEATURE_SIZE):
+        return cls(
+            batch=np.empty((batch_size, size, size, 3), dtype=np.uint8),
+            gray=np.empty((batch_size, size, size), dtype=np.float32),
+            levels=np.empty((batch_size, size, size), dtype=np.uint8),
+            codes=np.empty((batch_size, size - 2, size - 2), dtype=np.uint8),
+            bits=np.empty((batch_size, size - 2, size - 2), dtype=bool),
+            indices=np.empty((batch_size, size, size), dtype=np.int64),
+        )
+
+    @property
+    def batch_size(self) -> int:
+        return len(self.batch)
+
+
+def _stretch(crop: np.ndarray, out: np.ndarray):
+    """
+    Resizes the RGB channels of a crop to fill out with nearest neighbour sampling.
+    """
+    rows = np.arange(out.shape[0]) * crop.shape[0] // out.shape[0]
+    cols = np.arange(out.shape[1]) * crop.shape[1] // out.shape[1]
+    out[:] = crop[rows[:, None], cols, :3]
+
+
+def _batch_histograms(values: np.ndarray, bins: int, out: np.ndarray) -> np.ndarray:
+    """
+    Counts the values in [0, bins) of every item of a batch with one bincount, by
+    offsetting each item's values into its own range of bins.
+    """
+    count = len(values)
+    indices = out.reshape(-1)[: values.size].reshape(values.shape)
+    offsets = (np.arange(count) * bins).reshape((count,) + (1,) * (values.ndim - 1))
+    np.add(values, offsets, out=indices)
+    histograms = np.bincount(indices.reshape(-1), minlength=count * bins)
+    return histograms.reshape(count, bins)
+
+
+def _color_features(batch: np.ndarray, buffers: FeatureBuffers) -> np.ndarray:
+    """
+    Gets coarse histograms, means and standard deviations of the RGB channels, all from
+    one full 256 level histogram per channel, which is cheaper than reducing the pixels
+    again for the moments.
+    """
+    count = len(batch)
+    pixels = batch.shape[1] * batch.shape[2]
+    values = np.arange(256, dtype=np.float64)
+    histograms, means, stds = [], [], []
+    for channel in range(3):
+        counts = _batch_histograms(batch[..., channel], 256, buffers.indices)
+        histograms.append(counts.reshape(count, COLOR_BINS, -1).sum(axis=2) / pixels)
+        mean = counts @ values / pixels
+        means.append(mean / 255)
+        stds.append(
+            np.sqrt(np.maximum(counts @ values**2 / pixels - mean**2, 0)) / 255
+        )
+    return np.hstack(histograms + [np.column_stack(means), np.column_stack(stds)])
+
+
+def _lbp_features(gray_levels: np.ndarray, buffers: FeatureBuffers) -> np.ndarray:
+    count, rows, cols = gray_levels.shape
+    center = gray_levels[:, 1:-1, 1:-1]
+    codes = buffers.codes[:count]
+    bits = buffers.bits[:count]
+    codes[:] = 0
+    for bit, (row, col) in enumerate(LBP_NEIGHBOURS):
+        np.greater_equal(
+            gray_levels[:, row : row + rows - 2, col : col + cols - 2], center, out=bits
+        )
+        codes |= bits.view(np.uint8) << np.uint8(7 - bit)
+    histograms = _batch_histograms(LBP_LOOKUP[codes], LBP_BINS, buffers.indices)
+    return histograms / np.float32((rows - 2) * (cols - 2))
+
+
+def _glcm_features(levels: np.ndarray, buffers: FeatureBuffers) -> np.ndarray:
+    """
+    Gets the contrast, homogeneity, energy and correlation of every item's symmetric
+    gray level co-occurrence matrix, averaged over the GLCM_OFFSETS directions.
+    """
+    count, rows, cols = levels.shape
+    i, j = np.indices((GLCM_LEVELS, GLCM_LEVELS), dtype=np.float32)
+    features = np.zeros((count, 4), dtype=np.float32)
+
+    for row_step, col_step in GLCM_OFFSETS:
+        first_cols = slice(max(-col_step, 0), cols - max(col_step, 0))
+        second_cols = slice(max(col_step, 0), cols - max(-col_step, 0))
+        first = levels[:, : rows - row_step, first_cols]
+        second = levels[:, row_step:, second_cols]
+        pairs = first * np.uint8(GLCM_LEVELS) + second
+        matrices = _batch_histograms(
+            pairs, GLCM_LEVELS * GLCM_LEVELS, buffers.indices
+        ).reshape(count, GLCM_LEVELS, GLCM_LEVELS)
+        matrices = (matrices + matrices.transpose(0, 2, 1)).astype(np.float32)
+        matrices /= matrices.sum(axis=(1, 2), keepdims=True)
+
+        means = (matrices * i).sum(axis=(1, 2))
+        variances = (matrices * (i - means[:, None, None]) ** 2).sum(axis=(1, 2))
+        covariances = (
+            matrices * (i - means[:, None, None]) * (j - means[:, None, None])
+        ).sum(axis=(1, 2))
+        # constant crops are perfectly correlated, as in skimage
+        correlations = np.divide(
+            covariances,
+            variances,
+            out=np.ones_like(variances),
+            where=variances > 1e-12,
+        )
+        features += np.column_stack(
+            [
+                (matrices * (i - j) ** 2).sum(axis=(1, 2)),
+                (matrices / (1 + (i - j) ** 2)).sum(axis=(1, 2)),
+                np.sqrt((matrices**2).sum(axis=(1, 2))),
+                correlations,
+            ]
+        )
+    return features / len(GLCM_OFFSETS)
+
+
+def _edge_features(gray: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Gets the fraction of edge pixels and the mean gradient magnitude, from central
+    differences of the gray image.
+    """
+    row_gradients = gray[:, 2:, 1:-1] - gray[:, :-2, 1:-1]
+    col_gradients = gray[:, 1:-1, 2:] - gray[:, 1:-1, :-2]
+    magnitudes = np.hypot(row_gradients, col_gradients)
+    return np.column_stack(
+        [
+            (magnitudes > threshold).mean(axis=(1, 2), dtype=np.float32),
+            magnitudes.mean(axis=(1, 2), dtype=np.float32) / 255,
+        ]
+    )
+
+
+def batch_features(
+    crops: List[np.ndarray],
+    buffers: Optional[FeatureBuffers] = None,
+    edge_threshold=DEFAULT_EDGE_THRESHOLD,
+) -> np.ndarray:
+    """
+    Describes up to buffers.batch_size crops as a (N, len(FEATURE_NAMES)) float32
+    matrix of color histograms and statistics, local binary pattern and gray level
+    co-occurrence texture, and edge density. Crops of any shape are resized to the
+    buffers' size first, so every crop is described at the same scale.
+    """
+    buffers = buffers or FeatureBuffers.for_shape(len(crops))
+    if len(crops) > buffers.batch_size:
+        raise ValueError(f"Got {len(crops)} crops for a batch of {buffers.batch_size}")
+    count = len(crops)
+    batch = buffers.batch[:count]
+
+    with timer("features.resize"):
+        for crop, out in zip(crops, batch):
+            _stretch(crop, out)
+    with timer("features.color"):
+        color = _color_features(batch, buffers)
+
+    gray = np.matmul(batch, GRAY_WEIGHTS, out=buffers.gray[:count])
+    gray_levels = buffers.levels[:count]
+    np.copyto(gray_levels, gray, casting="unsafe")
+    with timer("features.lbp"):
+        lbp = _lbp_features(gray_levels, buffers)
+    with timer("features.glcm"):
+        levels = gray_levels >> np.uint8(8 - GLCM_LEVELS.bit_length() + 1)
+        glcm = _glcm_features(levels, buffers)
+    with timer("features.edges"):
+        edges = _edge_features(gray, edge_threshold)
+
+    return np.hstack([color, lbp, glcm, edges]).astype(np.float32)
+
+
+def extract_features(
+    crops: Iterable[Tuple[crop_id, np.ndarray]],
+    batch_size=DEFAULT_BATCH_SIZE,
+    size=DEFAULT_FEATURE_SIZE,
+    edge_threshold=DEFAULT_EDGE_THRESHOLD,
+) -> Tuple[List[crop_id], np.ndarray]:
+    """
+    Describes (tile, box) keyed crops, such as from classification.iter_tile_crops,
+    in batches sharing one set of scratch buffers. Returns the keys and a float32
+    feature matrix with a row per key.
+    """
+    buffers = FeatureBuffers.for_shape(batch_size, size)
+    keys, matrices, pending = [], [], []
+
+    def flush():
+        matrices.append(batch_features(pending, buffers, edge_threshold))
+        pending.clear()
+
+    for key, crop in crops:
+        keys.append(key)
+        pending.append(crop)
+        if len(pending) == batch_size:
+            flush()
+    if pending:
+        flush()
+
+    if not matrices:
+        return keys, np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    return keys, np.concatenate(matrices)
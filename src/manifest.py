@@ -0,0 +1,258 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from src.scraping import MapType
+
+location = Tuple[float, float]
+
+DEFAULT_PRECISION = 6  # number of coordinate decimals used in manifest keys
+DEFAULT_IMPORT_BATCH = 1000  # files recorded per transaction when backfilling
+
+
+@dataclass(frozen=True)
+class ManifestEntry:
+    map_type: MapType
+    lat: float
+    lon: float
+    zoom: int
+    size: str
+    scale: int
+    path: str
+    num_bytes: int
+    content_hash: str
+    fetched_at: float
+
+
+class ScrapeManifest:
+    """
+    A persistent SQLite index of scraped map images.
+
+    Entries are keyed by (map_type, lat, lon, zoom, size, scale), with coordinates
+    stored as integers at a fixed precision so keys round-trip exactly regardless of
+    how the floats were formatted in filenames.
+    """
+
+    def __init__(self, path=":memory:", precision=DEFAULT_PRECISION):
+        self.path = path
+        self.precision = precision
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                lat INTEGER NOT NULL,
+                lon INTEGER NOT NULL,
+                zoom INTEGER NOT NULL,
+                size TEXT NOT NULL,
+                scale INTEGER NOT NULL,
+                map_type TEXT NOT NULL,
+                path TEXT NOT NULL,
+                num_bytes INTEGER NOT NULL,
+                content_hash TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (lat, lon, zoom, size, scale, map_type)
+            ) WITHOUT ROWID
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def _to_key(self, value: float) -> int:
+        return round(value * 10**self.precision)
+
+    def _from_key(self, value: int) -> float:
+        return value / 10**self.precision
+
+    def _row(
+        self,
+        map_type: MapType,
+        lat: float,
+        lon: float,
+        params: dict,
+        path: str,
+        payload: bytes,
+        fetched_at: Optional[float] = None,
+    ) -> tuple:
+        return (
+            self._to_key(lat),
+            self._to_key(lon),
+            params["zoom"],
+            params["size"],
+            params["scale"],
+            map_type.value,
+            path,
+            len(payload),
+            hashlib.sha256(payload).hexdigest(),
+            time.time() if fetched_at is None else fetched_at,
+        )
+
+    def _insert(self, rows: List[tuple]):
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.connection.commit()
+
+    def record(
+        self,
+        map_type: MapType,
+        lat: float,
+        lon: float,
+        params: dict,
+        path: str,
+        payload: bytes,
+        fetched_at: Optional[float] = None,
+    ):
+        """
+        Records a saved map image. params are the request parameters from
+        GoogleMapsScraper._create_params.
+        """
+        self._insert([self._row(map_type, lat, lon, params, path, payload, fetched_at)])
+
+    def contains(self, map_type: MapType, lat: float, lon: float, params: dict):
+        with self.lock:
+            row = self.connection.execute(
+                """
+                SELECT 1 FROM tiles
+                WHERE lat = ? AND lon = ? AND zoom = ? AND size = ? AND scale = ?
+                    AND map_type = ?
+                """,
+                (
+                    self._to_key(lat),
+                    self._to_key(lon),
+                    params["zoom"],
+                    params["size"],
+                    params["scale"],
+                    map_type.value,
+                ),
+            ).fetchone()
+        return row is not None
+
+    def missing_locations(
+        self,
+        locations: List[location],
+        params: dict,
+        map_types: Iterable[MapType] = (MapType.STREET, MapType.SATELLITE),
+    ) -> List[location]:
+        """
+        Returns the locations, in their original order, that are missing any of the
+        given map types at the zoom, size and scale in params.
+        """
+        map_types = [map_type.value for map_type in map_types]
+
+        with self.lock:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS candidates "
+                "(position INTEGER PRIMARY KEY, lat INTEGER, lon INTEGER)"
+            )
+            self.connection.execute("DELETE FROM candidates")
+            self.connection.executemany(
+                "INSERT INTO candidates VALUES (?, ?, ?)",
+                (
+                    (position, self._to_key(lat), self._to_key(lon))
+                    for position, (lat, lon) in enumerate(locations)
+                ),
+            )
+            rows = self.connection.execute(
+                f"""
+                SELECT c.position FROM candidates c
+                WHERE (
+                    SELECT COUNT(*) FROM tiles t
+                    WHERE t.lat = c.lat AND t.lon = c.lon AND t.zoom = ?
+                        AND t.size = ? AND t.scale = ?
+                        AND t.map_type IN ({", ".join("?" * len(map_types))})
+                ) < ?
+                ORDER BY c.position
+                """,
+                (
+                    params["zoom"],
+                    params["size"],
+                    params["scale"],
+                    *map_types,
+                    len(map_types),
+                ),
+            ).fetchall()
+            self.connection.execute("DELETE FROM candidates")
+
+        return [locations[position] for (position,) in rows]
+
+    def entries(self) -> Iterator[ManifestEntry]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT * FROM tiles ORDER BY fetched_at"
+            ).fetchall()
+
+        for lat, lon, zoom, size, scale, map_type, *rest in rows:
+            yield ManifestEntry(
+                MapType(map_type),
+                self._from_key(lat),
+                self._from_key(lon),
+                zoom,
+                size,
+                scale,
+                *rest,
+            )
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+
+    def import_files(
+        self, scraper, filenames: Iterable[str], batch_size=DEFAULT_IMPORT_BATCH
+    ) -> int:
+        """
+        Backfills the manifest from images saved before it existed, parsing map type and
+        coordinates from filenames made by GoogleMapsScraper._generate_filename. Files
+        are recorded batch_size at a time, one transaction per batch.
+
+        Returns:
+            The number of files recorded.
+        """
+        pattern = re.compile(
+            f"({'|'.join(map_type.value for map_type in MapType)})_"
+            f"{scraper._filename_parser_regex()}"
+        )
+        recorded = 0
+        rows = []
+
+        for filename in filenames:
+            match = pattern.search(os.path.basename(filename))
+            if not match:
+                continue
+
+            map_type, lat, lon = match.groups()
+            map_type, lat, lon = MapType(map_type), float(lat), float(lon)
+            with open(filename, "rb") as f:
+                payload = f.read()
+
+            rows.append(
+                self._row(
+                    map_type,
+                    lat,
+                    lon,
+                    scraper._create_params(map_type, lat, lon),
+                    filename,
+                    payload,
+                    fetched_at=os.path.getmtime(filename),
+                )
+            )
+            if len(rows) == batch_size:
+                self._insert(rows)
+                recorded += len(rows)
+                rows = []
+
+        if rows:
+            self._insert(rows)
+            recorded += len(rows)
+        return recorded
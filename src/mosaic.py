@@ -0,0 +1,251 @@
+import math
+import os
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from src.bounding_boxes import (
+    DEFAULT_BORDER_BUFFER,
+    DEFAULT_CANNY_SIGMA,
+    DEFAULT_GAUSSIAN_SIGMA,
+    DEFAULT_LOGO_MARGIN,
+    DEFAULT_MIN_AREA,
+    DEFAULT_SEGMENTATION,
+    RoofMaskBuffers,
+    _box_areas,
+    _inner_regions,
+    _large_regions,
+    _mask_regions,
+    _roof_mask,
+    box_iou,
+)
+from src.coverage import lat_lon_to_pixel, tile_footprint
+from src.extraction import TilePair
+from src.profiling import timer
+from src.utils import load_image
+
+DEFAULT_WINDOW = 2048  # rows and columns of the core of each processing window
+DEFAULT_HALO = 256  # context around each window, at least the blur radius plus a roof
+DEFAULT_MERGE_IOU = 0.5  # boxes from different windows overlapping more are merged
+DEFAULT_MERGE_CELL = 512  # pixels per side of the grid cells bucketing boxes to merge
+BLUR_TRUNCATE = 4  # gaussian filters are truncated at 4 sigma
+MASK_NAME, SATELLITE_NAME = "mask.u8", "satellite.u8"
+
+window = Tuple[slice, slice]
+
+
+@dataclass
+class Mosaic:
+    """
+    Adjacent tiles stitched onto memory-mapped canvases in Web Mercator pixel space.
+
+    mask is 1 for background and 0 for roofs, as built per tile by find_roof_boxes, so
+    each tile keeps its own roof colors. Pixels no tile covers are background. origin is
+    the image pixel position of the canvas's top left corner at the tiles' zoom and
+    scale.
+    """
+
+    mask: np.memmap
+    satellite: Optional[np.memmap]
+    origin: Tuple[int, int]
+    zoom: int
+    scale: int
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.mask.shape
+
+
+def _tile_corner(pair: TilePair, zoom: int, scale: int, tile_shape) -> Tuple[int, int]:
+    """
+    Gets the (row, col) image pixel position of a tile's top left corner.
+    """
+    x, y = lat_lon_to_pixel(pair.lat, pair.lon, zoom)
+    return (
+        round(y * scale - tile_shape[0] / 2),
+        round(x * scale - tile_shape[1] / 2),
+    )
+
+
+def build_mosaic(
+    pairs: List[TilePair],
+    params: dict,
+    directory: str,
+    satellite=True,
+    logo_margin=DEFAULT_LOGO_MARGIN,
+) -> Mosaic:
+    """
+    Stitches tile pairs into a Mosaic backed by files in directory. params are the
+    request parameters from GoogleMapsScraper._create_params the tiles were scraped
+    with.
+
+    Only one tile is decoded at a time. The bottom logo_margin rows of every tile are
+    left out, so the Google Maps logo isn't mistaken for a roof in the middle of the
+    mosaic; neighbouring tiles fill them in where they overlap.
+    """
+    if not pairs:
+        raise ValueError("A mosaic needs at least one tile")
+
+    zoom, width, height = tile_footprint(params)
+    scale = int(params["scale"])
+    tile_shape = (height * scale, width * scale)
+    corners = [_tile_corner(pair, zoom, scale, tile_shape) for pair in pairs]
+    top = min(row for row, _ in corners)
+    left = min(col for _, col in corners)
+    shape = (
+        max(row for row, _ in corners) - top + tile_shape[0],
+        max(col for _, col in corners) - left + tile_shape[1],
+    )
+
+    os.makedirs(directory, exist_ok=True)
+    mask = np.memmap(
+        os.path.join(directory, MASK_NAME), dtype=np.uint8, mode="w+", shape=shape
+    )
+    mask[:] = 1
+    satellite_canvas = None
+    if satellite:
+        satellite_canvas = np.memmap(
+            os.path.join(directory, SATELLITE_NAME),
+            dtype=np.uint8,
+            mode="w+",
+            shape=shape + (3,),
+        )
+
+    buffers = RoofMaskBuffers.for_shape(tile_shape)
+    kept_rows = tile_shape[0] - logo_margin
+    for pair, (row, col) in zip(pairs, corners):
+        with timer("mosaic.paste"):
+            street_image = load_image(pair.street_path)
+            if street_image.shape[:2] != tile_shape:
+                raise ValueError(
+                    f"Tile {pair.name} is {street_image.shape[:2]}, expected {tile_shape}"
+                )
+            rows = slice(row - top, row - top + kept_rows)
+            cols = slice(col - left, col - left + tile_shape[1])
+            mask[rows, cols] = _roof_mask(street_image, buffers=buffers)[:kept_rows]
+            if satellite_canvas is not None:
+                satellite_canvas[rows, cols] = load_image(pair.satellite_path)[
+                    :kept_rows, :, :3
+                ]
+
+    mask.flush()
+    if satellite_canvas is not None:
+        satellite_canvas.flush()
+    return Mosaic(mask, satellite_canvas, (top, left), zoom, scale)
+
+
+def _windows(shape, window_size: int, halo: int) -> Iterator[Tuple[window, window]]:
+    """
+    Yields the core of every window tiling the canvas and the core grown by halo.
+    """
+    for top in range(0, shape[0], window_size):
+        for left in range(0, shape[1], window_size):
+            core = (
+                slice(top, min(top + window_size, shape[0])),
+                slice(left, min(left + window_size, shape[1])),
+            )
+            region = (
+                slice(max(top - halo, 0), min(core[0].stop + halo, shape[0])),
+                slice(max(left - halo, 0), min(core[1].stop + halo, shape[1])),
+            )
+            yield core, region
+
+
+def _merge_duplicates(bboxes, iou_threshold: float, cell=DEFAULT_MERGE_CELL):
+    """
+    Keeps the largest of every group of boxes overlapping more than iou_threshold.
+
+    Boxes are bucketed in a grid of cell pixels and each is only compared with the kept
+    boxes sharing one of its cells, since boxes that overlap share a cell. Time and
+    memory grow with the number of boxes rather than its square.
+    """
+    if len(bboxes) < 2:
+        return bboxes
+    bboxes = bboxes[np.argsort(-_box_areas(bboxes), kind="stable")]
+    first_cells = (bboxes[:, :2] // cell).tolist()
+    last_cells = (np.maximum(bboxes[:, 2:] - 1, bboxes[:, :2]) // cell).tolist()
+
+    kept_by_cell = defaultdict(list)
+    keep = np.zeros(len(bboxes), dtype=bool)
+    for index, ((top, left), (bottom, right)) in enumerate(
+        zip(first_cells, last_cells)
+    ):
+        cells = [
+            (row, col)
+            for row in range(top, bottom + 1)
+            for col in range(left, right + 1)
+        ]
+        candidates = sorted(
+            {kept for key in cells for kept in kept_by_cell.get(key, ())}
+        )
+        if (
+            candidates
+            and (box_iou(bboxes[index], bboxes[candidates]) > iou_threshold).any()
+        ):
+            continue
+        keep[index] = True
+        for key in cells:
+            kept_by_cell[key].append(index)
+    return bboxes[keep]
+
+
+def find_mosaic_roof_boxes(
+    mosaic: Mosaic,
+    window_size=DEFAULT_WINDOW,
+    halo=DEFAULT_HALO,
+    method=DEFAULT_SEGMENTATION,
+    gaussian_sigma=DEFAULT_GAUSSIAN_SIGMA,
+    canny_sigma=DEFAULT_CANNY_SIGMA,
+    min_area=DEFAULT_MIN_AREA,
+    buffer=DEFAULT_BORDER_BUFFER,
+    merge_iou=DEFAULT_MERGE_IOU,
+) -> np.ndarray:
+    """
+    Finds roofs across a whole mosaic as an (N, 4) int32 array of canvas (min_row,
+    min_col, max_row, max_col) boxes, including the roofs on tile seams that per-tile
+    processing drops at tile borders.
+
+    The mask is segmented in overlapping windows so memory stays bounded by the window
+    size. Each window owns the boxes centered in its core; boxes cut by the edge of
+    the window's halo are left to the window that holds them whole. Boxes found by
+    several windows are then merged. halo must cover the blur radius and should exceed
+    the largest roof.
+    """
+    blur_radius = math.ceil(BLUR_TRUNCATE * (gaussian_sigma + canny_sigma))
+    if halo < blur_radius:
+        raise ValueError(f"halo must be at least the blur radius of {blur_radius}")
+
+    found = []
+    for core, region in _windows(mosaic.shape, window_size, halo):
+        with timer("mosaic.window"):
+            mask = np.asarray(mosaic.mask[region], dtype=bool)
+            bboxes = _mask_regions(mask, method, 1, gaussian_sigma, canny_sigma)
+            bboxes[:, [0, 2]] += region[0].start
+            bboxes[:, [1, 3]] += region[1].start
+
+        centers = (bboxes[:, :2] + bboxes[:, 2:]) // 2
+        owned = (
+            (centers[:, 0] >= core[0].start)
+            & (centers[:, 0] < core[0].stop)
+            & (centers[:, 1] >= core[1].start)
+            & (centers[:, 1] < core[1].stop)
+        )
+        # boxes touching an inner edge of the region continue past it
+        whole = np.ones(len(bboxes), dtype=bool)
+        if region[0].start > 0:
+            whole &= bboxes[:, 0] > region[0].start + buffer
+        if region[1].start > 0:
+            whole &= bboxes[:, 1] > region[1].start + buffer
+        if region[0].stop < mosaic.shape[0]:
+            whole &= bboxes[:, 2] < region[0].stop - buffer
+        if region[1].stop < mosaic.shape[1]:
+            whole &= bboxes[:, 3] < region[1].stop - buffer
+        found.append(bboxes[owned & whole])
+
+    bboxes = np.concatenate(found) if found else np.empty((0, 4), dtype=np.int32)
+    bboxes = bboxes[
+        _large_regions(bboxes, min_area) & _inner_regions(bboxes, mosaic.shape, buffer)
+    ]
+    return _merge_duplicates(bboxes, merge_iou)
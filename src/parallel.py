@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+DEFAULT_TASKS_IN_FLIGHT_PER_PROCESS = 2
+
+
+def imap_bounded(
+    function: Callable,
+    items: Iterable,
+    processes: Optional[int] = None,
+    max_in_flight: Optional[int] = None,
+    initializer: Optional[Callable] = None,
+    initargs: tuple = (),
+) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """
+    Calls the picklable function on every item over a process pool, yielding
+    (item, result, error) as tasks finish, where error is the exception the task raised
+    and result is None if it did.
+
+    At most max_in_flight tasks, by default two per process, are submitted at once, so
+    the inputs and results of a city's worth of tiles never pile up in memory. With one
+    process items run in order in this process, after calling initializer, so nothing
+    is pickled.
+    """
+    processes = processes or os.cpu_count() or 1
+    max_in_flight = max_in_flight or processes * DEFAULT_TASKS_IN_FLIGHT_PER_PROCESS
+
+    if processes == 1:
+        if initializer is not None:
+            initializer(*initargs)
+        for item in items:
+            try:
+                result = function(item)
+            except Exception as error:
+                yield item, None, error
+            else:
+                yield item, result, None
+        return
+
+    # imported here so pool workers don't pay for it
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=processes, initializer=initializer, initargs=initargs
+    ) as executor:
+        remaining = iter(items)
+        in_flight = {}
+
+        while True:
+            for item in remaining:
+                in_flight[executor.submit(function, item)] = item
+                if len(in_flight) >= max_in_flight:
+                    break
+            if not in_flight:
+                break
+
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    yield item, None, error
+                else:
+                    yield item, result, None
@@ -18,6 +18,21 @@ def crop_image(image: np.ndarray, min_y, min_x, max_y, max_x, buffer=5):
     return cropped_image
 
 
+def crop_images(image: np.ndarray, bboxes, buffer=5) -> List[np.ndarray]:
+    """
+    Crops every (min_row, min_col, max_row, max_col) box from find_roof_boxes like
+    crop_image, clipping all boxes to the image at once. Crops are views of the image.
+    """
+    bboxes = np.asarray(bboxes).reshape(-1, 4)
+    mins = np.maximum(bboxes[:, :2] - buffer, 0)
+    maxs = np.minimum(bboxes[:, 2:] + buffer, image.shape[:2])
+
+    return [
+        image[min_y : max_y + 1, min_x : max_x + 1]
+        for (min_y, min_x), (max_y, max_x) in zip(mins.tolist(), maxs.tolist())
+    ]
+
+
 def save_images(
     filesystem, images: List[np.ndarray], directory: str, parent_filename: str
 ):
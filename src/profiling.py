@@ -0,0 +1,166 @@
+import functools
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_MAX_SAMPLES = 10000  # durations kept per stage for percentiles
+QUANTILES = (0.5, 0.95, 0.99)
+PROMETHEUS_METRIC = "estatevision_stage_seconds"
+
+# the enabled registry, None when profiling is off
+_registry = None
+_disabled = nullcontext()
+
+
+class StageTimings:
+    """
+    Exact count, total and max of a stage's durations, plus a uniform reservoir sample
+    of at most max_samples of them for percentiles, so memory stays bounded.
+    """
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES, rng=None):
+        self.max_samples = max_samples
+        self.rng = rng or random.Random()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: List[float] = []
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(seconds)
+        else:
+            index = self.rng.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = seconds
+
+    def quantiles(self, quantiles=QUANTILES) -> Dict[float, float]:
+        if not self.samples:
+            return {quantile: 0.0 for quantile in quantiles}
+        values = np.quantile(self.samples, quantiles)
+        return dict(zip(quantiles, values.tolist()))
+
+    def summary(self) -> dict:
+        quantiles = self.quantiles()
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": quantiles[0.5],
+            "p95": quantiles[0.95],
+            "p99": quantiles[0.99],
+            "max": self.max,
+        }
+
+
+class TimerRegistry:
+    """
+    Collects durations per named stage, for example "find_roof_boxes.canny".
+
+    Registries are per process: stages run in a ProcessPoolExecutor are only recorded
+    if profiling is enabled in the workers too.
+    """
+
+    def __init__(self, max_samples=DEFAULT_MAX_SAMPLES, clock=time.perf_counter):
+        self.max_samples = max_samples
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.stages: Dict[str, StageTimings] = {}
+
+    def record(self, stage: str, seconds: float):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = StageTimings(self.max_samples)
+            self.stages[stage].add(seconds)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.record(stage, self.clock() - start)
+
+    def reset(self):
+        with self.lock:
+            self.stages.clear()
+
+    def as_dict(self) -> Dict[str, dict]:
+        with self.lock:
+            return {name: self.stages[name].summary() for name in sorted(self.stages)}
+
+    def to_json(self, **kwargs) -> str:
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def to_prometheus(self, metric=PROMETHEUS_METRIC) -> str:
+        """
+        Formats the timings as a Prometheus summary in the text exposition format.
+        """
+        lines = [
+            f"# HELP {metric} Duration of EstateVision pipeline stages.",
+            f"# TYPE {metric} summary",
+        ]
+        with self.lock:
+            for name in sorted(self.stages):
+                timings = self.stages[name]
+                for quantile, value in timings.quantiles().items():
+                    lines.append(
+                        f'{metric}{{stage="{name}",quantile="{quantile}"}} {value}'
+                    )
+                lines.append(f'{metric}_sum{{stage="{name}"}} {timings.total}')
+                lines.append(f'{metric}_count{{stage="{name}"}} {timings.count}')
+        return "\n".join(lines) + "\n"
+
+
+def enable(registry: Optional[TimerRegistry] = None) -> TimerRegistry:
+    """
+    Starts recording stage timings into registry, or a new registry.
+    """
+    global _registry
+    _registry = registry or TimerRegistry()
+    return _registry
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def get_registry() -> Optional[TimerRegistry]:
+    return _registry
+
+
+def timer(stage: str):
+    """
+    Times a block as stage when profiling is enabled. When disabled this returns a
+    shared no-op context manager, so instrumented code pays only a function call.
+    """
+    if _registry is None:
+        return _disabled
+    return _registry.timer(stage)
+
+
+def timed(stage: str):
+    """
+    Decorator timing every call of a function as stage when profiling is enabled.
+    """
+
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _registry is None:
+                return function(*args, **kwargs)
+            with _registry.timer(stage):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
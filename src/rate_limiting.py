@@ -0,0 +1,198 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+DEFAULT_QPS = 50  # Static Maps API requests per second
+DEFAULT_BURST = 10  # requests allowed back to back before throttling
+DEFAULT_DAILY_BUDGET = 25000  # requests per day
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BASE_DELAY = 1.0  # seconds before the first retry
+DEFAULT_MAX_DELAY = 60.0  # seconds cap on a single backoff
+SECONDS_PER_DAY = 24 * 60 * 60
+
+THROTTLED_STATUS_CODE = 429
+RETRYABLE_STATUS_CODES = {THROTTLED_STATUS_CODE, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket allowing rate requests per second with bursts of up to
+    capacity requests.
+    """
+
+    def __init__(self, rate=DEFAULT_QPS, capacity=DEFAULT_BURST, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated_at = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes a token, returning how many seconds the caller has to wait before using it.
+        """
+        with self.lock:
+            now = self.clock()
+            elapsed = now - self.updated_at
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            return max(-self.tokens / self.rate, 0)
+
+
+class DailyBudget:
+    """
+    Counts requests against a daily quota that resets at midnight UTC.
+    """
+
+    def __init__(self, limit=DEFAULT_DAILY_BUDGET, clock=time.time):
+        self.limit = limit
+        self.clock = clock
+        self.day = self._current_day()
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def _current_day(self):
+        return int(self.clock() // SECONDS_PER_DAY)
+
+    @property
+    def remaining(self) -> int:
+        with self.lock:
+            if self._current_day() != self.day:
+                return self.limit
+            return self.limit - self.used
+
+    def consume(self) -> float:
+        """
+        Takes one request from today's budget. Returns 0 on success, otherwise the
+        seconds until the budget resets.
+        """
+        with self.lock:
+            day = self._current_day()
+            if day != self.day:
+                self.day = day
+                self.used = 0
+
+            if self.used >= self.limit:
+                return (day + 1) * SECONDS_PER_DAY - self.clock()
+
+            self.used += 1
+            return 0
+
+
+class RetriesExhausted(OSError):
+    """
+    Raised when a request is still throttled or erroring after every retry, so callers
+    retry or release it like any other failed request instead of dropping it.
+    """
+
+    def __init__(self, response):
+        super().__init__(
+            f"Request still failing with status code "
+            f"{getattr(response, 'status_code', None)} after retries"
+        )
+        self.response = response
+
+
+@dataclass
+class RateLimitStats:
+    sent: int = 0
+    throttled: int = 0
+    retried: int = 0
+    failed: int = 0
+
+
+class RateLimitScheduler:
+    """
+    Schedules requests under a QPS token bucket and an optional daily budget.
+
+    Throttled (429) and server error (5xx) responses are retried with exponential
+    backoff and full jitter. When the daily budget runs out the scheduler pauses until
+    it resets instead of dropping the request. These waits happen outside send(), so a
+    timeout on the HTTP request never cuts a pause short or counts it as a failure.
+    """
+
+    def __init__(
+        self,
+        bucket: Optional[TokenBucket] = None,
+        daily_budget: Optional[DailyBudget] = None,
+        max_retries=DEFAULT_MAX_RETRIES,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=DEFAULT_MAX_DELAY,
+        sleep=time.sleep,
+        rng=None,
+    ):
+        self.bucket = bucket or TokenBucket()
+        self.daily_budget = daily_budget
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.sleep = sleep
+        self.rng = rng or random.Random()
+        self.stats = RateLimitStats()
+        self.lock = threading.Lock()
+
+    def _count(self, counter: str):
+        with self.lock:
+            setattr(self.stats, counter, getattr(self.stats, counter) + 1)
+
+    def backoff_delay(self, attempt: int, response=None) -> float:
+        """
+        Seconds to wait before retrying. Honors a Retry-After header when present.
+        """
+        retry_after = getattr(response, "headers", None) or {}
+        retry_after = retry_after.get("Retry-After")
+        if retry_after is not None and str(retry_after).isdigit():
+            return min(float(retry_after), self.max_delay)
+
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _wait_for_capacity(self):
+        if self.daily_budget is not None:
+            while True:
+                wait = self.daily_budget.consume()
+                if not wait:
+                    break
+                print(f"Daily request budget exhausted, pausing for {wait:.0f} seconds")
+                self.sleep(wait)
+
+        wait = self.bucket.reserve()
+        if wait > 0:
+            self.sleep(wait)
+
+    def request(self, send):
+        """
+        Calls send() once capacity is available, retrying retryable responses.
+        Exceptions raised by send() are counted as failed and propagate to the caller,
+        and so does a RetriesExhausted once max_retries retries still got throttled or
+        server errors.
+
+        Returns:
+            The first response that isn't retryable.
+        """
+        attempt = 0
+        while True:
+            self._wait_for_capacity()
+            self._count("sent")
+            try:
+                response = send()
+            except Exception:
+                self._count("failed")
+                raise
+
+            status_code = getattr(response, "status_code", None)
+            if status_code == THROTTLED_STATUS_CODE:
+                self._count("throttled")
+            if status_code not in RETRYABLE_STATUS_CODES:
+                return response
+
+            if attempt >= self.max_retries:
+                self._count("failed")
+                raise RetriesExhausted(response)
+
+            self._count("retried")
+            self.sleep(self.backoff_delay(attempt, response))
+            attempt += 1
@@ -0,0 +1,245 @@
+import math
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from src.coverage import lat_lon_to_pixel, pixels_to_lat_lon, tile_footprint
+
+DEFAULT_MERGE_IOU = 0.5  # roofs overlapping more in lat/lon are the same roof
+EARTH_RADIUS_METERS = 6371008.8  # mean radius
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_METERS / 180  # along a meridian
+WINDOW_MARGIN = 1.01  # grows search windows past the great circle distance
+NEAREST_START_METERS = 50  # first search radius of nearest queries
+
+
+@dataclass(frozen=True)
+class Roof:
+    id: int
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+    observations: int  # number of tiles the roof was found in
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return (self.min_lat + self.max_lat) / 2, (self.min_lon + self.max_lon) / 2
+
+
+def pixel_boxes_to_lat_lon(bboxes, top: float, left: float, zoom: int, scale: int):
+    """
+    Converts (min_row, min_col, max_row, max_col) pixel boxes of an image whose top left
+    corner is at image pixel (top, left) to an (N, 4) array of (min_lat, min_lon,
+    max_lat, max_lon). Image pixels are Web Mercator pixels at zoom times scale.
+    """
+    bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+    rows = (bboxes[:, [2, 0]] + top) / scale
+    cols = (bboxes[:, [1, 3]] + left) / scale
+    lats, lons = pixels_to_lat_lon(cols, rows, zoom)
+    # the bottom row is the southern edge
+    return np.column_stack([lats[:, 0], lons[:, 0], lats[:, 1], lons[:, 1]])
+
+
+def tile_boxes_to_lat_lon(bboxes, lat: float, lon: float, params: dict):
+    """
+    Converts pixel boxes found in a tile centered at (lat, lon) to lat/lon boxes, using
+    the zoom, size and scale from GoogleMapsScraper._create_params.
+    """
+    zoom, width, height = tile_footprint(params)
+    scale = int(params["scale"])
+    x, y = lat_lon_to_pixel(lat, lon, zoom)
+    top = (y - height / 2) * scale
+    left = (x - width / 2) * scale
+    return pixel_boxes_to_lat_lon(bboxes, top, left, zoom, scale)
+
+
+def _geo_iou(box, others: np.ndarray) -> np.ndarray:
+    heights = np.minimum(box[2], others[:, 2]) - np.maximum(box[0], others[:, 0])
+    widths = np.minimum(box[3], others[:, 3]) - np.maximum(box[1], others[:, 1])
+    intersections = np.clip(heights, 0, None) * np.clip(widths, 0, None)
+    areas = (box[2] - box[0]) * (box[3] - box[1])
+    other_areas = (others[:, 2] - others[:, 0]) * (others[:, 3] - others[:, 1])
+    unions = areas + other_areas - intersections
+    return np.divide(intersections, unions, out=np.zeros_like(unions), where=unions > 0)
+
+
+def _haversine_meters(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_METERS * np.arcsin(np.sqrt(a))
+
+
+class RoofIndex:
+    """
+    A persistent SQLite R*Tree of georeferenced roof boxes.
+
+    Exact coordinates are kept in a roofs table next to the R*Tree, which stores 32-bit
+    floats rounded outwards and only serves to find candidates. Inserted boxes that
+    overlap an indexed roof by more than merge_iou in lat/lon are merged into it, so
+    roofs seen by several overlapping tiles are stored once.
+    """
+
+    def __init__(self, path=":memory:", merge_iou=DEFAULT_MERGE_IOU):
+        self.path = path
+        self.merge_iou = merge_iou
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS roofs (
+                id INTEGER PRIMARY KEY,
+                min_lat REAL NOT NULL,
+                min_lon REAL NOT NULL,
+                max_lat REAL NOT NULL,
+                max_lon REAL NOT NULL,
+                observations INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS roof_tree USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            );
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            (count,) = self.connection.execute("SELECT COUNT(*) FROM roofs").fetchone()
+        return count
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon) -> List[tuple]:
+        return self.connection.execute(
+            """
+            SELECT roofs.* FROM roof_tree JOIN roofs USING (id)
+            WHERE roof_tree.max_lat >= ? AND roof_tree.min_lat <= ?
+                AND roof_tree.max_lon >= ? AND roof_tree.min_lon <= ?
+            """,
+            (min_lat, max_lat, min_lon, max_lon),
+        ).fetchall()
+
+    def _insert_one(self, box) -> int:
+        candidates = self._candidates(*box)
+        if candidates:
+            rows = np.array(candidates, dtype=np.float64)
+            ious = _geo_iou(box, rows[:, 1:5])
+            best = int(np.argmax(ious))
+            if ious[best] > self.merge_iou:
+                # average the observations of the roof, weighted by their count
+                roof_id, observations = int(rows[best, 0]), int(rows[best, 5])
+                merged = (rows[best, 1:5] * observations + box) / (observations + 1)
+                self.connection.execute(
+                    "UPDATE roofs SET min_lat = ?, min_lon = ?, max_lat = ?, "
+                    "max_lon = ?, observations = ? WHERE id = ?",
+                    (*merged.tolist(), observations + 1, roof_id),
+                )
+                self.connection.execute(
+                    "UPDATE roof_tree SET min_lat = ?, max_lat = ?, min_lon = ?, "
+                    "max_lon = ? WHERE id = ?",
+                    (merged[0], merged[2], merged[1], merged[3], roof_id),
+                )
+                return roof_id
+
+        cursor = self.connection.execute(
+            "INSERT INTO roofs (min_lat, min_lon, max_lat, max_lon, observations) "
+            "VALUES (?, ?, ?, ?, 1)",
+            tuple(box.tolist()),
+        )
+        self.connection.execute(
+            "INSERT INTO roof_tree VALUES (?, ?, ?, ?, ?)",
+            (cursor.lastrowid, box[0], box[2], box[1], box[3]),
+        )
+        return cursor.lastrowid
+
+    def insert(self, boxes) -> List[int]:
+        """
+        Inserts (N, 4) (min_lat, min_lon, max_lat, max_lon) boxes in one transaction,
+        merging duplicates. Returns the roof id of every box.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        with self.lock:
+            ids = [self._insert_one(box) for box in boxes]
+            self.connection.commit()
+        return ids
+
+    def insert_tile(self, bboxes, lat: float, lon: float, params: dict) -> List[int]:
+        """
+        Inserts the pixel boxes find_roof_boxes found in a tile centered at (lat, lon).
+        """
+        return self.insert(tile_boxes_to_lat_lon(bboxes, lat, lon, params))
+
+    def query(self, min_lat, min_lon, max_lat, max_lon) -> List[Roof]:
+        """
+        Gets the roofs intersecting a lat/lon range.
+        """
+        with self.lock:
+            rows = self._candidates(min_lat, min_lon, max_lat, max_lon)
+        return [
+            Roof(*row)
+            for row in rows
+            if row[3] >= min_lat
+            and row[1] <= max_lat
+            and row[4] >= min_lon
+            and row[2] <= max_lon
+        ]
+
+    def get(self, roof_id: int) -> Optional[Roof]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT * FROM roofs WHERE id = ?", (roof_id,)
+            ).fetchone()
+        return Roof(*row) if row else None
+
+    def nearest(
+        self, lat: float, lon: float, k=1, max_meters: Optional[float] = None
+    ) -> List[Tuple[Roof, float]]:
+        """
+        Gets the k roofs whose centers are closest to (lat, lon), with their distances
+        in meters, optionally within max_meters.
+
+        The search window grows until it holds k roofs, then is widened once more to the
+        k-th distance, since a closer roof may sit in a corner outside a square window.
+        """
+        if not len(self):
+            return []
+
+        if max_meters is not None:
+            roofs = self._within(lat, lon, max_meters)
+            return [(roof, meters) for roof, meters in roofs if meters <= max_meters][
+                :k
+            ]
+
+        radius = NEAREST_START_METERS
+        roofs = self._within(lat, lon, radius)
+        while len(roofs) < k and radius < math.pi * EARTH_RADIUS_METERS:
+            radius *= 4
+            roofs = self._within(lat, lon, radius)
+
+        if len(roofs) >= k:
+            roofs = self._within(lat, lon, roofs[k - 1][1])
+        return roofs[:k]
+
+    def _within(self, lat: float, lon: float, meters: float):
+        """
+        Gets the roofs in a square window around (lat, lon), sorted by center distance.
+        """
+        lat_span = meters * WINDOW_MARGIN / METERS_PER_DEGREE
+        lon_span = lat_span / max(math.cos(math.radians(lat)), 1e-6)
+        roofs = self.query(
+            lat - lat_span, lon - lon_span, lat + lat_span, lon + lon_span
+        )
+        if not roofs:
+            return []
+        centers = np.array([roof.center for roof in roofs])
+        distances = _haversine_meters(lat, lon, centers[:, 0], centers[:, 1])
+        order = np.argsort(distances, kind="stable")
+        return [(roofs[i], float(distances[i])) for i in order]
@@ -1,6 +1,14 @@
 import enum
 import os
-from typing import Optional
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional
+
+from src.profiling import timed, timer
+
+DEFAULT_TIMEOUT = 30  # seconds per HTTP request to the API
+DEFAULT_SAVE_WORKERS = 2
+DEFAULT_MAX_PENDING_SAVES = 32  # payloads held in memory waiting to be saved
 
 
 class MapType(enum.Enum):
@@ -31,9 +39,22 @@ class GoogleMapsScraper:
     A class for scraping static map images from Google Maps API.
 
     This class allows you to retrieve static map images from Google Maps at specific coordinates and save them to a specified directory.
+    An optional RateLimitScheduler keeps requests within the API's QPS and daily quota,
+    an optional ScrapeManifest records every saved image, and an optional TileCache
+    serves repeated requests without calling the API.
     """
 
-    def __init__(self, api_key: str, save_dir: str, requests, filesystem):
+    def __init__(
+        self,
+        api_key: str,
+        save_dir: str,
+        requests,
+        filesystem,
+        timeout: Optional[float] = None,
+        scheduler=None,
+        manifest=None,
+        cache=None,
+    ):
         if api_key is None:
             raise ValueError("Google Maps API key is missing.")
 
@@ -41,6 +62,10 @@ class GoogleMapsScraper:
         self.save_dir = save_dir
         self.requests = requests
         self.filesystem = filesystem
+        self.timeout = timeout
+        self.scheduler = scheduler
+        self.manifest = manifest
+        self.cache = cache
 
     @classmethod
     def _generate_filename(self, map_type: MapType, lat: float, lon: float):
@@ -70,31 +95,147 @@ class GoogleMapsScraper:
             "key": self.api_key,
         }
 
-    def scrape_map_image(
+    def _get(self, url: str, params: dict):
+        """
+        Sends a GET request, forwarding the timeout when one is configured.
+        """
+        if self.timeout is None:
+            return self.requests.get(url, params=params)
+        return self.requests.get(url, params=params, timeout=self.timeout)
+
+    def fetch_map_image(
         self,
         map_type: MapType,
         lat: float,
         lon: float,
-    ) -> Optional[str]:
+    ) -> Optional[bytes]:
         """
-        Scrape a static map from Google Maps at the given coordinates, and save it to the scraper's save directory.
+        Fetch a static map from Google Maps at the given coordinates without saving it.
+        With a scheduler, requests still throttled after its retries raise
+        RetriesExhausted, so they are retried by the caller rather than dropped.
 
         Returns:
-            The filename of the saved map image, or None if an error occurred.
+            The encoded map image, or None if an error occurred.
         """
         url = "https://maps.googleapis.com/maps/api/staticmap"
         params = self._create_params(map_type, lat, lon)
-        response = self.requests.get(url, params=params)
+        if self.cache is not None:
+            payload = self.cache.get(params)
+            if payload is not None:
+                return payload
+
+        with timer("scrape.request"):
+            if self.scheduler is None:
+                response = self._get(url, params)
+            else:
+                # rate limited, retrying throttled and server errors
+                response = self.scheduler.request(lambda: self._get(url, params))
 
         if response.status_code == 200:
-            filename = self._generate_filename(map_type, lat, lon)
-            return self.filesystem.save_to_path(
-                self.save_dir,
-                filename,
-                response.content,
-            )
-        else:
-            print(
-                f"Map Image request at ({lat}, {lon}) errored with status code: {response.status_code}"
-            )
+            if self.cache is not None:
+                self.cache.put(params, response.content)
+            return response.content
+        print(
+            f"Map Image request at ({lat}, {lon}) errored with status code: {response.status_code}"
+        )
+        return None
+
+    @timed("scrape.save")
+    def save_map_image(
+        self,
+        map_type: MapType,
+        lat: float,
+        lon: float,
+        payload: bytes,
+    ) -> Optional[str]:
+        """
+        Save a fetched map image to the scraper's save directory and record it in the
+        manifest.
+
+        Returns:
+            The filename of the saved map image, or None if an error occurred.
+        """
+        filename = self._generate_filename(map_type, lat, lon)
+        path = self.filesystem.save_to_path(self.save_dir, filename, payload)
+        if path and self.manifest is not None:
+            params = self._create_params(map_type, lat, lon)
+            self.manifest.record(map_type, lat, lon, params, path, payload)
+        return path
+
+    @timed("scrape")
+    def scrape_map_image(
+        self,
+        map_type: MapType,
+        lat: float,
+        lon: float,
+    ) -> Optional[str]:
+        """
+        Scrape a static map from Google Maps at the given coordinates, and save it to the scraper's save directory.
+
+        Returns:
+            The filename of the saved map image, or None if an error occurred.
+        """
+        payload = self.fetch_map_image(map_type, lat, lon)
+        if payload is None:
             return None
+        return self.save_map_image(map_type, lat, lon, payload)
+
+
+class BackgroundSaver:
+    """
+    Saves fetched map images on background threads so disk writes stay off the
+    critical path of processing them in memory.
+
+    At most max_pending images wait to be written; submitting more blocks until one is
+    saved, so a slow disk can't make payloads pile up in memory.
+    """
+
+    def __init__(
+        self,
+        scraper: GoogleMapsScraper,
+        max_workers=DEFAULT_SAVE_WORKERS,
+        max_pending=DEFAULT_MAX_PENDING_SAVES,
+    ):
+        self.scraper = scraper
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.saved: List[str] = []
+        self.failed = 0
+
+    def _save(self, map_type: MapType, lat: float, lon: float, payload: bytes):
+        try:
+            path = self.scraper.save_map_image(map_type, lat, lon, payload)
+        except Exception as error:
+            print(f"Saving map image at ({lat}, {lon}) failed: {error!r}")
+            path = None
+        finally:
+            self.pending.release()
+
+        with self.lock:
+            if path:
+                self.saved.append(path)
+            else:
+                self.failed += 1
+        return path
+
+    def submit(
+        self, map_type: MapType, lat: float, lon: float, payload: bytes
+    ) -> Future:
+        """
+        Queues a map image to be saved, returning a future of its path.
+        """
+        self.pending.acquire()
+        return self.executor.submit(self._save, map_type, lat, lon, payload)
+
+    def close(self):
+        """
+        Waits for every queued image to be saved.
+        """
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,7 +1,26 @@
+import functools
 import os
 
-import dotenv
+DEFAULT_COST_PER_1000 = 2.0  # Static Maps API USD per 1000 requests
 
-dotenv.load_dotenv()
 
-google_maps_api_key = os.environ.get("GOOGLE_MAPS_API_KEY")
+@functools.lru_cache(maxsize=None)
+def _load_environment():
+    import dotenv
+
+    dotenv.load_dotenv()
+
+
+def get_setting(name: str, default=None):
+    """
+    Reads a setting from the environment, loading the .env file the first time a
+    setting is needed rather than on import.
+    """
+    _load_environment()
+    return os.environ.get(name, default)
+
+
+def __getattr__(name):
+    if name == "google_maps_api_key":
+        return get_setting("GOOGLE_MAPS_API_KEY")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
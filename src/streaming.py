@@ -0,0 +1,277 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from src.crawling import DEFAULT_MAX_CONCURRENCY, location
+from src.extraction import DEFAULT_CROP_BUFFER, TilePair, crop_roofs, crop_tile
+from src.scraping import BackgroundSaver, GoogleMapsScraper, MapType
+from src.utils import decode_image
+
+DEFAULT_QUEUE_SIZE = 8  # items buffered between two stages
+DEFAULT_SEGMENT_WORKERS = 2
+
+_DONE = object()  # end of stream marker passed between stages
+
+
+@dataclass
+class StageStats:
+    """
+    Throughput and backpressure counters of one pipeline stage. blocked_seconds is the
+    time workers spent waiting for room in the downstream queue.
+    """
+
+    name: str
+    processed: int = 0
+    dropped: int = 0
+    busy_seconds: float = 0.0
+    blocked_seconds: float = 0.0
+    max_queue_size: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    finished_at: Optional[float] = None
+
+    @property
+    def items_per_second(self) -> float:
+        elapsed = (self.finished_at or time.perf_counter()) - self.started_at
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "busy_seconds": self.busy_seconds,
+            "blocked_seconds": self.blocked_seconds,
+            "max_queue_size": self.max_queue_size,
+            "items_per_second": self.items_per_second,
+        }
+
+
+@dataclass(frozen=True)
+class TilePayload:
+    """
+    The encoded images of a tile fetched without saving them first.
+    """
+
+    lat: float
+    lon: float
+    street: bytes
+    satellite: bytes
+
+    @property
+    def name(self) -> str:
+        return f"{self.lat}_{self.lon}"
+
+
+@dataclass
+class TileCrops:
+    name: str
+    bboxes: np.ndarray
+    crops: List[np.ndarray]
+
+
+def segment_tile(
+    tile: Union[TilePair, TilePayload], buffer, find_kwargs: dict
+) -> TileCrops:
+    if isinstance(tile, TilePayload):
+        street_image = decode_image(tile.street)
+        satellite_image = decode_image(tile.satellite)
+        bboxes, crops = crop_roofs(street_image, satellite_image, buffer, **find_kwargs)
+    else:
+        bboxes, crops = crop_tile(tile, buffer, **find_kwargs)
+    return TileCrops(tile.name, bboxes, crops)
+
+
+class StreamingPipeline:
+    """
+    Streams crawl locations through fetching, segmentation and cropping.
+
+    Stages are connected by bounded asyncio queues, so CPU-bound segmentation overlaps
+    with network-bound fetching while a slow stage makes the ones before it wait
+    instead of buffering without limit. Memory stays flat regardless of how many
+    locations are streamed.
+
+    With in_memory, fetched images are passed to segmentation as encoded bytes and
+    decoded there instead of being saved and read back from disk. They are then only
+    saved if a BackgroundSaver is given, off the critical path.
+    """
+
+    def __init__(
+        self,
+        scraper: GoogleMapsScraper,
+        fetch_workers=DEFAULT_MAX_CONCURRENCY,
+        segment_workers=DEFAULT_SEGMENT_WORKERS,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        segment_executor: Optional[Executor] = None,
+        buffer=DEFAULT_CROP_BUFFER,
+        in_memory=False,
+        saver: Optional[BackgroundSaver] = None,
+        **find_kwargs,
+    ):
+        self.scraper = scraper
+        self.fetch_workers = fetch_workers
+        self.segment_workers = segment_workers
+        self.queue_size = queue_size
+        self.segment_executor = segment_executor
+        self.buffer = buffer
+        self.in_memory = in_memory
+        self.saver = saver
+        self.find_kwargs = find_kwargs
+        self.stats: Dict[str, StageStats] = {}
+
+    def report(self) -> Dict[str, dict]:
+        return {name: stats.as_dict() for name, stats in self.stats.items()}
+
+    async def _put(self, queue: asyncio.Queue, item, stats: StageStats):
+        start = time.perf_counter()
+        await queue.put(item)
+        stats.blocked_seconds += time.perf_counter() - start
+        stats.max_queue_size = max(stats.max_queue_size, queue.qsize())
+
+    async def _source(self, locations: Iterable[location], output: asyncio.Queue):
+        stats = self.stats["crawl"]
+        for lat, lon in locations:
+            stats.processed += 1
+            await self._put(output, (lat, lon), stats)
+        stats.finished_at = time.perf_counter()
+
+    async def _run_stage(self, name, workers, process, input, output):
+        """
+        Runs workers applying process to items from input until the end of stream
+        marker, forwarding results that aren't None to output.
+        """
+        stats = self.stats[name]
+
+        async def worker():
+            while True:
+                item = await input.get()
+                if item is _DONE:
+                    return
+                start = time.perf_counter()
+                try:
+                    result = await process(item)
+                except Exception as error:
+                    print(f"Pipeline stage {name} failed on {item}: {error!r}")
+                    result = None
+                stats.busy_seconds += time.perf_counter() - start
+
+                if result is None:
+                    stats.dropped += 1
+                    continue
+                stats.processed += 1
+                await self._put(output, result, stats)
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        stats.finished_at = time.perf_counter()
+
+    async def _fetch(self, fetch_executor, item) -> Union[TilePair, TilePayload, None]:
+        loop = asyncio.get_running_loop()
+        lat, lon = item
+        fetch = (
+            self.scraper.fetch_map_image
+            if self.in_memory
+            else self.scraper.scrape_map_image
+        )
+        street, satellite = await asyncio.gather(
+            *[
+                loop.run_in_executor(fetch_executor, fetch, map_type, lat, lon)
+                for map_type in [MapType.STREET, MapType.SATELLITE]
+            ]
+        )
+        if not street or not satellite:
+            return None
+        if not self.in_memory:
+            return TilePair(lat, lon, street, satellite)
+
+        if self.saver is not None:
+            for map_type, payload in [
+                (MapType.STREET, street),
+                (MapType.SATELLITE, satellite),
+            ]:
+                # may wait for the saver to catch up, so kept off the event loop
+                await loop.run_in_executor(
+                    fetch_executor, self.saver.submit, map_type, lat, lon, payload
+                )
+        return TilePayload(lat, lon, street, satellite)
+
+    async def _segment(
+        self, segment_executor, tile: Union[TilePair, TilePayload]
+    ) -> TileCrops:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            segment_executor, segment_tile, tile, self.buffer, self.find_kwargs
+        )
+
+    async def stream(self, locations: Iterable[location]) -> AsyncIterator[TileCrops]:
+        """
+        Yields the crops of every tile as soon as it is segmented. locations may be a
+        lazy generator such as iter_crawl_locations or plan_coverage.
+        """
+        self.stats = {
+            name: StageStats(name) for name in ["crawl", "fetch", "segment", "output"]
+        }
+        locations_queue = asyncio.Queue(self.queue_size)
+        tiles_queue = asyncio.Queue(self.queue_size)
+        crops_queue = asyncio.Queue(self.queue_size)
+
+        fetch_executor = ThreadPoolExecutor(max_workers=self.fetch_workers * 2)
+        segment_executor = self.segment_executor or ProcessPoolExecutor(
+            max_workers=self.segment_workers
+        )
+
+        async def crawl():
+            await self._source(locations, locations_queue)
+            for _ in range(self.fetch_workers):
+                await locations_queue.put(_DONE)
+
+        async def fetch():
+            await self._run_stage(
+                "fetch",
+                self.fetch_workers,
+                lambda item: self._fetch(fetch_executor, item),
+                locations_queue,
+                tiles_queue,
+            )
+            for _ in range(self.segment_workers):
+                await tiles_queue.put(_DONE)
+
+        async def segment():
+            await self._run_stage(
+                "segment",
+                self.segment_workers,
+                lambda tile: self._segment(segment_executor, tile),
+                tiles_queue,
+                crops_queue,
+            )
+            await crops_queue.put(_DONE)
+
+        tasks = [asyncio.create_task(stage()) for stage in [crawl, fetch, segment]]
+        output_stats = self.stats["output"]
+        try:
+            while True:
+                tile_crops = await crops_queue.get()
+                if tile_crops is _DONE:
+                    break
+                output_stats.processed += 1
+                start = time.perf_counter()
+                yield tile_crops
+                output_stats.busy_seconds += time.perf_counter() - start
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            output_stats.finished_at = time.perf_counter()
+            fetch_executor.shutdown(wait=False)
+            if self.segment_executor is None:
+                segment_executor.shutdown(wait=False)
+
+    async def run(self, locations: Iterable[location], sink) -> Dict[str, dict]:
+        """
+        Streams every location through the pipeline, passing each tile's crops to
+        sink(name, crops), for example CropShardWriter.write. Returns the stage report.
+        """
+        async for tile_crops in self.stream(locations):
+            sink(tile_crops.name, tile_crops.crops)
+        return self.report()
@@ -0,0 +1,233 @@
+import csv
+import inspect
+import itertools
+import os
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, Iterable, List, Optional, TextIO
+
+import numpy as np
+
+from src.bounding_boxes import (
+    SEGMENTATION_METHODS,
+    _blur_mask,
+    _box_areas,
+    _downsample_mask,
+    _filter_regions,
+    _get_roof_codes,
+    _label_blurred,
+    _label_boxes,
+    _pack_rgb,
+    _roof_code_mask,
+    _roof_mask,
+    find_roof_boxes,
+)
+from src.parallel import imap_bounded
+from src.profiling import timer
+from src.utils import load_image
+
+PROGRESS_INTERVAL = 10  # tiles between progress reports
+# stages of find_roof_boxes and the parameters each one depends on, in order
+MASK_PARAMETERS = ("epsilon",)
+BLUR_PARAMETERS = MASK_PARAMETERS + ("method", "downsample", "gaussian_sigma")
+LABEL_PARAMETERS = BLUR_PARAMETERS + ("canny_sigma",)
+FILTER_PARAMETERS = ("min_area", "buffer", "logo_margin")
+PARAMETERS = LABEL_PARAMETERS + FILTER_PARAMETERS
+
+
+@dataclass
+class SweepResult:
+    tile: str
+    params: Dict[str, object]
+    bboxes: np.ndarray
+
+    def as_row(self) -> dict:
+        areas = _box_areas(self.bboxes)
+        return {
+            "tile": self.tile,
+            **self.params,
+            "roofs": len(self.bboxes),
+            "mean_area": float(areas.mean()) if len(areas) else 0.0,
+        }
+
+
+def param_grid(**values: Iterable) -> List[Dict[str, object]]:
+    """
+    Expands lists of values for find_roof_boxes parameters into every combination, with
+    unswept parameters left at their defaults.
+    """
+    unknown = set(values) - set(PARAMETERS)
+    if unknown:
+        raise TypeError(f"Unknown find_roof_boxes parameters: {sorted(unknown)}")
+    defaults = {
+        name: parameter.default
+        for name, parameter in inspect.signature(find_roof_boxes).parameters.items()
+        if name in PARAMETERS
+    }
+    options = [list(values.get(name, [defaults[name]])) for name in PARAMETERS]
+    grid = [
+        dict(zip(PARAMETERS, combination))
+        for combination in itertools.product(*options)
+    ]
+    for params in grid:
+        if params["method"] not in SEGMENTATION_METHODS:
+            raise ValueError(f"Unknown segmentation method: {params['method']}")
+    return grid
+
+
+def _stage_keys(params: dict) -> tuple:
+    """
+    Gets the inputs of the mask, blur and label stages for a parameter combination.
+    """
+    label_key = [params[name] for name in LABEL_PARAMETERS]
+    # connected components don't use canny_sigma, so all its values share labels
+    if params["method"] != "canny":
+        label_key[-1] = None
+    return (
+        tuple(label_key[: len(MASK_PARAMETERS)]),
+        tuple(label_key[: len(BLUR_PARAMETERS)]),
+        tuple(label_key),
+    )
+
+
+class _LastValue:
+    """
+    Memoizes the value of the last key only, so sorted sweeps compute every
+    intermediate once while holding one per stage.
+    """
+
+    def __init__(self, compute):
+        self.compute = compute
+        self.key = self.value = None
+
+    def __call__(self, key, *args):
+        if self.key != key:
+            self.value = None  # let the previous value be freed first
+            self.value = self.compute(*args)
+            self.key = key
+        return self.value
+
+
+def sweep_image(image, grid: List[dict], tile="") -> List[SweepResult]:
+    """
+    Runs find_roof_boxes on an image for every parameter combination of the grid,
+    sharing the intermediate stages between combinations.
+
+    The packed colors are computed once, the roof mask once per epsilon, the blurred
+    mask once per epsilon, method, downsampling and sigma, and the unfiltered boxes
+    once per Canny sigma on top of that, so combinations only differing in the region
+    filters cost a few NumPy comparisons. Results come back in grid order.
+    """
+    if image.ndim == 3 and image.shape[-1] == 3 and image.dtype == np.uint8:
+        with timer("sweep.pack"):
+            codes = _pack_rgb(image)
+
+        def roof_mask(epsilon):
+            return _roof_code_mask(codes, _get_roof_codes(codes, epsilon))
+
+    else:
+
+        def roof_mask(epsilon):
+            return _roof_mask(image, epsilon)
+
+    masks = _LastValue(roof_mask)
+    blurs = _LastValue(
+        lambda mask, method, downsample, sigma: _blur_mask(
+            _downsample_mask(mask, downsample), method, sigma / downsample
+        )
+    )
+    boxes = _LastValue(
+        lambda blurred, method, downsample, canny_sigma: _label_boxes(
+            _label_blurred(blurred, method, canny_sigma / downsample),
+            image.shape,
+            downsample,
+        )
+    )
+
+    # order combinations so those sharing a stage's inputs are adjacent
+    keys = [_stage_keys(params) for params in grid]
+    ranks = {}
+    for stage_keys in keys:
+        for key in stage_keys:
+            ranks.setdefault(key, len(ranks))
+    order = sorted(
+        range(len(grid)), key=lambda index: [ranks[key] for key in keys[index]]
+    )
+
+    results = [None] * len(grid)
+    for index in order:
+        params = grid[index]
+        mask_key, blur_key, label_key = keys[index]
+        mask = masks(mask_key, params["epsilon"])
+        blurred = blurs(
+            blur_key,
+            mask,
+            params["method"],
+            params["downsample"],
+            params["gaussian_sigma"],
+        )
+        unfiltered = boxes(
+            label_key,
+            blurred,
+            params["method"],
+            params["downsample"],
+            params["canny_sigma"],
+        )
+        with timer("sweep.filter"):
+            bboxes = _filter_regions(
+                unfiltered,
+                image.shape,
+                params["min_area"],
+                params["buffer"],
+                params["logo_margin"],
+            )
+        results[index] = SweepResult(tile, params, bboxes)
+    return results
+
+
+def sweep_tile(path: str, grid: List[dict]) -> List[SweepResult]:
+    tile = os.path.splitext(os.path.basename(path))[0]
+    return sweep_image(load_image(path), grid, tile)
+
+
+def run_sweep(
+    paths: List[str], grid: List[dict], processes: Optional[int] = None
+) -> List[SweepResult]:
+    """
+    Sweeps every street map in paths over the grid, fanning tiles out over a process
+    pool. Tiles that fail are reported and left out of the results.
+    """
+    results = []
+    start = time.perf_counter()
+    done = 0
+
+    for path, tile_results, error in imap_bounded(
+        partial(sweep_tile, grid=grid), paths, processes
+    ):
+        if error is not None:
+            print(f"Sweeping tile {path} failed: {error!r}")
+        else:
+            results.extend(tile_results)
+        done += 1
+        if done % PROGRESS_INTERVAL == 0:
+            elapsed = time.perf_counter() - start
+            print(f"Swept {done} tiles, {done / elapsed:.2f} tiles/s")
+
+    print(
+        f"Swept {len(paths)} tiles over {len(grid)} parameter combinations in "
+        f"{time.perf_counter() - start:.1f}s"
+    )
+    return results
+
+
+def write_table(results: Iterable[SweepResult], output: TextIO):
+    """
+    Writes the sweep results as CSV, one row per tile and parameter combination.
+    """
+    writer = csv.DictWriter(
+        output, fieldnames=["tile", *PARAMETERS, "roofs", "mean_area"]
+    )
+    writer.writeheader()
+    for result in results:
+        writer.writerow(result.as_row())
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+from src.settings import DEFAULT_COST_PER_1000
+
+DEFAULT_MAX_BYTES = 2 * 1024**3  # evict least recently used tiles past this size
+DEFAULT_PRECISION = 6  # number of coordinate decimals used in cache keys
+DEFAULT_BUSY_TIMEOUT = 60  # seconds to wait for another process's write lock
+INDEX_NAME = "index.sqlite"
+BLOB_SUFFIX = ".png"
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    deduplicated: int = 0  # stored tiles whose content was already cached
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def cost_saved(self, cost_per_1000=DEFAULT_COST_PER_1000) -> float:
+        """
+        API spend avoided by serving hits from the cache.
+        """
+        return self.hits / 1000 * cost_per_1000
+
+
+def cache_key(params: dict, precision=DEFAULT_PRECISION) -> str:
+    """
+    Normalizes the request parameters from GoogleMapsScraper._create_params into a key,
+    dropping the API key and rounding the center so near-identical coordinates such as
+    28.765846 and 28.7658460001 share a key.
+    """
+    normalized = {name: value for name, value in params.items() if name != "key"}
+    if "center" in normalized:
+        lat, lon = (float(value) for value in str(normalized["center"]).split(","))
+        normalized["center"] = f"{lat:.{precision}f},{lon:.{precision}f}"
+    return json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+
+
+class TileCache:
+    """
+    A size-bounded, content-addressed cache of fetched map images.
+
+    Requests are keyed on their normalized parameters and point at blobs named by the
+    SHA-256 of their content, so identical imagery fetched for different requests is
+    stored once. When the blobs outgrow max_bytes, the least recently used requests are
+    evicted, along with any blob no request points at anymore. The size total and the
+    recency counter live in the index, so several processes can share one cache.
+    """
+
+    def __init__(
+        self, directory: str, max_bytes=DEFAULT_MAX_BYTES, precision=DEFAULT_PRECISION
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.precision = precision
+        self.stats = CacheStats()
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(
+            os.path.join(directory, INDEX_NAME),
+            timeout=DEFAULT_BUSY_TIMEOUT,
+            check_same_thread=False,
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                content_hash TEXT PRIMARY KEY,
+                num_bytes INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS requests (
+                key TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL REFERENCES blobs,
+                last_used INTEGER NOT NULL
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS requests_by_last_used ON requests (last_used);
+            CREATE INDEX IF NOT EXISTS requests_by_content ON requests (content_hash);
+            CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                bytes INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO usage
+                SELECT 0, COALESCE(SUM(num_bytes), 0) FROM blobs;
+            """
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        with self.lock:
+            (count,) = self.connection.execute(
+                "SELECT COUNT(*) FROM requests"
+            ).fetchone()
+        return count
+
+    def _blob_path(self, content_hash: str) -> str:
+        return os.path.join(
+            self.directory, content_hash[:2], content_hash + BLOB_SUFFIX
+        )
+
+    @property
+    def total_bytes(self) -> int:
+        with self.lock:
+            return self._total_bytes()
+
+    def _total_bytes(self) -> int:
+        return self.connection.execute("SELECT bytes FROM usage").fetchone()[0]
+
+    def _add_bytes(self, num_bytes: int):
+        self.connection.execute("UPDATE usage SET bytes = bytes + ?", (num_bytes,))
+
+    def get(self, params: dict) -> Optional[bytes]:
+        """
+        Returns the cached image for a request, or None on a miss.
+        """
+        key = cache_key(params, self.precision)
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT content_hash FROM requests WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                try:
+                    with open(self._blob_path(row[0]), "rb") as f:
+                        payload = f.read()
+                except OSError:
+                    # the blob was removed behind the cache's back
+                    self.connection.execute("BEGIN IMMEDIATE")
+                    self._delete_request(key, row[0])
+                    self.connection.commit()
+                    row = None
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            # recency is a shared counter rather than a timestamp, so it never ties
+            self.connection.execute(
+                "UPDATE requests SET last_used = "
+                "(SELECT MAX(last_used) + 1 FROM requests) WHERE key = ?",
+                (key,),
+            )
+            self.connection.commit()
+            self.stats.hits += 1
+            return payload
+
+    def put(self, params: dict, payload: bytes):
+        """
+        Caches the image fetched for a request, evicting old requests if needed.
+        """
+        key = cache_key(params, self.precision)
+        content_hash = hashlib.sha256(payload).hexdigest()
+
+        with self.lock:
+            # take the write lock first, another process may store the same blob
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                stored = self.connection.execute(
+                    "SELECT 1 FROM blobs WHERE content_hash = ?", (content_hash,)
+                ).fetchone()
+                if stored:
+                    self.stats.deduplicated += 1
+                else:
+                    path = self._blob_path(content_hash)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    with open(path + ".tmp", "wb") as f:
+                        f.write(payload)
+                    os.replace(path + ".tmp", path)
+                    self.connection.execute(
+                        "INSERT INTO blobs VALUES (?, ?)", (content_hash, len(payload))
+                    )
+                    self._add_bytes(len(payload))
+
+                previous = self.connection.execute(
+                    "SELECT content_hash FROM requests WHERE key = ?", (key,)
+                ).fetchone()
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO requests VALUES (?, ?, "
+                    "(SELECT COALESCE(MAX(last_used), 0) + 1 FROM requests))",
+                    (key, content_hash),
+                )
+                if previous and previous[0] != content_hash:
+                    self._delete_unreferenced_blob(previous[0])
+
+                self._evict(keep=key)
+                self.connection.commit()
+            except BaseException:
+                self.connection.rollback()
+                raise
+
+    def _delete_request(self, key: str, content_hash: str):
+        self.connection.execute("DELETE FROM requests WHERE key = ?", (key,))
+        self._delete_unreferenced_blob(content_hash)
+
+    def _delete_unreferenced_blob(self, content_hash: str):
+        referenced = self.connection.execute(
+            "SELECT 1 FROM requests WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if referenced:
+            return
+
+        row = self.connection.execute(
+            "SELECT num_bytes FROM blobs WHERE content_hash = ?", (content_hash,)
+        ).fetchone()
+        if row is None:
+            return  # another process already deleted it
+        self.connection.execute(
+            "DELETE FROM blobs WHERE content_hash = ?", (content_hash,)
+        )
+        self._add_bytes(-row[0])
+        try:
+            os.remove(self._blob_path(content_hash))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self, keep: str):
+        while self._total_bytes() > self.max_bytes:
+            row = self.connection.execute(
+                "SELECT key, content_hash FROM requests WHERE key != ? "
+                "ORDER BY last_used LIMIT 1",
+                (keep,),
+            ).fetchone()
+            if row is None:
+                return
+            self.connection.execute("DELETE FROM requests WHERE key = ?", (row[0],))
+            self._delete_unreferenced_blob(row[1])
+            self.stats.evictions += 1
@@ -1,5 +1,4 @@
-from matplotlib import pyplot as plt
-from skimage import io
+from io import BytesIO
 
 N_COLS = 5
 
@@ -8,10 +7,23 @@ def load_image(image_path: str):
     """
     Loads image with skimage.
     """
+    from skimage import io
+
     return io.imread(image_path)
 
 
+def decode_image(payload: bytes):
+    """
+    Decodes an encoded image, such as a fetched PNG, without writing it to disk.
+    """
+    from skimage import io
+
+    return io.imread(BytesIO(payload))
+
+
 def display_image(image):
+    from matplotlib import pyplot as plt
+
     plt.imshow(image)
     plt.axis("off")
     plt.show()
@@ -21,6 +33,8 @@ def display_multiple_images(images, labels=None, n_cols=N_COLS, fig_size=3):
     """
     Displays variable length of images in a grid with matplotlib.
     """
+    from matplotlib import pyplot as plt
+
     if not labels:
         labels = [None] * len(images)
 
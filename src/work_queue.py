@@ -0,0 +1,482 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from src.crawling import DEFAULT_PRECISION, _pack_cells, location
+from src.scraping import MapType
+
+DEFAULT_CHUNK_SIZE = 50  # locations claimed at once
+DEFAULT_LEASE_SECONDS = 120  # a chunk returns to the queue if not renewed in time
+DEFAULT_MAX_ATTEMPTS = 5  # claims before a chunk is marked failed
+DEFAULT_BUSY_TIMEOUT = 60  # seconds to wait for another process's write lock
+DEFAULT_POLL_SECONDS = 5  # wait between claims while other workers hold the last chunks
+PENDING, LEASED, DONE, FAILED = "pending", "leased", "done", "failed"
+
+
+def shard_locations(
+    locations: Sequence[location], num_shards: int, precision=DEFAULT_PRECISION
+) -> np.ndarray:
+    """
+    Assigns every location to one of num_shards shards by a hash of its grid cell.
+
+    Shards depend only on the rounded coordinates, so every node computes the same
+    assignment without coordination. The splitmix64 finalizer spreads neighbouring
+    cells evenly over the shards.
+    """
+    if not len(locations):
+        return np.empty(0, dtype=np.int64)
+    scale = 10**precision
+    coordinates = np.round(np.asarray(locations, dtype=np.float64) * scale)
+    keys = _pack_cells(
+        coordinates[:, 0].astype(np.int64), coordinates[:, 1].astype(np.int64)
+    ).view(np.uint64)
+
+    keys = keys + np.uint64(0x9E3779B97F4A7C15)
+    keys = (keys ^ (keys >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    keys = (keys ^ (keys >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    keys = keys ^ (keys >> np.uint64(31))
+    return (keys % np.uint64(num_shards)).astype(np.int64)
+
+
+def select_shard(
+    locations: Sequence[location], shard: int, num_shards: int
+) -> List[location]:
+    """
+    Keeps the locations of one shard, for nodes splitting a crawl without a shared
+    queue.
+    """
+    shards = shard_locations(locations, num_shards)
+    return [loc for loc, owner in zip(locations, shards.tolist()) if owner == shard]
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+@dataclass(frozen=True)
+class Chunk:
+    id: int
+    shard: int
+    locations: List[location]
+    owner: str
+    lease: int  # fencing token, bumped on every claim
+
+
+@dataclass(frozen=True)
+class ScrapeResult:
+    lat: float
+    lon: float
+    map_type: MapType
+    path: str
+
+
+class WorkQueue:
+    """
+    A queue of crawl chunks shared by worker processes through a SQLite lease table.
+
+    Workers claim a chunk for lease_seconds and renew the lease with heartbeats.
+    Chunks whose lease runs out, because their worker died, are claimed again by
+    another worker. Every claim bumps the chunk's lease token, and heartbeats and
+    completions from an older lease are rejected, so a worker that lost its chunk can't
+    record results for it. Results are keyed by (location, map_type) and written in
+    the same transaction that completes or releases the chunk, so each is recorded
+    exactly once. A chunk is only completed once every location has every map type, so
+    failed scrapes are retried with the chunk while the scrapes that worked are kept.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds=DEFAULT_LEASE_SECONDS,
+        max_attempts=DEFAULT_MAX_ATTEMPTS,
+        precision=DEFAULT_PRECISION,
+        clock=time.time,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.precision = precision
+        self.clock = clock
+        self.connection = sqlite3.connect(
+            path, timeout=DEFAULT_BUSY_TIMEOUT, isolation_level=None
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY,
+                shard INTEGER NOT NULL,
+                locations TEXT NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT,
+                lease INTEGER NOT NULL DEFAULT 0,
+                lease_expires REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS chunks_by_state ON chunks (state, shard);
+            CREATE TABLE IF NOT EXISTS locations (
+                lat INTEGER NOT NULL,
+                lon INTEGER NOT NULL,
+                chunk INTEGER NOT NULL,
+                PRIMARY KEY (lat, lon)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS results (
+                lat INTEGER NOT NULL,
+                lon INTEGER NOT NULL,
+                map_type TEXT NOT NULL,
+                path TEXT NOT NULL,
+                chunk INTEGER NOT NULL,
+                PRIMARY KEY (lat, lon, map_type)
+            ) WITHOUT ROWID;
+            """
+        )
+
+    def close(self):
+        self.connection.close()
+
+    def _to_key(self, value: float) -> int:
+        return round(value * 10**self.precision)
+
+    def _from_key(self, value: int) -> float:
+        return value / 10**self.precision
+
+    @contextmanager
+    def _transaction(self):
+        # take the write lock up front so concurrent claims can't interleave
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def enqueue(
+        self,
+        locations: Iterable[location],
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        num_shards=1,
+    ) -> int:
+        """
+        Adds locations in chunks of up to chunk_size locations of the same shard.
+        Locations already queued are skipped, so enqueueing is idempotent. Returns the
+        number of chunks added.
+        """
+        locations = list(dict.fromkeys(locations))
+        shards = shard_locations(locations, num_shards, self.precision).tolist()
+        added = 0
+
+        with self._transaction():
+            by_shard = {}
+            for (lat, lon), shard in zip(locations, shards):
+                key = (self._to_key(lat), self._to_key(lon))
+                exists = self.connection.execute(
+                    "SELECT 1 FROM locations WHERE lat = ? AND lon = ?", key
+                ).fetchone()
+                if not exists:
+                    by_shard.setdefault(shard, []).append(key)
+
+            for shard, keys in sorted(by_shard.items()):
+                for start in range(0, len(keys), chunk_size):
+                    chunk_keys = keys[start : start + chunk_size]
+                    cursor = self.connection.execute(
+                        "INSERT INTO chunks (shard, locations, state) VALUES (?, ?, ?)",
+                        (shard, json.dumps(chunk_keys), PENDING),
+                    )
+                    self.connection.executemany(
+                        "INSERT INTO locations VALUES (?, ?, ?)",
+                        [(lat, lon, cursor.lastrowid) for lat, lon in chunk_keys],
+                    )
+                    added += 1
+        return added
+
+    def claim(
+        self, owner: str, shards: Optional[Iterable[int]] = None
+    ) -> Optional[Chunk]:
+        """
+        Leases the next pending or expired chunk, optionally only from some shards.
+        Returns None when there's nothing left to claim.
+        """
+        now = self.clock()
+        shard_filter, shard_params = "", []
+        if shards is not None:
+            shards = list(shards)
+            shard_filter = f"AND shard IN ({', '.join('?' * len(shards))})"
+            shard_params = shards
+
+        with self._transaction():
+            # chunks past max_attempts are presumably poison, stop retrying them
+            self.connection.execute(
+                "UPDATE chunks SET state = ?, error = COALESCE(error, 'lease expired') "
+                "WHERE state = ? AND lease_expires < ? AND lease >= ?",
+                (FAILED, LEASED, now, self.max_attempts),
+            )
+            row = self.connection.execute(
+                f"""
+                SELECT id, shard, locations, lease FROM chunks
+                WHERE (state = ? OR (state = ? AND lease_expires < ?)) {shard_filter}
+                ORDER BY id LIMIT 1
+                """,
+                (PENDING, LEASED, now, *shard_params),
+            ).fetchone()
+            if row is None:
+                return None
+
+            chunk_id, shard, keys, lease = row
+            self.connection.execute(
+                "UPDATE chunks SET state = ?, owner = ?, lease = ?, lease_expires = ? "
+                "WHERE id = ?",
+                (LEASED, owner, lease + 1, now + self.lease_seconds, chunk_id),
+            )
+
+        locations = [
+            (self._from_key(lat), self._from_key(lon)) for lat, lon in json.loads(keys)
+        ]
+        return Chunk(chunk_id, shard, locations, owner, lease + 1)
+
+    def _owns(self, chunk: Chunk) -> bool:
+        row = self.connection.execute(
+            "SELECT 1 FROM chunks WHERE id = ? AND state = ? AND owner = ? AND lease = ?",
+            (chunk.id, LEASED, chunk.owner, chunk.lease),
+        ).fetchone()
+        return row is not None
+
+    def heartbeat(self, chunk: Chunk) -> bool:
+        """
+        Renews a chunk's lease. Returns False if the lease was lost to another worker.
+        """
+        with self._transaction():
+            cursor = self.connection.execute(
+                "UPDATE chunks SET lease_expires = ? "
+                "WHERE id = ? AND state = ? AND owner = ? AND lease = ?",
+                (
+                    self.clock() + self.lease_seconds,
+                    chunk.id,
+                    LEASED,
+                    chunk.owner,
+                    chunk.lease,
+                ),
+            )
+        return cursor.rowcount == 1
+
+    def _insert_results(self, chunk: Chunk, results: Iterable[ScrapeResult]):
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    self._to_key(result.lat),
+                    self._to_key(result.lon),
+                    result.map_type.value,
+                    result.path,
+                    chunk.id,
+                )
+                for result in results
+            ],
+        )
+
+    def complete(self, chunk: Chunk, results: Iterable[ScrapeResult]) -> bool:
+        """
+        Records a chunk's results and marks it done in one transaction. Returns False,
+        recording nothing, if the lease was lost to another worker.
+        """
+        with self._transaction():
+            if not self._owns(chunk):
+                return False
+            self._insert_results(chunk, results)
+            self.connection.execute(
+                "UPDATE chunks SET state = ?, lease_expires = NULL WHERE id = ?",
+                (DONE, chunk.id),
+            )
+        return True
+
+    def release(
+        self,
+        chunk: Chunk,
+        error: Optional[str] = None,
+        results: Iterable[ScrapeResult] = (),
+    ) -> bool:
+        """
+        Gives up a chunk so another worker can retry it, or marks it failed once it has
+        been claimed max_attempts times. The results scraped before giving up are
+        recorded, so a retry only scrapes what's missing.
+        """
+        with self._transaction():
+            if not self._owns(chunk):
+                return False
+            self._insert_results(chunk, results)
+            state = FAILED if chunk.lease >= self.max_attempts else PENDING
+            self.connection.execute(
+                "UPDATE chunks SET state = ?, owner = NULL, lease_expires = NULL, "
+                "error = ? WHERE id = ?",
+                (state, error, chunk.id),
+            )
+        return True
+
+    def recorded(self, chunk: Chunk) -> Set[Tuple[float, float, MapType]]:
+        """
+        Gets the (lat, lon, map_type) results already recorded for a chunk.
+        """
+        return {
+            (self._from_key(lat), self._from_key(lon), MapType(map_type))
+            for lat, lon, map_type in self.connection.execute(
+                "SELECT lat, lon, map_type FROM results WHERE chunk = ?", (chunk.id,)
+            )
+        }
+
+    def leased(self, shards: Optional[Iterable[int]] = None) -> int:
+        """
+        Counts the chunks currently leased, optionally only in some shards.
+        """
+        rows = self.connection.execute(
+            "SELECT shard, COUNT(*) FROM chunks WHERE state = ? GROUP BY shard",
+            (LEASED,),
+        ).fetchall()
+        shards = None if shards is None else set(shards)
+        return sum(count for shard, count in rows if shards is None or shard in shards)
+
+    def counts(self) -> dict:
+        rows = self.connection.execute(
+            "SELECT state, COUNT(*) FROM chunks GROUP BY state"
+        ).fetchall()
+        return {state: 0 for state in (PENDING, LEASED, DONE, FAILED)} | dict(rows)
+
+    def results(self) -> Iterator[ScrapeResult]:
+        for lat, lon, map_type, path in self.connection.execute(
+            "SELECT lat, lon, map_type, path FROM results ORDER BY chunk, lat, lon"
+        ):
+            yield ScrapeResult(
+                self._from_key(lat), self._from_key(lon), MapType(map_type), path
+            )
+
+
+@contextmanager
+def _renewing(queue: WorkQueue, chunk: Chunk) -> Iterator[threading.Event]:
+    """
+    Heartbeats a chunk from a background thread every third of a lease, so a single
+    scrape that backs off or waits for the daily budget can't outlast the lease. The
+    yielded event is set once the lease is lost to another worker.
+    """
+    lost = threading.Event()
+    stop = threading.Event()
+
+    def renew():
+        # sqlite connections can't be shared across threads
+        renewer = WorkQueue(
+            queue.path,
+            queue.lease_seconds,
+            queue.max_attempts,
+            queue.precision,
+            queue.clock,
+        )
+        try:
+            while not stop.wait(queue.lease_seconds / 3):
+                try:
+                    if not renewer.heartbeat(chunk):
+                        lost.set()
+                        return
+                except sqlite3.Error as error:
+                    print(f"Renewing chunk {chunk.id} failed: {error!r}")
+        finally:
+            renewer.close()
+
+    thread = threading.Thread(target=renew, daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(
+    queue: WorkQueue,
+    scraper,
+    owner: Optional[str] = None,
+    shards: Optional[Iterable[int]] = None,
+    map_types: Tuple[MapType, ...] = (MapType.STREET, MapType.SATELLITE),
+) -> int:
+    """
+    Claims and scrapes chunks until the queue is drained, renewing each lease in the
+    background while its chunk is scraped. While other workers hold the last chunks it
+    keeps polling, in case they die and their leases run out. Returns the number of
+    chunks this worker completed.
+    """
+    owner = owner or default_worker_id()
+    shards = None if shards is None else list(shards)
+    completed = 0
+
+    while True:
+        chunk = queue.claim(owner, shards)
+        if chunk is None:
+            if not queue.leased(shards):
+                return completed
+            time.sleep(min(DEFAULT_POLL_SECONDS, queue.lease_seconds / 2))
+            continue
+
+        recorded = queue.recorded(chunk)
+        results = []
+        missing = 0
+        with _renewing(queue, chunk) as lost:
+            try:
+                for lat, lon in chunk.locations:
+                    if lost.is_set():
+                        print(f"Lost the lease on chunk {chunk.id}, abandoning it")
+                        break
+                    for map_type in map_types:
+                        if (lat, lon, map_type) in recorded:
+                            continue
+                        path = scraper.scrape_map_image(map_type, lat, lon)
+                        if path:
+                            results.append(ScrapeResult(lat, lon, map_type, path))
+                        else:
+                            missing += 1
+                else:
+                    if missing:
+                        print(f"Chunk {chunk.id} is missing {missing} map images")
+                        queue.release(chunk, f"{missing} map images failed", results)
+                    elif queue.complete(chunk, results):
+                        completed += 1
+            except Exception as error:
+                print(f"Chunk {chunk.id} failed: {error!r}")
+                queue.release(chunk, repr(error), results)
+
+
+def _run_worker_process(path: str, scraper_factory, shards, lease_seconds) -> int:
+    queue = WorkQueue(path, lease_seconds=lease_seconds)
+    try:
+        return run_worker(queue, scraper_factory(), shards=shards)
+    finally:
+        queue.close()
+
+
+def run_workers(
+    path: str,
+    scraper_factory,
+    processes: int,
+    shards: Optional[Iterable[int]] = None,
+    lease_seconds=DEFAULT_LEASE_SECONDS,
+) -> int:
+    """
+    Drains a queue with local worker processes, each building its own scraper with
+    the picklable scraper_factory. Returns the number of chunks completed.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    shards = None if shards is None else list(shards)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [
+            executor.submit(
+                _run_worker_process, path, scraper_factory, shards, lease_seconds
+            )
+            for _ in range(processes)
+        ]
+        return sum(future.result() for future in futures)
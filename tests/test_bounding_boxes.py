@@ -1,76 +1,109 @@
-from dataclasses import dataclass
-from typing import Tuple
+import tracemalloc
 
 import numpy as np
 import pytest
+from skimage import img_as_float
+from skimage.color import rgb2gray
 
+from src import bounding_boxes
 from src.bounding_boxes import (
-    _filter_border_regions,
-    _filter_google_maps_logo,
-    _filter_small_regions,
+    RoofMaskBuffers,
+    _downsample_mask,
+    _filter_regions,
+    _get_roof_codes,
     _get_roof_color,
+    _inner_regions,
+    _label_boxes,
+    _large_regions,
+    _mask_regions,
+    _most_common_colors,
+    _pack_rgb,
+    _regions_above_google_maps_logo,
     _replace_roof_colors,
+    _roof_code_mask,
+    _roof_mask,
+    box_iou,
     find_roof_boxes,
 )
 from src.utils import load_image
 
 
-@dataclass
-class Region:
-    area_bbox: int
-    bbox: Tuple[int, int, int, int]
+def boxes(*bboxes):
+    return np.array(bboxes, dtype=np.int32).reshape(-1, 4)
 
 
-@dataclass
-class Image:
-    shape: Tuple[int, int]
+def test_large_regions_default_min_area():
+    bboxes = boxes((0, 0, 10, 10), (0, 0, 10, 20), (0, 0, 10, 30))
+    assert _large_regions(bboxes, 200).tolist() == [False, True, True]
 
 
-def test_filter_regions_default_min_area():
-    regions = [
-        Region(100, (0, 0, 0, 0)),
-        Region(200, (0, 0, 0, 0)),
-        Region(300, (0, 0, 0, 0)),
-    ]
-    assert [region.area_bbox for region in _filter_small_regions(regions, 200)] == [
-        200,
-        300,
+def test_inner_regions_removes_border_bboxes():
+    bboxes = boxes(
+        (0, 0, 0, 0),  # overlaps
+        (50, 50, 90, 100),  # overlaps
+        (50, 50, 90, 90),
+    )
+    assert _inner_regions(bboxes, (100, 100)).tolist() == [False, False, True]
+
+
+def test_inner_regions_with_bbox_overlapping_with_buffer():
+    bboxes = boxes(
+        (0, 0, 0, 0),  # overlaps
+        (50, 50, 90, 100),  # overlaps
+        (50, 50, 90, 90),  # overlaps
+    )
+    assert not _inner_regions(bboxes, (100, 100), buffer=10).any()
+
+
+def test_filter_bbox_overlapping_with_google_maps_logo():
+    bboxes = boxes(
+        (0, 0, 0, 0),
+        (0, 0, 890, 890),
+        (50, 50, 990, 990),  # overlaps
+    )
+    assert _regions_above_google_maps_logo(bboxes, (1000, 1000)).tolist() == [
+        True,
+        True,
+        False,
     ]
 
 
-def test_filter_border_regions_removes_border_bboxes():
-    regions = [
-        Region(100, (0, 0, 0, 0)),  # overlaps
-        Region(200, (50, 50, 90, 100)),  # overlaps
-        Region(300, (50, 50, 90, 90)),
+def test_google_maps_logo_margin_uses_image_height():
+    bboxes = boxes((0, 0, 450, 100), (0, 0, 350, 100))
+    assert _regions_above_google_maps_logo(bboxes, (500, 2000)).tolist() == [
+        False,
+        True,
     ]
-    image = Image((100, 100))
-    filtered = _filter_border_regions(regions, image)
 
-    assert len(filtered) == 1
-    assert filtered[0].bbox == (50, 50, 90, 90)
+
+def test_filter_regions_combines_filters():
+    bboxes = boxes(
+        (50, 50, 60, 60),  # too small
+        (0, 50, 90, 90),  # border
+        (300, 300, 950, 400),  # logo
+        (50, 50, 90, 90),
+        (100, 100, 200, 200),
+    )
+    filtered = _filter_regions(bboxes, (1000, 1000))
+    assert filtered.dtype == np.int32
+    assert filtered.tolist() == [[50, 50, 90, 90], [100, 100, 200, 200]]
 
 
-def test_filter_border_regions_with_bbox_overlapping_with_buffer():
-    regions = [
-        Region(100, (0, 0, 0, 0)),  # overlaps
-        Region(200, (50, 50, 90, 100)),  # overlaps
-        Region(300, (50, 50, 90, 90)),  # overlaps
-    ]
-    image = Image((100, 100))
-    filtered = _filter_border_regions(regions, image, buffer=10)
-    assert len(filtered) == 0
+def test_filter_regions_with_no_regions():
+    assert _filter_regions(boxes(), (1000, 1000)).shape == (0, 4)
 
 
-def test_filter_bbox_overlapping_with_google_maps_logo():
-    regions = [
-        Region(100, (0, 0, 0, 0)),
-        Region(200, (0, 0, 890, 890)),
-        Region(300, (50, 50, 990, 990)),  # overlaps
+def test_label_boxes_rescales_and_clips_boxes():
+    labels = np.array(
+        [
+            [1, 1, 0],
+            [0, 0, 2],
+        ]
+    )
+    assert _label_boxes(labels, (5, 5), factor=2).tolist() == [
+        [0, 0, 2, 4],
+        [2, 4, 4, 5],
     ]
-    image = Image((1000, 1000))
-    filtered = _filter_google_maps_logo(regions, image)
-    assert [region.bbox[-1] for region in filtered] == [0, 890]
 
 
 def test_get_roof_color_gets_second_most_common_color():
@@ -92,6 +125,50 @@ def test_get_roof_color_with_empty_image_raises():
         _get_roof_color(gray_image)
 
 
+def test_most_common_colors_breaks_ties_by_first_occurrence():
+    values = np.array([0.5, 0.2, 0.2, 0.9, 0.5, 0.9, 0.1])
+    assert _most_common_colors(values) == [(0.5, 2), (0.2, 2), (0.9, 2)]
+
+
+def test_pack_rgb():
+    image = np.array([[[1, 2, 3], [255, 0, 128]]], dtype=np.uint8)
+    assert _pack_rgb(image).tolist() == [[0x010203, 0xFF0080]]
+
+
+def test_get_roof_codes_gets_second_most_common_gray():
+    background, house, road = 0xF9F9F9, 0xF0F0F0, 0x808080
+    codes = np.array(
+        [
+            [background, background, background, background],
+            [background, house, house, background],
+            [background, house, road, background],
+        ],
+        dtype=np.uint32,
+    )
+    assert _get_roof_codes(codes).tolist() == [house]
+
+
+def test_get_roof_codes_includes_colors_within_epsilon():
+    background, house, similar_house = 0xFFFFFF, 0x808080, 0x818181
+    codes = np.array(
+        [[background] * 5 + [house] * 3 + [similar_house]], dtype=np.uint32
+    )
+    assert _get_roof_codes(codes, epsilon=0.01).tolist() == [house, similar_house]
+
+
+def test_get_roof_codes_with_empty_image_raises():
+    with pytest.raises(BaseException):
+        _get_roof_codes(np.array([], dtype=np.uint32))
+
+
+def test_palette_roof_color_matches_gray_roof_color():
+    image = load_image("data/street_map_close.png")
+    roof_codes = _get_roof_codes(_pack_rgb(image))
+    roof_pixels = np.isin(_pack_rgb(image), roof_codes)
+    gray_image = rgb2gray(image)
+    assert np.all(gray_image[roof_pixels] == _get_roof_color(gray_image))
+
+
 def test_replace_roof_colors():
     H = 0.98  # house color
     gray_image = np.array(
@@ -125,8 +202,140 @@ def test_replace_roof_colors_with_similar_colors():
     )
 
 
+def test_replace_roof_colors_does_not_reread_replaced_values():
+    gray_image = np.array([[0.1, 0.99995]])
+    assert np.array_equal(
+        _replace_roof_colors(gray_image, 0.99995),
+        np.array([[1, 0]]),
+    )
+
+
+def test_replace_roof_colors_into_out_buffer():
+    gray_image = np.array([[0.1, 0.919, 0.92, 0.921, 0.1]])
+    out = np.empty(gray_image.shape, dtype=np.uint8)
+    mask = _replace_roof_colors(gray_image, 0.92, epsilon=0.01, out=out)
+    assert mask is out
+    assert mask.tolist() == [[1, 0, 0, 0, 1]]
+    assert gray_image.tolist() == [[0.1, 0.919, 0.92, 0.921, 0.1]]
+
+
+def peak_allocation(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_replace_roof_colors_in_place_allocates_no_temporaries():
+    gray_image = np.random.default_rng(0).random((1024, 1024))
+    peak = peak_allocation(lambda: _replace_roof_colors(gray_image, 0.5))
+    assert peak < gray_image.nbytes / 20
+
+
+def test_roof_code_mask_with_several_roof_codes():
+    codes = np.array([[1, 2, 3, 4]], dtype=np.uint32)
+    mask = _roof_code_mask(codes, np.array([2, 4], dtype=np.uint32))
+    assert mask.tolist() == [[True, False, True, False]]
+
+
+def test_roof_mask_with_buffers_bounds_peak_allocation():
+    image = load_image("data/street_map.png")
+    buffers = RoofMaskBuffers.for_shape(image.shape)
+    pixels = image.shape[0] * image.shape[1]
+
+    peak = peak_allocation(lambda: _roof_mask(image, buffers=buffers))
+    legacy_peak = peak_allocation(lambda: _replace_roof_colors(rgb2gray(image), 0.94))
+
+    # rgb2gray alone needs 32 bytes per pixel, the palette path sorts 4 byte codes
+    assert peak < 8 * pixels
+    assert peak * 4 < legacy_peak
+
+
 def test_find_roof_boxes():
     image = load_image("data/street_map.png")
     image, bboxes = find_roof_boxes(image)
     assert len(image.shape) == 3
     assert len(bboxes) >= 51
+    assert bboxes.shape[1] == 4
+
+
+def test_find_roof_boxes_on_float_image_matches_palette_path():
+    image = load_image("data/street_map.png")
+    _, float_bboxes = find_roof_boxes(img_as_float(image))
+    _, palette_bboxes = find_roof_boxes(image)
+    assert np.array_equal(float_bboxes, palette_bboxes)
+
+
+def test_find_roof_boxes_reuses_buffers_across_tiles():
+    image = load_image("data/street_map.png")
+    close_image = load_image("data/street_map_close.png")
+    buffers = RoofMaskBuffers.for_shape(image.shape)
+
+    for tile in [image, close_image]:
+        assert np.array_equal(
+            find_roof_boxes(tile, buffers)[1], find_roof_boxes(tile)[1]
+        )
+
+
+def test_downsample_mask_averages_blocks():
+    mask = np.array(
+        [
+            [1, 1, 0, 0, 1],
+            [1, 0, 0, 0, 1],
+            [0, 0, 1, 1, 1],
+        ],
+        dtype=bool,
+    )
+    assert _downsample_mask(mask, 2).tolist() == [[0.75, 0.0]]
+    assert _downsample_mask(mask, 1) is mask
+
+
+def test_box_iou():
+    boxes = [(0, 0, 10, 10), (0, 0, 10, 20)]
+    other_boxes = [(0, 0, 10, 10), (20, 20, 30, 30)]
+    assert box_iou(boxes, other_boxes).tolist() == [[1.0, 0.0], [0.5, 0.0]]
+
+
+def test_box_iou_with_no_boxes():
+    assert box_iou([], [(0, 0, 10, 10)]).shape == (0, 1)
+
+
+def test_find_roof_boxes_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        find_roof_boxes(load_image("data/street_map_close.png"), method="watershed")
+
+
+@pytest.mark.parametrize(
+    ("method", "downsample"),
+    [("canny", 2), ("components", 1), ("components", 2), ("components", 4)],
+)
+@pytest.mark.parametrize("path", ["data/street_map.png", "data/street_map_close.png"])
+def test_find_roof_boxes_methods_agree_with_canny(path, method, downsample):
+    image = load_image(path)
+    _, canny_bboxes = find_roof_boxes(image)
+    _, bboxes = find_roof_boxes(image, method=method, downsample=downsample)
+
+    matched = box_iou(canny_bboxes, bboxes).max(axis=1) >= 0.5
+    assert matched.mean() >= 0.9
+    assert len(bboxes) == pytest.approx(len(canny_bboxes), rel=0.1)
+
+
+def test_downsampling_rescales_both_sigmas(monkeypatch):
+    sigmas = []
+    blur, label = bounding_boxes._blur_mask, bounding_boxes._label_blurred
+
+    def record_blur(mask, method, gaussian_sigma):
+        sigmas.append(gaussian_sigma)
+        return blur(mask, method, gaussian_sigma)
+
+    def record_label(blurred, method, canny_sigma):
+        sigmas.append(canny_sigma)
+        return label(blurred, method, canny_sigma)
+
+    monkeypatch.setattr(bounding_boxes, "_blur_mask", record_blur)
+    monkeypatch.setattr(bounding_boxes, "_label_blurred", record_label)
+    _mask_regions(np.ones((40, 40)), downsample=4, gaussian_sigma=8, canny_sigma=2)
+
+    assert sigmas == [2, 0.5]
@@ -0,0 +1,148 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from src import box_cache
+from src.bounding_boxes import RoofMaskBuffers, find_roof_boxes
+from src.box_cache import (
+    RoofBoxCache,
+    decode_boxes,
+    encode_boxes,
+    image_digest,
+    params_key,
+)
+from src.utils import load_image
+
+STREET_MAP = "data/street_map_close.png"
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = RoofBoxCache(str(tmp_path / "boxes.sqlite"))
+    yield cache
+    cache.close()
+
+
+@pytest.fixture
+def street_map(tmp_path):
+    path = tmp_path / "street.png"
+    shutil.copy(STREET_MAP, path)
+    return str(path)
+
+
+def test_params_key_fills_in_defaults():
+    assert params_key() == params_key(min_area=500, method="canny")
+    assert params_key() == params_key(buffers=RoofMaskBuffers.for_shape((2, 2)))
+    assert params_key() != params_key(min_area=501)
+    assert params_key(gaussian_sigma=10) != params_key(canny_sigma=2)
+
+
+def test_params_key_rejects_unknown_parameters():
+    with pytest.raises(TypeError):
+        params_key(sigma=3)
+
+
+def test_image_digest_depends_on_pixels_and_shape():
+    image = np.zeros((4, 6, 3), dtype=np.uint8)
+    changed = image.copy()
+    changed[0, 0, 0] = 1
+
+    assert image_digest(image) == image_digest(image.copy())
+    assert image_digest(image) != image_digest(changed)
+    assert image_digest(image) != image_digest(image.reshape(6, 4, 3))
+
+
+def test_boxes_are_stored_compactly():
+    small = np.array([[1, 2, 300, 65535]], dtype=np.int32)
+    large = np.array([[1, 2, 300, 70000]], dtype=np.int32)
+
+    assert encode_boxes(small)[1] == "<u2"
+    assert encode_boxes(large)[1] == "<i4"
+    for boxes in (small, large, np.empty((0, 4), dtype=np.int32)):
+        decoded = decode_boxes(*encode_boxes(boxes))
+        assert decoded.dtype == np.int32
+        np.testing.assert_array_equal(decoded, boxes)
+
+
+def test_find_caches_find_roof_boxes(cache):
+    image = load_image(STREET_MAP)
+    _, expected = find_roof_boxes(image, min_area=800)
+
+    np.testing.assert_array_equal(cache.find(image, min_area=800), expected)
+    np.testing.assert_array_equal(cache.find(image, min_area=800), expected)
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cache.stats.hit_rate == 0.5
+    assert cache.stats.seconds_saved > 0
+
+
+def test_parameter_change_misses(cache, street_map):
+    default = cache.find_path(street_map)
+    fewer = cache.find_path(street_map, min_area=5000)
+
+    assert cache.stats.misses == 2
+    assert len(fewer) < len(default)
+    assert len(cache) == 2
+
+
+def test_find_path_skips_loading_cached_tiles(cache, street_map, monkeypatch):
+    expected = cache.find_path(street_map)
+
+    def fail(path):
+        raise AssertionError("loaded a cached tile")
+
+    monkeypatch.setattr(box_cache, "load_image", fail)
+    np.testing.assert_array_equal(cache.find_path(street_map), expected)
+    assert cache.stats.hits == 1
+
+
+def test_find_path_rehashes_modified_files(cache, street_map, tmp_path):
+    cache.find_path(street_map)
+    shutil.copy("data/street_map.png", street_map)
+    os.utime(street_map, ns=(0, 0))
+
+    _, expected = find_roof_boxes(load_image(street_map))
+    np.testing.assert_array_equal(cache.find_path(street_map), expected)
+    assert cache.stats.misses == 2
+
+    # a copy with the same pixels shares the cached result
+    copy = str(tmp_path / "copy.png")
+    shutil.copy(street_map, copy)
+    cache.find_path(copy)
+    assert cache.stats.hits == 1
+
+
+def test_results_persist_across_instances(tmp_path, street_map):
+    path = str(tmp_path / "boxes.sqlite")
+    with_cache = RoofBoxCache(path)
+    expected = with_cache.find_path(street_map)
+    with_cache.close()
+
+    reopened = RoofBoxCache(path)
+    np.testing.assert_array_equal(reopened.find_path(street_map), expected)
+    assert reopened.stats.hits == 1
+    reopened.close()
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    boxes = np.ones((4, 4), dtype=np.int32)  # 32 bytes stored
+    cache = RoofBoxCache(str(tmp_path / "boxes.sqlite"), max_bytes=80)
+    cache._store("a", "key", boxes, 1.0)
+    cache._store("b", "key", boxes, 1.0)
+    assert cache._lookup("a", "key") is not None
+
+    cache._store("c", "key", boxes, 1.0)
+
+    assert cache.stats.evictions == 1
+    assert cache._lookup("b", "key") is None
+    assert cache._lookup("a", "key") is not None
+    assert cache.total_bytes == 64
+    cache.close()
+
+
+def test_restoring_a_result_keeps_size_accurate(cache):
+    boxes = np.ones((4, 4), dtype=np.int32)
+    cache._store("a", "key", boxes, 1.0)
+    cache._store("a", "key", boxes[:2], 1.0)
+    assert cache.total_bytes == 16
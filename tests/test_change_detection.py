@@ -0,0 +1,266 @@
+import shutil
+
+import numpy as np
+import pytest
+from skimage import io
+
+from src import change_detection
+from src.bounding_boxes import find_roof_boxes
+from src.change_detection import (
+    EpochStore,
+    TileRecord,
+    boxes_in_cells,
+    changed_cells,
+    file_hash,
+    run_incremental,
+    thumbnail,
+)
+from src.classification import classify_crops
+from src.extraction import DEFAULT_CROP_BUFFER, TilePair
+from src.postprocessing import crop_images
+from src.utils import load_image
+
+STREET_MAP = "data/street_map_close.png"
+SATELLITE = "data/satellite_map_close.png"
+
+
+class CountingClassifier:
+    """
+    Labels crops as bright (1) or dark (0) by their mean, counting the crops it saw.
+    """
+
+    def __init__(self):
+        self.crops = 0
+
+    def predict(self, batch):
+        self.crops += len(batch)
+        brightness = batch.reshape(len(batch), -1).mean(axis=1) / 255
+        return np.column_stack([1 - brightness, brightness])
+
+
+def keyed(crops, tile="tile"):
+    return [((tile, box), crop) for box, crop in enumerate(crops)]
+
+
+def crawl(directory, street=STREET_MAP, satellite=SATELLITE):
+    directory.mkdir(exist_ok=True)
+    shutil.copy(street, directory / "street.png")
+    shutil.copy(satellite, directory / "satellite.png")
+    return [
+        TilePair(
+            1.0, 2.0, str(directory / "street.png"), str(directory / "satellite.png")
+        )
+    ]
+
+
+@pytest.fixture
+def store():
+    store = EpochStore()
+    yield store
+    store.close()
+
+
+def test_thumbnail_averages_cells():
+    image = np.zeros((9, 8, 3), dtype=np.uint8)
+    image[:4, :4] = 100
+    image[4:8, 4:] = 255
+
+    cells = thumbnail(image, grid=2)
+
+    np.testing.assert_array_equal(cells, [[100, 0], [0, 255]])
+    assert cells.dtype == np.uint8
+
+
+def test_thumbnail_of_image_smaller_than_grid():
+    image = np.arange(6, dtype=np.uint8).reshape(2, 3)
+
+    cells = thumbnail(image, grid=4)
+
+    np.testing.assert_array_equal(
+        cells, [[0, 1, 2, 2], [3, 4, 5, 5], [3, 4, 5, 5], [3, 4, 5, 5]]
+    )
+    cells_changed = np.zeros((4, 4), dtype=bool)
+    cells_changed[1, 2] = True
+    np.testing.assert_array_equal(
+        boxes_in_cells([[0, 0, 1, 1], [1, 2, 2, 3]], cells_changed, image.shape),
+        [False, True],
+    )
+
+
+def test_changed_cells_ignores_small_differences():
+    before = np.array([[10, 10], [10, 10]], dtype=np.uint8)
+    after = np.array([[14, 5], [200, 0]], dtype=np.uint8)
+
+    np.testing.assert_array_equal(
+        changed_cells(before, after, threshold=4), [[False, True], [True, True]]
+    )
+    assert changed_cells(before, np.zeros((3, 3), dtype=np.uint8)).all()
+
+
+def test_boxes_in_cells():
+    cells = np.zeros((4, 4), dtype=bool)
+    cells[1, 2] = True  # rows 10-19, columns 20-29 of a 40x40 image
+    bboxes = np.array(
+        [[0, 0, 10, 20], [5, 15, 11, 21], [20, 20, 40, 40], [19, 29, 20, 30]]
+    )
+
+    np.testing.assert_array_equal(
+        boxes_in_cells(bboxes, cells, (40, 40)), [False, True, False, True]
+    )
+
+
+def test_epoch_store_round_trips_records(store):
+    record = TileRecord(
+        "1.0_2.0",
+        "a",
+        "b",
+        np.arange(4, dtype=np.uint8).reshape(2, 2),
+        np.zeros((2, 2), dtype=np.uint8),
+        np.array([[1, 2, 3, 4]], dtype=np.int32),
+        np.array([1], dtype=np.int32),
+        np.array([0.5], dtype=np.float32),
+    )
+    store.put("2024-05", record)
+    store.put("2025-01", record)
+
+    loaded = store.get("2024-05", "1.0_2.0")
+    for name, value in record.__dict__.items():
+        np.testing.assert_array_equal(getattr(loaded, name), value)
+    assert store.get("2024-05", "other") is None
+    assert store.epochs() == ["2024-05", "2025-01"]
+    assert store.previous_epoch("2025-01") == "2024-05"
+    assert store.previous_epoch("2024-05") is None
+
+
+def test_first_epoch_processes_every_tile(store, tmp_path):
+    classifier = CountingClassifier()
+    report = run_incremental(crawl(tmp_path / "a"), store, "a", classifier=classifier)
+
+    record = store.get("a", "1.0_2.0")
+    _, expected = find_roof_boxes(load_image(STREET_MAP))
+    np.testing.assert_array_equal(record.bboxes, expected)
+    assert len(record.labels) == len(record.confidences) == len(expected)
+    assert (report.tiles, report.new, report.skipped_fraction) == (1, 1, 0.0)
+    assert report.boxes_classified == classifier.crops == len(expected)
+
+
+def test_unchanged_tiles_are_carried_forward(store, tmp_path, monkeypatch):
+    run_incremental(crawl(tmp_path / "a"), store, "a", classifier=CountingClassifier())
+
+    def fail(*args, **kwargs):
+        raise AssertionError("reprocessed an unchanged tile")
+
+    monkeypatch.setattr(change_detection, "find_roof_boxes", fail)
+    monkeypatch.setattr(change_detection, "load_image", fail)
+    classifier = CountingClassifier()
+    report = run_incremental(crawl(tmp_path / "b"), store, "b", classifier=classifier)
+
+    before, after = store.get("a", "1.0_2.0"), store.get("b", "1.0_2.0")
+    for name, value in before.__dict__.items():
+        np.testing.assert_array_equal(getattr(after, name), value)
+    assert (report.unchanged, report.skipped_fraction) == (1, 1.0)
+    assert report.boxes_carried == len(before.bboxes)
+    assert classifier.crops == 0
+
+
+def test_reencoded_tiles_are_unchanged(store, tmp_path, monkeypatch):
+    run_incremental(crawl(tmp_path / "a"), store, "a")
+    pairs = crawl(tmp_path / "b")
+    io.imsave(
+        pairs[0].street_path,
+        load_image(STREET_MAP),
+        compress_level=9,
+        check_contrast=False,
+    )
+    assert file_hash(pairs[0].street_path) != file_hash(STREET_MAP)
+
+    monkeypatch.setattr(change_detection, "find_roof_boxes", None)
+    report = run_incremental(pairs, store, "b")
+    assert report.unchanged == 1
+
+
+def test_small_changes_add_up_across_epochs(store, tmp_path):
+    street = load_image(STREET_MAP).astype(np.int16)
+    run_incremental(crawl(tmp_path / "a"), store, "a")
+
+    # each epoch darkens the tile by less than the threshold
+    outcomes = []
+    for epoch, shift in [("b", 3), ("c", 6)]:
+        path = str(tmp_path / f"{epoch}.png")
+        darker = np.clip(street - shift, 0, 255).astype(np.uint8)
+        io.imsave(path, darker, check_contrast=False)
+        report = run_incremental(crawl(tmp_path / epoch, street=path), store, epoch)
+        outcomes.append((report.unchanged, report.resegmented))
+    assert outcomes == [(1, 0), (0, 1)]
+
+
+def test_grid_change_rebuilds_thumbnails(store, tmp_path):
+    run_incremental(crawl(tmp_path / "a"), store, "a", grid=32)
+    report = run_incremental(crawl(tmp_path / "b"), store, "b")
+
+    assert report.resegmented == 1
+    assert store.get("b", "1.0_2.0").satellite_thumbnail.shape == (64, 64)
+
+
+def test_changed_street_map_is_resegmented(store, tmp_path):
+    run_incremental(crawl(tmp_path / "a"), store, "a")
+    street = load_image(STREET_MAP)
+    street[600:700, 600:700] = street[0, 0]
+    changed = str(tmp_path / "changed.png")
+    io.imsave(changed, street, check_contrast=False)
+
+    report = run_incremental(crawl(tmp_path / "b", street=changed), store, "b")
+
+    _, expected = find_roof_boxes(street)
+    np.testing.assert_array_equal(store.get("b", "1.0_2.0").bboxes, expected)
+    assert (report.resegmented, report.skipped_fraction) == (1, 0.0)
+
+
+def test_changed_satellite_region_is_reclassified(store, tmp_path, monkeypatch):
+    run_incremental(crawl(tmp_path / "a"), store, "a", classifier=CountingClassifier())
+    before = store.get("a", "1.0_2.0")
+    satellite = load_image(SATELLITE)
+    satellite[:200, :200] = 255
+    changed = str(tmp_path / "changed.png")
+    io.imsave(changed, satellite, check_contrast=False)
+
+    monkeypatch.setattr(change_detection, "find_roof_boxes", None)
+    classifier = CountingClassifier()
+    report = run_incremental(
+        crawl(tmp_path / "b", satellite=changed), store, "b", classifier=classifier
+    )
+
+    after = store.get("b", "1.0_2.0")
+    stale = (before.bboxes[:, :2] - DEFAULT_CROP_BUFFER < 200).all(axis=1)
+    assert stale.any() and not stale.all()
+    np.testing.assert_array_equal(after.bboxes, before.bboxes)
+    np.testing.assert_array_equal(after.labels[~stale], before.labels[~stale])
+    crops = crop_images(satellite, before.bboxes[stale], DEFAULT_CROP_BUFFER)
+    expected = list(classify_crops(keyed(crops), CountingClassifier()))
+    assert after.labels[stale].tolist() == [p.label for p in expected]
+    assert classifier.crops == report.boxes_classified == stale.sum()
+    assert (report.reclassified, report.skipped_fraction) == (1, 1.0)
+    assert (after.satellite_thumbnail[:10, :10] == 255).all()
+    np.testing.assert_array_equal(
+        after.satellite_thumbnail[10:], before.satellite_thumbnail[10:]
+    )
+
+
+def test_records_are_committed_in_batches(store, tmp_path):
+    pairs = crawl(tmp_path / "a") * 5
+    statements = []
+    store.connection.set_trace_callback(statements.append)
+
+    run_incremental(pairs, store, "a", commit_batch=2)
+
+    assert statements.count("COMMIT") == 3
+
+
+def test_failed_tiles_are_reported(store, tmp_path, capsys):
+    pairs = [TilePair(1.0, 2.0, str(tmp_path / "missing.png"), SATELLITE)]
+
+    report = run_incremental(pairs, store, "a")
+
+    assert (report.tiles, report.failed) == (0, 1)
+    assert "Updating tile 1.0_2.0 failed" in capsys.readouterr().out
+    assert store.epochs() == []
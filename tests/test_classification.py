@@ -0,0 +1,156 @@
+import numpy as np
+import pytest
+
+from src.classification import (
+    ClassificationReport,
+    classify_crops,
+    classify_tiles,
+    iter_batches,
+    iter_shard_crops,
+    iter_tile_crops,
+    letterbox,
+)
+from src.crop_store import CropShardReader, CropShardWriter
+from src.extraction import TilePair, crop_tile
+
+PAIR = TilePair(1.0, 2.0, "data/street_map_close.png", "data/satellite_map_close.png")
+
+
+class BrightnessClassifier:
+    """
+    Labels crops as bright (1) or dark (0) by their mean, recording batch shapes.
+    """
+
+    def __init__(self):
+        self.batch_shapes = []
+
+    def predict(self, batch):
+        self.batch_shapes.append(batch.shape)
+        brightness = batch.reshape(len(batch), -1).mean(axis=1) / 255
+        return np.column_stack([1 - brightness, brightness])
+
+
+def keyed(crops, tile="tile"):
+    return [((tile, box), crop) for box, crop in enumerate(crops)]
+
+
+def test_letterbox_keeps_aspect_ratio_and_centers():
+    crop = np.full((10, 40, 4), 200, dtype=np.uint8)
+    out = np.full((8, 8, 3), 7, dtype=np.uint8)
+
+    letterbox(crop, out)
+
+    assert (out[3:5] == 200).all()
+    assert (out[:3] == 0).all() and (out[5:] == 0).all()
+
+
+def test_letterbox_upscales_small_crops():
+    crop = np.arange(4, dtype=np.uint8).reshape(2, 2, 1).repeat(3, axis=2)
+    out = np.zeros((4, 4, 3), dtype=np.uint8)
+
+    letterbox(crop, out)
+
+    assert out[:, :, 0].tolist() == [
+        [0, 0, 1, 1],
+        [0, 0, 1, 1],
+        [2, 2, 3, 3],
+        [2, 2, 3, 3],
+    ]
+
+
+def test_iter_batches_reuses_one_fixed_shape_array():
+    crops = keyed([np.full((5, 7, 3), i, dtype=np.uint8) for i in range(5)])
+    batches = [(keys, batch) for keys, batch in iter_batches(crops, 2, 4)]
+
+    assert [len(keys) for keys, _ in batches] == [2, 2, 1]
+    assert [batch.shape for _, batch in batches] == [(2, 4, 4, 3)] * 2 + [(1, 4, 4, 3)]
+    assert all(np.shares_memory(batch, batches[0][1]) for _, batch in batches)
+
+
+def test_classify_crops_labels_every_crop_in_batches():
+    crops = keyed(
+        [np.full((30, 20, 3), value, dtype=np.uint8) for value in (0, 255, 10, 250, 5)]
+    )
+    classifier = BrightnessClassifier()
+
+    predictions = list(classify_crops(crops, classifier, batch_size=2, size=16))
+
+    assert [(p.tile, p.box, p.label) for p in predictions] == [
+        ("tile", 0, 0),
+        ("tile", 1, 1),
+        ("tile", 2, 0),
+        ("tile", 3, 1),
+        ("tile", 4, 0),
+    ]
+    assert predictions[0].confidence == pytest.approx(1)
+    assert classifier.batch_shapes == [(2, 16, 16, 3)] * 2 + [(1, 16, 16, 3)]
+
+
+def test_classify_crops_rejects_misshapen_scores():
+    class BrokenClassifier:
+        def predict(self, batch):
+            return np.zeros(len(batch))
+
+    with pytest.raises(ValueError):
+        list(classify_crops(keyed([np.zeros((4, 4, 3))]), BrokenClassifier()))
+
+
+def test_iter_tile_crops_matches_crop_tile():
+    _, expected = crop_tile(PAIR)
+    crops = list(iter_tile_crops([PAIR]))
+
+    assert [key for key, _ in crops] == [(PAIR.name, i) for i in range(len(expected))]
+    assert all(np.array_equal(crop, e) for (_, crop), e in zip(crops, expected))
+
+
+def test_iter_shard_crops_reads_stored_crops(tmp_path):
+    crops = [np.full((3, 4, 3), i, dtype=np.uint8) for i in range(3)]
+    with CropShardWriter(str(tmp_path)) as writer:
+        writer.write("tile", crops)
+
+    stored = list(iter_shard_crops(CropShardReader(str(tmp_path))))
+
+    assert [key for key, _ in stored] == [("tile", 0), ("tile", 1), ("tile", 2)]
+    assert all(np.array_equal(crop, e) for (_, crop), e in zip(stored, crops))
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_classify_tiles_passes_predictions_to_sink(processes):
+    pairs = [PAIR, TilePair(3.0, 4.0, PAIR.street_path, PAIR.satellite_path)]
+    received = []
+
+    report = classify_tiles(
+        pairs,
+        BrightnessClassifier,
+        received.extend,
+        processes=processes,
+        tiles_per_task=1,
+        size=32,
+    )
+
+    crops = len(crop_tile(PAIR)[1])
+    assert report.tiles == 2 and report.crops == 2 * crops
+    assert sorted((p.tile, p.box) for p in received) == sorted(
+        (pair.name, box) for pair in pairs for box in range(crops)
+    )
+
+
+def test_classify_tiles_reports_failed_tiles(capsys):
+    missing = TilePair(5.0, 6.0, "missing.png", "missing.png")
+
+    report = classify_tiles(
+        [missing, PAIR],
+        BrightnessClassifier,
+        lambda _: None,
+        processes=1,
+        tiles_per_task=1,
+    )
+
+    assert report.failures == [missing.name]
+    assert report.tiles == 1
+    assert "failed" in capsys.readouterr().out
+
+
+def test_report_computes_throughput():
+    assert ClassificationReport(crops=100, seconds=4).crops_per_second == 25
+    assert ClassificationReport().crops_per_second == 0
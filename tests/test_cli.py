@@ -0,0 +1,152 @@
+import io
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+from src.cli import main
+
+
+def run(*argv):
+    output = io.StringIO()
+    code = main(list(argv), output)
+    return code, output.getvalue()
+
+
+def test_crawl_prints_locations():
+    code, output = run("crawl", "--start", "1.0", "2.0", "--max-requests", "3")
+    assert code == 0
+    assert output.splitlines() == ["1.0,2.0", "0.998467,2.0", "1.001533,2.0"]
+
+
+def test_crawl_estimates_area_cost():
+    code, output = run(
+        "crawl", "--area", "28.76", "-81.27", "28.77", "-81.26", "--estimate"
+    )
+    assert code == 0
+    assert output == "16 tiles, 32 requests, $0.06\n"
+
+
+def test_crawl_requires_start_or_area():
+    with pytest.raises(SystemExit):
+        run("crawl")
+
+
+def test_rejects_unknown_options():
+    with pytest.raises(SystemExit):
+        run("crawl", "--start", "1", "2", "--bogus")
+
+
+def test_scrape_reports_missing_api_key(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr("src.settings._load_environment", lambda: None)
+    monkeypatch.delenv("GOOGLE_MAPS_API_KEY", raising=False)
+    locations = tmp_path / "locations.txt"
+    locations.write_text("1.0,2.0\n")
+
+    code, _ = run(
+        "scrape", str(locations), "--manifest", str(tmp_path / "manifest.sqlite")
+    )
+
+    assert code == 1
+    assert "GOOGLE_MAPS_API_KEY" in capsys.readouterr().err
+    assert not (tmp_path / "manifest.sqlite").exists()
+
+
+def test_extract_runs_extraction(tmp_path):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    shutil.copy("data/street_map_close.png", tile_dir / "street_1.5_2.5.png")
+    shutil.copy("data/satellite_map_close.png", tile_dir / "satellite_1.5_2.5.png")
+
+    code, _ = run("extract", str(tile_dir), str(tmp_path / "out"), "--processes", "1")
+
+    assert code == 0
+    assert (tmp_path / "out" / "satellite_1.5_2.5_0.jpg").exists()
+
+
+def test_bench_forwards_options_to_runner(capsys):
+    code, _ = run("bench", "--list", "--filter", "crawl/1000")
+    assert code == 0
+    assert capsys.readouterr().out.split() == [
+        "crawl/1000",
+        "crawl/10000",
+        "crawl/100000",
+    ]
+
+
+def test_worker_imports_skip_plotting_and_environment():
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.cli, src.extraction, src.settings, src.utils; "
+            "print(sorted({name.split('.')[0] for name in sys.modules} "
+            "& {'matplotlib', 'skimage', 'scipy', 'dotenv'}))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert loaded.strip() == "[]"
+
+
+class ConstantClassifier:
+    def predict(self, batch):
+        return [[0.25, 0.75]] * len(batch)
+
+
+def test_classify_prints_predictions(tmp_path):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    shutil.copy("data/street_map_close.png", tile_dir / "street_1.5_2.5.png")
+    shutil.copy("data/satellite_map_close.png", tile_dir / "satellite_1.5_2.5.png")
+
+    code, output = run(
+        "classify",
+        str(tile_dir),
+        "--classifier",
+        "tests.test_cli:ConstantClassifier",
+        "--processes",
+        "1",
+    )
+
+    lines = output.splitlines()
+    assert code == 0
+    assert lines[0] == "tile,box,label,confidence"
+    assert lines[1] == "1.5_2.5,0,1,0.75"
+
+
+def test_update_skips_unchanged_tiles(tmp_path, capsys):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    shutil.copy("data/street_map_close.png", tile_dir / "street_1.5_2.5.png")
+    shutil.copy("data/satellite_map_close.png", tile_dir / "satellite_1.5_2.5.png")
+    store = str(tmp_path / "epochs.sqlite")
+    options = ["--store", store, "--classifier", "tests.test_cli:ConstantClassifier"]
+
+    assert run("update", str(tile_dir), "--epoch", "2024-05", *options)[0] == 0
+    assert run("update", str(tile_dir), "--epoch", "2025-01", *options)[0] == 0
+    assert "1 unchanged" in capsys.readouterr().out.splitlines()[-1]
+
+
+def test_sweep_prints_results_table(tmp_path):
+    shutil.copy("data/street_map_close.png", tmp_path / "street_1.5_2.5.png")
+
+    code, output = run(
+        "sweep",
+        str(tmp_path),
+        "--method",
+        "components",
+        "--min-area",
+        "500",
+        "100000",
+        "--processes",
+        "1",
+    )
+
+    lines = output.splitlines()
+    assert code == 0
+    assert lines[0].startswith("tile,epsilon,method,downsample,gaussian_sigma")
+    assert len(lines) == 3
+    assert lines[2].split(",")[-2] == "0"
@@ -0,0 +1,110 @@
+import itertools
+
+import pytest
+
+from src.coverage import (
+    CoverageEstimate,
+    estimate_coverage,
+    lat_lon_to_pixel,
+    pixel_to_lat_lon,
+    pixels_to_lat_lon,
+    plan_coverage,
+    tile_footprint,
+)
+from src.scraping import GoogleMapsScraper, MapType
+
+PARAMS = GoogleMapsScraper("API_KEY", None, None, None)._create_params(
+    MapType.STREET, 0, 0
+)
+BBOX = (28.76, -81.27, 28.77, -81.26)
+TRIANGLE = {
+    "type": "Polygon",
+    "coordinates": [
+        [[-81.27, 28.76], [-81.26, 28.76], [-81.27, 28.77], [-81.27, 28.76]]
+    ],
+}
+
+
+def test_tile_footprint_reads_scraper_params():
+    assert tile_footprint(PARAMS) == (19, 1280, 1280)
+
+
+@pytest.mark.parametrize(("lat", "lon"), [(0, 0), (28.765846, -81.267981), (-60, 170)])
+def test_pixel_projection_round_trips(lat, lon):
+    x, y = lat_lon_to_pixel(lat, lon, 19)
+    assert pixel_to_lat_lon(x, y, 19) == pytest.approx((lat, lon), abs=1e-9)
+
+
+def test_plan_covers_bounding_box():
+    zoom, width, height = tile_footprint(PARAMS)
+    rects = []
+    for lat, lon in plan_coverage(BBOX, PARAMS):
+        x, y = lat_lon_to_pixel(lat, lon, zoom)
+        rects.append((x - width / 2, y - height / 2, x + width / 2, y + height / 2))
+
+    min_lat, min_lon, max_lat, max_lon = BBOX
+    for lat, lon in itertools.product([min_lat, max_lat], [min_lon, max_lon]):
+        x, y = lat_lon_to_pixel(lat, lon, zoom)
+        assert any(x0 <= x <= x1 and y0 <= y <= y1 for x0, y0, x1, y1 in rects)
+
+
+def test_plan_spaces_tiles_by_overlap_in_pixel_space():
+    zoom, width, _ = tile_footprint(PARAMS)
+    first, second = itertools.islice(plan_coverage(BBOX, PARAMS, overlap=0.25), 2)
+    x0, y0 = lat_lon_to_pixel(*first, zoom)
+    x1, y1 = lat_lon_to_pixel(*second, zoom)
+    assert x1 - x0 == pytest.approx(width * 0.75, abs=1)
+    assert y1 == pytest.approx(y0, abs=1)
+
+
+def test_plan_accounts_for_mercator_stretch_at_higher_latitudes():
+    equator = estimate_coverage((0, 0, 0.05, 0.05), PARAMS)
+    north = estimate_coverage((60, 0, 60.05, 0.05), PARAMS)
+    assert north.tiles > equator.tiles
+
+
+def test_small_area_needs_one_tile():
+    assert list(plan_coverage((10.0, 20.0, 10.0001, 20.0001), PARAMS)) == [
+        pytest.approx((10.00005, 20.00005), abs=1e-5)
+    ]
+
+
+def test_plan_streams_huge_areas_lazily():
+    plan = plan_coverage((25.0, -125.0, 49.0, -67.0), PARAMS)
+    assert len(list(itertools.islice(plan, 5))) == 5
+
+
+def test_estimate_matches_plan_for_bounding_box():
+    estimate = estimate_coverage(BBOX, PARAMS, cost_per_1000=2.0)
+    tiles = len(list(plan_coverage(BBOX, PARAMS)))
+    assert estimate == CoverageEstimate(tiles, tiles * 2, tiles * 2 / 1000 * 2.0)
+
+
+def test_polygon_plan_is_subset_of_bounding_box_plan():
+    polygon_tiles = list(plan_coverage(TRIANGLE, PARAMS))
+    bbox_tiles = list(plan_coverage(BBOX, PARAMS))
+    assert 0 < len(polygon_tiles) < len(bbox_tiles)
+    assert set(polygon_tiles) <= set(bbox_tiles)
+    assert estimate_coverage(TRIANGLE, PARAMS).tiles == len(polygon_tiles)
+
+
+def test_polygon_accepts_geojson_feature():
+    feature = {"type": "Feature", "geometry": TRIANGLE, "properties": {}}
+    assert list(plan_coverage(feature, PARAMS)) == list(plan_coverage(TRIANGLE, PARAMS))
+
+
+def test_rejects_unsupported_geometry():
+    with pytest.raises(ValueError):
+        list(plan_coverage({"type": "Point", "coordinates": [0, 0]}, PARAMS))
+
+
+def test_rejects_invalid_overlap():
+    with pytest.raises(ValueError):
+        list(plan_coverage(BBOX, PARAMS, overlap=1))
+
+
+def test_vectorized_pixels_to_lat_lon_matches_scalar():
+    xs, ys = [0.0, 1e6, 3.3e7], [5e5, 1e7, 6.7e7]
+    lats, lons = pixels_to_lat_lon(xs, ys, 18)
+    for x, y, lat, lon in zip(xs, ys, lats, lons):
+        assert (lat, lon) == pytest.approx(pixel_to_lat_lon(x, y, 18))
@@ -1,3 +1,8 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
 import pytest
 
 from src.crawling import (
@@ -5,8 +10,13 @@ from src.crawling import (
     MapType,
     get_crawl_locations,
     get_existing_locations,
+    get_missing_locations,
     scrape_image_from_locations,
+    scrape_image_from_locations_async,
 )
+from src.manifest import ScrapeManifest
+from src.rate_limiting import RateLimitScheduler, TokenBucket
+from src.scraping import FileSystem
 
 
 class TestGetCrawlLocations:
@@ -91,6 +101,72 @@ class TestGetCrawlLocations:
         assert distance(result[0], (start_lat, start_lon)) == 0
         assert distance(result[0], result[1]) < distance(result[0], result[-1])
 
+    def test_crawl_locations_follow_bfs_ring_order(self):
+        result = get_crawl_locations(
+            [(10.12345, 20.54321)],
+            max_requests=1000,
+            max_crawl_depth=3,
+        )
+        assert result == [
+            (10.12345, 20.54321),
+            (10.121917, 20.54321),
+            (10.124983, 20.54321),
+            (10.12345, 20.541677),
+            (10.12345, 20.544743),
+            (10.120384, 20.54321),
+            (10.121917, 20.541677),
+            (10.121917, 20.544743),
+            (10.126516, 20.54321),
+            (10.124983, 20.541677),
+            (10.124983, 20.544743),
+            (10.12345, 20.540144),
+            (10.12345, 20.546276),
+        ]
+
+    def test_crawl_locations_merges_overlapping_rings(self):
+        result = get_crawl_locations(
+            [(10.12345, 20.54321), (10.124983, 20.54321)],
+            max_requests=1000,
+            max_crawl_depth=3,
+            precision=3,
+        )
+        assert result == [
+            (10.123, 20.543),
+            (10.125, 20.543),
+            (10.121, 20.543),
+            (10.123, 20.541),
+            (10.123, 20.545),
+            (10.127, 20.543),
+            (10.125, 20.541),
+            (10.125, 20.545),
+            (10.119, 20.543),
+            (10.121, 20.541),
+            (10.121, 20.545),
+            (10.123, 20.539),
+            (10.123, 20.547),
+            (10.129, 20.543),
+            (10.127, 20.541),
+            (10.127, 20.545),
+            (10.125, 20.539),
+            (10.125, 20.547),
+        ]
+
+    def test_crawl_locations_with_negative_coordinates(self):
+        result = get_crawl_locations(
+            [(-33.868820, -151.209296)],
+            max_requests=3,
+            max_crawl_depth=2,
+        )
+        assert result == [
+            (-33.86882, -151.209296),
+            (-33.870353, -151.209296),
+            (-33.867287, -151.209296),
+        ]
+
+    def test_crawl_locations_rejects_unsupported_precision(self):
+        with pytest.raises(ValueError):
+            get_crawl_locations([(10.0, 20.0)], precision=8)
+
 
 class FakeScraper:
     def __init__(self):
@@ -128,6 +204,185 @@ class TestScrapeImageFromLocations:
         scrape_image_from_locations(locations, scraper)
         assert scraper.scrape_requests == []
 
+    def test_scrape_image_returns_saved_files(self, scraper):
+        locations = [(10.12345, 20.54321)]
+        assert scrape_image_from_locations(locations, scraper) == [
+            "image.png",
+            "image.png",
+        ]
+
+
+class SlowScraper:
+    """
+    Scraper that blocks like a network request and records peak concurrency.
+    """
+
+    def __init__(self, delay=0.01, failures=0):
+        self.delay = delay
+        self.failures = failures
+        self.scrape_requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def scrape_map_image(self, map_type, lat, lon):
+        with self.lock:
+            self.scrape_requests.append((map_type, lat, lon))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            should_fail = self.failures > 0
+            self.failures -= 1
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if should_fail:
+            raise ConnectionError("connection reset")
+        return f"{map_type.value}_{lat}_{lon}.png"
+
+
+class TimingOutRequests:
+    """
+    Requests object whose calls keep running for delay seconds and then raise a
+    timeout when that exceeds the request's timeout, like a stalled download.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get(self, url, params, timeout=None):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if timeout is not None and self.delay > timeout:
+            raise TimeoutError("read timed out")
+        raise AssertionError("expected the request to time out")
+
+
+class CountingRequests:
+    """
+    Requests object answering the first throttled calls with 429s.
+    """
+
+    def __init__(self, throttled=0):
+        self.calls = 0
+        self.throttled = throttled
+        self.lock = threading.Lock()
+
+    def get(self, url, params, timeout=None):
+        with self.lock:
+            self.calls += 1
+            status_code = 429 if self.calls <= self.throttled else 200
+        return SimpleNamespace(status_code=status_code, content=b"png", headers={})
+
+
+class TestScrapeImageFromLocationsAsync:
+    def test_scrapes_street_and_satellite_maps_in_order(self):
+        scraper = SlowScraper()
+        locations = [(10.12345, 20.54321), (30.98765, 40.12345)]
+
+        files = asyncio.run(scrape_image_from_locations_async(locations, scraper))
+        assert files == [
+            "street_10.12345_20.54321.png",
+            "satellite_10.12345_20.54321.png",
+            "street_30.98765_40.12345.png",
+            "satellite_30.98765_40.12345.png",
+        ]
+
+    def test_bounds_concurrency(self):
+        scraper = SlowScraper(delay=0.02)
+        locations = [(float(i), float(i)) for i in range(10)]
+
+        files = asyncio.run(
+            scrape_image_from_locations_async(locations, scraper, max_concurrency=3)
+        )
+        assert len(files) == 20
+        assert 1 < scraper.max_in_flight <= 3
+
+    def test_retries_failed_requests(self):
+        scraper = SlowScraper(failures=1)
+
+        files = asyncio.run(
+            scrape_image_from_locations_async(
+                [(10.0, 20.0)], scraper, max_concurrency=1, retries=1
+            )
+        )
+        assert len(files) == 2
+        assert len(scraper.scrape_requests) == 3
+
+    def test_skips_location_after_exhausting_retries(self):
+        scraper = SlowScraper(failures=2)
+
+        files = asyncio.run(
+            scrape_image_from_locations_async(
+                [(10.0, 20.0)], scraper, max_concurrency=1, retries=1
+            )
+        )
+        assert files == ["satellite_10.0_20.0.png"]
+
+    def test_retries_timed_out_requests_only_after_they_return(self, tmp_path):
+        requests = TimingOutRequests(delay=0.05)
+        scraper = GoogleMapsScraper(
+            "API_KEY", str(tmp_path), requests, FileSystem(), timeout=0.01
+        )
+
+        files = asyncio.run(
+            scrape_image_from_locations_async(
+                [(10.0, 20.0)], scraper, max_concurrency=2, retries=1
+            )
+        )
+        assert files == []
+        # one running request per map type, each attempt waiting out the last
+        assert requests.calls == 4
+        assert requests.max_in_flight == 2
+
+    def test_rate_limit_pauses_do_not_count_against_the_timeout(self, tmp_path):
+        requests = CountingRequests()
+        # one token at a time, so the second map type waits 0.1s for its token
+        scheduler = RateLimitScheduler(TokenBucket(rate=10, capacity=1))
+        scraper = GoogleMapsScraper(
+            "API_KEY",
+            str(tmp_path),
+            requests,
+            FileSystem(),
+            timeout=0.01,
+            scheduler=scheduler,
+        )
+
+        files = asyncio.run(
+            scrape_image_from_locations_async([(10.0, 20.0)], scraper, retries=0)
+        )
+        assert len(files) == 2
+        assert requests.calls == 2
+        assert scheduler.stats.failed == 0
+
+    def test_retries_throttling_that_outlasts_the_scheduler(self, tmp_path):
+        requests = CountingRequests(throttled=4)
+        scheduler = RateLimitScheduler(
+            max_retries=2, base_delay=0, sleep=lambda seconds: None
+        )
+        scraper = GoogleMapsScraper(
+            "API_KEY", str(tmp_path), requests, FileSystem(), scheduler=scheduler
+        )
+
+        files = asyncio.run(
+            scrape_image_from_locations_async(
+                [(10.0, 20.0)], scraper, max_concurrency=1, retries=1
+            )
+        )
+        assert len(files) == 2
+        assert scheduler.stats.failed == 1
+
+    def test_empty_locations(self):
+        assert asyncio.run(scrape_image_from_locations_async([], SlowScraper())) == []
+
 
 class TestGetExistingLocations:
     def test_parses_positive_and_negative_coords(self, scraper):
@@ -165,3 +420,17 @@ class TestGetExistingLocations:
         ]
 
         assert get_existing_locations(scraper, filenames) == []
+
+
+class TestGetMissingLocations:
+    def test_returns_locations_missing_from_manifest(self):
+        scraper = GoogleMapsScraper("API_KEY", "data", None, None)
+        manifest = ScrapeManifest()
+        params = scraper._create_params(MapType.STREET, 0, 0)
+        for map_type in [MapType.STREET, MapType.SATELLITE]:
+            manifest.record(map_type, 10.12345, 20.54321, params, "a.png", b"")
+
+        locations = [(10.12345, 20.54321), (30.98765, 40.12345)]
+        assert get_missing_locations(scraper, manifest, locations) == [
+            (30.98765, 40.12345)
+        ]
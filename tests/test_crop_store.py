@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from src.crop_store import CropShardReader, CropShardWriter
+from src.postprocessing import crop_images
+
+
+@pytest.fixture
+def tile():
+    return np.arange(40 * 50 * 3, dtype=np.uint8).reshape(40, 50, 3)
+
+
+def test_round_trips_crop_views(tmp_path, tile):
+    crops = crop_images(tile, [(5, 5, 10, 20), (20, 30, 35, 45)], buffer=2)
+    with CropShardWriter(str(tmp_path)) as writer:
+        writer.write("10.5_-20.25", crops)
+
+    reader = CropShardReader(str(tmp_path))
+    assert len(reader) == 2
+    for box, crop in enumerate(crops):
+        assert np.array_equal(reader.get("10.5_-20.25", box), crop)
+
+
+def test_reads_are_memory_mapped_views(tmp_path, tile):
+    with CropShardWriter(str(tmp_path)) as writer:
+        writer.write("tile", [tile[:10, :10]])
+
+    reader = CropShardReader(str(tmp_path))
+    crop = reader.get("tile", 0)
+    assert np.shares_memory(crop, reader.shards[0])
+    assert not crop.flags.writeable
+
+
+def test_preserves_dtype_and_gray_crops(tmp_path):
+    gray = np.linspace(0, 1, 12).reshape(3, 4)
+    with CropShardWriter(str(tmp_path)) as writer:
+        writer.write("tile", [gray, gray[1:, ::2]])
+
+    reader = CropShardReader(str(tmp_path))
+    assert np.array_equal(reader.get("tile", 0), gray)
+    assert np.array_equal(reader.get("tile", 1), gray[1:, ::2])
+    assert reader.get("tile", 0).dtype == np.float64
+
+
+def test_rolls_over_to_new_shards(tmp_path, tile):
+    with CropShardWriter(str(tmp_path), shard_bytes=100) as writer:
+        for name in ["a", "b", "c"]:
+            writer.write(name, [tile[:5, :5], tile[5:10, 5:10]])
+
+    assert len(list(tmp_path.glob("*.bin"))) == 3
+    reader = CropShardReader(str(tmp_path))
+    assert sorted(reader.keys()) == [(n, b) for n in "abc" for b in range(2)]
+    assert np.array_equal(reader.tile_crops("c")[1], tile[5:10, 5:10])
+
+
+def test_several_writers_share_a_directory(tmp_path, tile):
+    for name in ["a", "b"]:
+        with CropShardWriter(str(tmp_path)) as writer:
+            writer.write(name, [tile[:5, :5]])
+
+    reader = CropShardReader(str(tmp_path))
+    assert ("a", 0) in reader and ("b", 0) in reader
+
+
+def test_ignores_partially_written_index_record(tmp_path, tile):
+    with CropShardWriter(str(tmp_path), prefix="shard") as writer:
+        writer.write("tile", [tile[:5, :5]])
+    with open(tmp_path / "shard-00000.idx", "ab") as f:
+        f.write(b"partial")
+
+    assert list(CropShardReader(str(tmp_path)).keys()) == [("tile", 0)]
+
+
+def test_rejects_long_tile_ids(tmp_path, tile):
+    with CropShardWriter(str(tmp_path)) as writer:
+        with pytest.raises(ValueError):
+            writer.write("x" * 65, [tile])
+
+
+def test_missing_crop_raises(tmp_path):
+    with pytest.raises(KeyError):
+        CropShardReader(str(tmp_path)).get("tile", 0)
@@ -0,0 +1,155 @@
+import os
+import shutil
+
+import pytest
+
+from src import extraction
+from src.crop_store import CropShardReader
+from src.extraction import (
+    PROCESSED_LOG,
+    TilePair,
+    extract_tile,
+    pair_tiles,
+    run_extraction,
+)
+
+
+class FakeFilesystem:
+    def __init__(self):
+        self.files = {}
+
+    def imsave(self, image_path, image):
+        self.files[image_path] = image
+
+
+@pytest.fixture
+def tile_dir(tmp_path):
+    tile_dir = tmp_path / "tiles"
+    tile_dir.mkdir()
+    for (lat, lon), suffix in [((10.5, -20.25), ""), ((11.5, -21.25), "_close")]:
+        shutil.copy(
+            f"data/street_map{suffix}.png", tile_dir / f"street_{lat}_{lon}.png"
+        )
+        shutil.copy(
+            f"data/satellite_map{suffix}.png", tile_dir / f"satellite_{lat}_{lon}.png"
+        )
+    return tile_dir
+
+
+def test_pair_tiles_matches_street_and_satellite_by_location():
+    filenames = [
+        "dir/street_10.5_-20.25.png",
+        "dir/satellite_10.5_-20.25.png",
+        "dir/street_11.5_-21.25.png",  # missing satellite
+        "dir/satellite_map.png",
+        "dir/notes.txt",
+    ]
+    assert pair_tiles(filenames) == [
+        TilePair(
+            10.5, -20.25, "dir/street_10.5_-20.25.png", "dir/satellite_10.5_-20.25.png"
+        )
+    ]
+
+
+def test_extract_tile_saves_satellite_crops():
+    pair = TilePair(
+        1.0, 2.0, "data/street_map_close.png", "data/satellite_map_close.png"
+    )
+    filesystem = FakeFilesystem()
+
+    result = extract_tile(pair, "out", filesystem=filesystem)
+
+    assert result.name == "1.0_2.0"
+    assert result.crops == len(filesystem.files) > 0
+    assert "out/satellite_1.0_2.0_0.jpg" in filesystem.files
+    assert all(crop.shape[2] == 3 for crop in filesystem.files.values())
+
+
+def test_run_extraction_writes_crops_and_resumes(tile_dir, tmp_path):
+    output_dir = tmp_path / "roofs"
+
+    report = run_extraction(str(tile_dir), str(output_dir), processes=1)
+    assert report.tiles == 2
+    assert report.skipped == 0
+    assert report.crops == len(os.listdir(output_dir)) - 1
+    assert report.tiles_per_second > 0
+    assert (output_dir / PROCESSED_LOG).read_text().split() == [
+        "10.5_-20.25",
+        "11.5_-21.25",
+    ]
+
+    report = run_extraction(str(tile_dir), str(output_dir), processes=1)
+    assert report.tiles == 0
+    assert report.skipped == 2
+
+
+def test_run_extraction_with_process_pool(tile_dir, tmp_path):
+    output_dir = tmp_path / "roofs"
+
+    report = run_extraction(
+        str(tile_dir),
+        str(output_dir),
+        processes=2,
+        max_tiles_in_flight=1,
+        method="components",
+    )
+    assert report.tiles == 2
+    assert report.failed == 0
+    assert report.crops == len(os.listdir(output_dir)) - 1
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_extraction_writes_crop_shards(tile_dir, tmp_path, processes):
+    output_dir = tmp_path / "roofs"
+
+    report = run_extraction(
+        str(tile_dir),
+        str(output_dir),
+        processes=processes,
+        crop_format="shards",
+        method="components",
+    )
+    reader = CropShardReader(str(output_dir))
+    assert len(reader) == report.crops > 0
+    assert reader.get("10.5_-20.25", 0).ndim == 3
+    assert not list(output_dir.glob("*.jpg"))
+
+
+def test_run_extraction_rejects_unknown_crop_format(tile_dir, tmp_path):
+    with pytest.raises(ValueError):
+        run_extraction(str(tile_dir), str(tmp_path), crop_format="png")
+
+
+def test_run_extraction_records_failed_tiles(tile_dir, tmp_path):
+    (tile_dir / "street_12.5_-22.25.png").write_bytes(b"not a png")
+    (tile_dir / "satellite_12.5_-22.25.png").write_bytes(b"not a png")
+
+    report = run_extraction(str(tile_dir), str(tmp_path / "roofs"), processes=1)
+    assert report.tiles == 2
+    assert report.failures == ["12.5_-22.25"]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_extraction_reuses_cached_boxes(tile_dir, tmp_path, processes):
+    box_cache = str(tmp_path / "boxes.sqlite")
+
+    first = run_extraction(
+        str(tile_dir),
+        str(tmp_path / "first"),
+        processes=processes,
+        method="components",
+        box_cache=box_cache,
+    )
+    second = run_extraction(
+        str(tile_dir),
+        str(tmp_path / "second"),
+        processes=processes,
+        method="components",
+        box_cache=box_cache,
+    )
+
+    assert (first.cached, second.cached) == (0, 2)
+    assert second.crops == first.crops
+    # SQLite removes the write-ahead log once the last connection closes
+    assert not extraction._box_caches
+    assert not os.path.exists(box_cache + "-wal")
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+from skimage.feature import graycomatrix, graycoprops
+
+from src.features import (
+    FEATURE_NAMES,
+    GLCM_LEVELS,
+    GRAY_WEIGHTS,
+    FeatureBuffers,
+    _stretch,
+    batch_features,
+    extract_features,
+)
+from src.postprocessing import crop_images
+from src.utils import load_image
+
+SATELLITE = load_image("data/satellite_map_close.png")
+CROPS = crop_images(
+    SATELLITE,
+    [[100, 100, 180, 220], [500, 600, 640, 700], [1000, 1200, 1100, 1260]],
+)
+
+
+def feature(features, name):
+    return features[:, FEATURE_NAMES.index(name)]
+
+
+def test_batch_features_shape_and_dtype():
+    features = batch_features(CROPS)
+    assert features.shape == (3, len(FEATURE_NAMES))
+    assert features.dtype == np.float32
+    assert np.isfinite(features).all()
+
+
+def test_color_features_match_numpy():
+    features = batch_features(CROPS, FeatureBuffers.for_shape(3, 32))
+    resized = np.empty((32, 32, 3), dtype=np.uint8)
+    _stretch(CROPS[1], resized)
+
+    for index, channel in enumerate("rgb"):
+        histogram = np.histogram(resized[..., index], bins=8, range=(0, 256))[0]
+        assert features[1, index * 8 : index * 8 + 8] == pytest.approx(histogram / 1024)
+        assert feature(features, f"color_mean_{channel}")[1] == pytest.approx(
+            resized[..., index].mean() / 255, rel=1e-5
+        )
+        assert feature(features, f"color_std_{channel}")[1] == pytest.approx(
+            resized[..., index].std() / 255, rel=1e-4
+        )
+
+
+def test_glcm_features_match_skimage():
+    features = batch_features(CROPS, FeatureBuffers.for_shape(3, 48))
+    resized = np.empty((48, 48, 3), dtype=np.uint8)
+    _stretch(CROPS[0], resized)
+    gray = np.matmul(resized, GRAY_WEIGHTS).astype(np.uint8)
+
+    matrices = graycomatrix(
+        gray // (256 // GLCM_LEVELS),
+        [1],
+        [0, np.pi / 4, np.pi / 2, 3 * np.pi / 4],
+        levels=GLCM_LEVELS,
+        symmetric=True,
+        normed=True,
+    )
+    for prop in ["contrast", "homogeneity", "energy", "correlation"]:
+        assert feature(features, f"glcm_{prop}")[0] == pytest.approx(
+            graycoprops(matrices, prop).mean(), rel=1e-4
+        )
+
+
+def test_texture_features_of_flat_and_striped_crops():
+    flat = np.full((40, 40, 3), 120, dtype=np.uint8)
+    stripes = np.zeros((40, 40, 3), dtype=np.uint8)
+    stripes[:, np.arange(40) // 4 % 2 == 1] = 255
+
+    features = batch_features([flat, stripes], FeatureBuffers.for_shape(2, 40))
+
+    # every neighbour equals the center, a uniform pattern with all 8 bits set
+    assert feature(features, "lbp_8")[0] == 1
+    assert feature(features, "glcm_contrast")[0] == 0
+    assert feature(features, "glcm_correlation")[0] == 1
+    assert feature(features, "edge_density")[0] == 0
+    # straight stripe edges only make uniform patterns
+    assert feature(features, "lbp_9")[1] == 0
+    assert feature(features, "glcm_contrast")[1] > 0
+    assert feature(features, "edge_density")[1] == pytest.approx(0.5, abs=0.05)
+
+
+def test_features_do_not_depend_on_batch():
+    together = batch_features(CROPS)
+    alone = np.vstack([batch_features([crop]) for crop in CROPS])
+    np.testing.assert_allclose(together, alone, rtol=1e-5, atol=1e-6)
+
+
+def test_batch_features_rejects_oversized_batch():
+    with pytest.raises(ValueError):
+        batch_features(CROPS, FeatureBuffers.for_shape(2))
+
+
+def test_extract_features_keys_rows_across_batches():
+    keyed = [(("tile", box), CROPS[box % 3]) for box in range(7)]
+
+    keys, features = extract_features(keyed, batch_size=3)
+
+    assert keys == [("tile", box) for box in range(7)]
+    assert features.shape == (7, len(FEATURE_NAMES))
+    np.testing.assert_allclose(features[:3], features[3:6], rtol=1e-5, atol=1e-6)
+
+
+def test_extract_features_of_no_crops():
+    keys, features = extract_features([])
+    assert keys == []
+    assert features.shape == (0, len(FEATURE_NAMES))
@@ -0,0 +1,108 @@
+import pytest
+
+from src.manifest import ScrapeManifest
+from src.scraping import GoogleMapsScraper, MapType
+
+PARAMS = {"zoom": 19, "size": "1280x1280", "scale": 2}
+
+
+@pytest.fixture
+def manifest():
+    manifest = ScrapeManifest()
+    yield manifest
+    manifest.close()
+
+
+def record(manifest, map_type, lat, lon, params=PARAMS, payload=b"png"):
+    manifest.record(map_type, lat, lon, params, f"{map_type.value}.png", payload)
+
+
+def test_record_and_contains(manifest):
+    record(manifest, MapType.STREET, 10.12345, 20.54321)
+    assert manifest.contains(MapType.STREET, 10.12345, 20.54321, PARAMS)
+    assert not manifest.contains(MapType.SATELLITE, 10.12345, 20.54321, PARAMS)
+
+
+def test_contains_normalizes_float_formatting(manifest):
+    record(manifest, MapType.STREET, 28.765846, -81.267981)
+    assert manifest.contains(MapType.STREET, 28.7658460000001, -81.267981, PARAMS)
+
+
+def test_contains_distinguishes_request_params(manifest):
+    record(manifest, MapType.STREET, 10.0, 20.0)
+    params = {**PARAMS, "zoom": 18}
+    assert not manifest.contains(MapType.STREET, 10.0, 20.0, params)
+
+
+def test_records_size_hash_and_fetch_time(manifest):
+    manifest.record(MapType.STREET, 10.0, 20.0, PARAMS, "a.png", b"abc", 123.0)
+    (entry,) = manifest.entries()
+    assert entry.map_type == MapType.STREET
+    assert (entry.lat, entry.lon) == (10.0, 20.0)
+    assert entry.num_bytes == 3
+    assert entry.content_hash.startswith("ba7816bf")
+    assert entry.fetched_at == 123.0
+
+
+def test_rerecording_replaces_entry(manifest):
+    record(manifest, MapType.STREET, 10.0, 20.0, payload=b"a")
+    record(manifest, MapType.STREET, 10.0, 20.0, payload=b"ab")
+    assert len(manifest) == 1
+    assert next(manifest.entries()).num_bytes == 2
+
+
+def test_missing_locations_requires_every_map_type(manifest):
+    locations = [(30.0, 40.0), (10.0, 20.0), (50.0, 60.0)]
+    record(manifest, MapType.STREET, 10.0, 20.0)
+    record(manifest, MapType.SATELLITE, 10.0, 20.0)
+    record(manifest, MapType.STREET, 50.0, 60.0)
+
+    assert manifest.missing_locations(locations, PARAMS) == [(30.0, 40.0), (50.0, 60.0)]
+    assert manifest.missing_locations(locations, PARAMS, [MapType.STREET]) == [
+        (30.0, 40.0)
+    ]
+
+
+def test_missing_locations_persist_across_connections(tmp_path):
+    path = str(tmp_path / "manifest.sqlite")
+    manifest = ScrapeManifest(path)
+    record(manifest, MapType.STREET, 10.0, 20.0)
+    record(manifest, MapType.SATELLITE, 10.0, 20.0)
+    manifest.close()
+
+    manifest = ScrapeManifest(path)
+    assert manifest.missing_locations([(10.0, 20.0), (1.0, 2.0)], PARAMS) == [
+        (1.0, 2.0)
+    ]
+    manifest.close()
+
+
+def test_import_files(manifest, tmp_path):
+    scraper = GoogleMapsScraper("API_KEY", str(tmp_path), None, None)
+    for name in [
+        "street_10.12345_20.54321.png",
+        "satellite_-30.98765_40.12345.png",
+        "street_10_20.png",
+    ]:
+        (tmp_path / name).write_bytes(b"png")
+
+    filenames = sorted(str(path) for path in tmp_path.iterdir())
+    assert manifest.import_files(scraper, filenames) == 2
+
+    params = scraper._create_params(MapType.STREET, 0, 0)
+    assert manifest.contains(MapType.STREET, 10.12345, 20.54321, params)
+    assert manifest.contains(MapType.SATELLITE, -30.98765, 40.12345, params)
+
+
+def test_import_files_commits_once_per_batch(manifest, tmp_path):
+    scraper = GoogleMapsScraper("API_KEY", str(tmp_path), None, None)
+    for index in range(5):
+        (tmp_path / f"street_10.{index}_20.0.png").write_bytes(b"png")
+    statements = []
+    manifest.connection.set_trace_callback(statements.append)
+
+    filenames = sorted(str(path) for path in tmp_path.iterdir())
+    assert manifest.import_files(scraper, filenames, batch_size=2) == 5
+
+    assert len(manifest) == 5
+    assert statements.count("COMMIT") == 3
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+from skimage import io
+
+from src.bounding_boxes import _box_areas, box_iou, find_roof_boxes
+from src.coverage import pixel_to_lat_lon
+from src.extraction import TilePair
+from src.mosaic import _merge_duplicates, build_mosaic, find_mosaic_roof_boxes
+from src.postprocessing import crop_images
+from src.utils import load_image
+
+ZOOM = 19
+ORIGIN = 2**27  # an arbitrary Web Mercator pixel at ZOOM
+TILE_WIDTH = 660
+SEAM_COLUMNS = [0, 620]  # tiles overlapping by 40 columns
+PARAMS = {"zoom": ZOOM, "size": f"{TILE_WIDTH}x1280", "scale": 1}
+
+
+@pytest.fixture
+def street_image():
+    return load_image("data/street_map_close.png")
+
+
+@pytest.fixture
+def pairs(tmp_path, street_image):
+    """
+    Splits the close street and satellite maps into two side by side tiles.
+    """
+    satellite_image = load_image("data/satellite_map_close.png")
+    pairs = []
+    for index, left in enumerate(SEAM_COLUMNS):
+        lat, lon = pixel_to_lat_lon(ORIGIN + left + TILE_WIDTH / 2, ORIGIN + 640, ZOOM)
+        columns = slice(left, left + TILE_WIDTH)
+        street_path = str(tmp_path / f"street_{index}.png")
+        satellite_path = str(tmp_path / f"satellite_{index}.png")
+        io.imsave(street_path, street_image[:, columns], check_contrast=False)
+        io.imsave(satellite_path, satellite_image[:, columns], check_contrast=False)
+        pairs.append(
+            TilePair(round(lat, 7), round(lon, 7), street_path, satellite_path)
+        )
+    return pairs
+
+
+def matched(boxes, other_boxes, iou=0.5):
+    return int((box_iou(boxes, other_boxes).max(axis=1) > iou).sum())
+
+
+def test_build_mosaic_stitches_tiles(tmp_path, pairs, street_image):
+    mosaic = build_mosaic(pairs, PARAMS, str(tmp_path / "mosaic"), logo_margin=0)
+
+    assert mosaic.shape == (1280, 1280)
+    assert isinstance(mosaic.mask, np.memmap)
+    assert (mosaic.satellite == load_image("data/satellite_map_close.png")).all()
+
+
+def test_build_mosaic_leaves_out_logo_rows(tmp_path, pairs):
+    mosaic = build_mosaic(pairs, PARAMS, str(tmp_path / "mosaic"), logo_margin=100)
+    assert (mosaic.mask[-100:] == 1).all()
+    assert (mosaic.satellite[-100:] == 0).all()
+
+
+def test_build_mosaic_rejects_mismatched_tiles(tmp_path, pairs):
+    params = dict(PARAMS, size="640x640")
+    with pytest.raises(ValueError):
+        build_mosaic(pairs, params, str(tmp_path / "mosaic"))
+
+
+@pytest.mark.parametrize("window_size", [2048, 400])
+def test_mosaic_recovers_roofs_on_tile_seams(
+    tmp_path, pairs, street_image, window_size
+):
+    mosaic = build_mosaic(pairs, PARAMS, str(tmp_path / "mosaic"), logo_margin=0)
+    _, expected = find_roof_boxes(street_image, logo_margin=0)
+
+    bboxes = find_mosaic_roof_boxes(mosaic, window_size=window_size)
+
+    per_tile = []
+    for pair, left in zip(pairs, SEAM_COLUMNS):
+        _, tile_boxes = find_roof_boxes(load_image(pair.street_path), logo_margin=0)
+        tile_boxes[:, [1, 3]] += left
+        per_tile.append(tile_boxes)
+
+    assert len(bboxes) == len(expected)
+    assert matched(expected, bboxes) == len(expected)
+    assert matched(expected, np.concatenate(per_tile)) < len(expected)
+    assert all(len(crop) for crop in crop_images(mosaic.satellite, bboxes))
+
+
+def test_find_mosaic_roof_boxes_requires_halo_over_blur(tmp_path, pairs):
+    mosaic = build_mosaic(pairs, PARAMS, str(tmp_path / "mosaic"))
+    with pytest.raises(ValueError):
+        find_mosaic_roof_boxes(mosaic, halo=10)
+
+
+def test_merge_duplicates_keeps_largest_box():
+    bboxes = np.array(
+        [[0, 0, 10, 10], [0, 0, 10, 11], [50, 50, 60, 60]], dtype=np.int32
+    )
+    assert _merge_duplicates(bboxes, 0.5).tolist() == [
+        [0, 0, 10, 11],
+        [50, 50, 60, 60],
+    ]
+
+
+def test_merge_duplicates_matches_comparing_every_pair():
+    rng = np.random.default_rng(0)
+    mins = rng.integers(0, 400, size=(300, 2))
+    bboxes = np.hstack([mins, mins + rng.integers(5, 80, size=(300, 2))])
+    bboxes = bboxes.astype(np.int32)
+
+    # greedy suppression over the full IoU matrix
+    ordered = bboxes[np.argsort(-_box_areas(bboxes), kind="stable")]
+    overlaps = box_iou(ordered, ordered) > 0.3
+    keep = np.ones(len(ordered), dtype=bool)
+    for index in range(len(ordered)):
+        if keep[index]:
+            keep[index + 1 :] &= ~overlaps[index, index + 1 :]
+
+    np.testing.assert_array_equal(
+        _merge_duplicates(bboxes, 0.3, cell=32), ordered[keep]
+    )
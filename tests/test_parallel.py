@@ -0,0 +1,46 @@
+import pytest
+
+from src.parallel import imap_bounded
+
+
+def halve(number):
+    if number % 2:
+        raise ValueError(f"{number} is odd")
+    return number // 2
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_imap_bounded_yields_results_and_errors(processes):
+    outcomes = {
+        number: (result, error)
+        for number, result, error in imap_bounded(halve, range(6), processes)
+    }
+
+    assert sorted(outcomes) == list(range(6))
+    for number, (result, error) in outcomes.items():
+        if number % 2:
+            assert result is None and isinstance(error, ValueError)
+        else:
+            assert (result, error) == (number // 2, None)
+
+
+def test_imap_bounded_pulls_items_lazily():
+    pulled = []
+
+    def items():
+        for number in range(100):
+            pulled.append(number)
+            yield number
+
+    results = imap_bounded(halve, items(), processes=2, max_in_flight=3)
+    next(results)
+    assert len(pulled) <= 4
+
+
+def test_imap_bounded_initializes_in_process():
+    calls = []
+    outcomes = list(
+        imap_bounded(halve, [2], processes=1, initializer=calls.append, initargs=(7,))
+    )
+    assert outcomes == [(2, 1, None)]
+    assert calls == [7]
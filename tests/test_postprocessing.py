@@ -1,7 +1,7 @@
 import numpy as np
 import pytest
 
-from src.postprocessing import crop_image, save_images
+from src.postprocessing import crop_image, crop_images, save_images
 
 
 class FakeFilesystem:
@@ -71,6 +71,20 @@ def test_crop_image_with_buffer_doesnt_exceed_edge():
     )
 
 
+def test_crop_images_matches_crop_image():
+    image = np.arange(100).reshape(10, 10)
+    bboxes = np.array([[1, 1, 3, 3], [0, 5, 9, 9], [4, 4, 6, 8]], dtype=np.int32)
+    crops = crop_images(image, bboxes, buffer=2)
+    assert len(crops) == 3
+    for crop, bbox in zip(crops, bboxes):
+        assert np.array_equal(crop, crop_image(image, *bbox, buffer=2))
+        assert np.shares_memory(crop, image)
+
+
+def test_crop_images_with_no_boxes():
+    assert crop_images(np.zeros((5, 5)), np.empty((0, 4), dtype=np.int32)) == []
+
+
 def test_save_image(filesystem):
     image = np.array(
         [
@@ -0,0 +1,121 @@
+import json
+
+import pytest
+
+from src import profiling
+from src.bounding_boxes import find_roof_boxes
+from src.crawling import get_crawl_locations
+from src.profiling import StageTimings, TimerRegistry, timed, timer
+from src.utils import load_image
+
+
+class FakeClock:
+    def __init__(self, step):
+        self.now = 0.0
+        self.step = step
+
+    def __call__(self):
+        self.now += self.step
+        return self.now
+
+
+@pytest.fixture
+def registry():
+    registry = profiling.enable()
+    yield registry
+    profiling.disable()
+
+
+def test_disabled_timer_is_shared_no_op():
+    assert profiling.get_registry() is None
+    assert timer("a") is timer("b")
+    with timer("a"):
+        pass
+
+
+def test_timer_records_stage_durations():
+    registry = profiling.enable(TimerRegistry(clock=FakeClock(0.5)))
+    try:
+        for _ in range(3):
+            with timer("stage"):
+                pass
+    finally:
+        profiling.disable()
+
+    summary = registry.as_dict()["stage"]
+    assert summary["count"] == 3
+    assert summary["total"] == pytest.approx(1.5)
+    assert summary["p50"] == pytest.approx(0.5)
+
+
+def test_timed_decorator_records_calls(registry):
+    @timed("double")
+    def double(value):
+        return value * 2
+
+    assert double(2) == 4
+    assert registry.as_dict()["double"]["count"] == 1
+
+
+def test_timed_decorator_records_nothing_when_disabled():
+    registry = TimerRegistry()
+
+    @timed("double")
+    def double(value):
+        return value * 2
+
+    assert double(2) == 4
+    assert registry.as_dict() == {}
+
+
+def test_stage_timings_percentiles():
+    timings = StageTimings()
+    for milliseconds in range(1, 101):
+        timings.add(milliseconds / 1000)
+
+    summary = timings.summary()
+    assert summary["p50"] == pytest.approx(0.0505)
+    assert summary["p95"] == pytest.approx(0.09505)
+    assert summary["p99"] == pytest.approx(0.09901)
+    assert summary["max"] == 0.1
+
+
+def test_stage_timings_keep_bounded_sample():
+    timings = StageTimings(max_samples=10)
+    for _ in range(1000):
+        timings.add(1.0)
+    assert timings.count == 1000
+    assert len(timings.samples) == 10
+
+
+def test_exports_json_and_prometheus():
+    registry = TimerRegistry()
+    registry.record("scrape.request", 0.25)
+
+    assert json.loads(registry.to_json())["scrape.request"]["count"] == 1
+    text = registry.to_prometheus()
+    assert "# TYPE estatevision_stage_seconds summary" in text
+    assert (
+        'estatevision_stage_seconds{stage="scrape.request",quantile="0.99"} 0.25'
+        in text
+    )
+    assert 'estatevision_stage_seconds_count{stage="scrape.request"} 1' in text
+
+
+def test_instruments_find_roof_boxes_stages(registry):
+    find_roof_boxes(load_image("data/street_map_close.png"))
+    assert set(registry.as_dict()) == {
+        "find_roof_boxes",
+        "find_roof_boxes.mask",
+        "find_roof_boxes.gaussian",
+        "find_roof_boxes.canny",
+        "find_roof_boxes.label",
+        "find_roof_boxes.filter",
+    }
+
+
+def test_instruments_crawl(registry):
+    get_crawl_locations([(1.0, 2.0)], 10, 10)
+    stages = registry.as_dict()
+    assert stages["crawl"]["count"] == 1
+    assert stages["crawl.ring"]["count"] >= 1
@@ -0,0 +1,159 @@
+import random
+from dataclasses import dataclass, field
+
+import pytest
+
+from src.rate_limiting import (
+    SECONDS_PER_DAY,
+    DailyBudget,
+    RateLimitScheduler,
+    RetriesExhausted,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@dataclass
+class FakeResponse:
+    status_code: int
+    headers: dict = field(default_factory=dict)
+
+
+def responder(status_codes):
+    responses = [FakeResponse(status_code) for status_code in status_codes]
+    return lambda: responses.pop(0)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_scheduler(clock, daily_budget=None, max_retries=3):
+    return RateLimitScheduler(
+        bucket=TokenBucket(rate=10, capacity=1, clock=clock),
+        daily_budget=daily_budget,
+        max_retries=max_retries,
+        sleep=clock.sleep,
+        rng=random.Random(0),
+    )
+
+
+class TestTokenBucket:
+    def test_allows_burst_up_to_capacity(self, clock):
+        bucket = TokenBucket(rate=10, capacity=3, clock=clock)
+        assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+        assert bucket.reserve() == pytest.approx(0.1)
+
+    def test_refills_over_time(self, clock):
+        bucket = TokenBucket(rate=10, capacity=1, clock=clock)
+        bucket.reserve()
+        clock.now += 0.1
+        assert bucket.reserve() == 0
+
+    def test_queued_reservations_wait_longer(self, clock):
+        bucket = TokenBucket(rate=10, capacity=1, clock=clock)
+        waits = [bucket.reserve() for _ in range(3)]
+        assert waits == pytest.approx([0, 0.1, 0.2])
+
+
+class TestDailyBudget:
+    def test_consumes_until_exhausted(self, clock):
+        budget = DailyBudget(limit=2, clock=clock)
+        assert budget.consume() == 0
+        assert budget.consume() == 0
+        assert budget.remaining == 0
+        assert budget.consume() == SECONDS_PER_DAY
+
+    def test_resets_next_day(self, clock):
+        budget = DailyBudget(limit=1, clock=clock)
+        budget.consume()
+        clock.now += SECONDS_PER_DAY
+        assert budget.remaining == 1
+        assert budget.consume() == 0
+
+
+class TestRateLimitScheduler:
+    def test_returns_successful_response(self, clock):
+        scheduler = make_scheduler(clock)
+        response = scheduler.request(responder([200]))
+        assert response.status_code == 200
+        assert scheduler.stats.sent == 1
+        assert scheduler.stats.retried == 0
+
+    def test_retries_throttled_and_server_errors(self, clock):
+        scheduler = make_scheduler(clock)
+        response = scheduler.request(responder([429, 503, 200]))
+        assert response.status_code == 200
+        assert scheduler.stats.sent == 3
+        assert scheduler.stats.throttled == 1
+        assert scheduler.stats.retried == 2
+        assert scheduler.stats.failed == 0
+
+    def test_does_not_retry_client_errors(self, clock):
+        scheduler = make_scheduler(clock)
+        response = scheduler.request(responder([404]))
+        assert response.status_code == 404
+        assert scheduler.stats.sent == 1
+        assert scheduler.stats.failed == 0
+
+    def test_fails_after_max_retries(self, clock):
+        scheduler = make_scheduler(clock, max_retries=2)
+        with pytest.raises(RetriesExhausted) as raised:
+            scheduler.request(responder([500, 500, 500]))
+        assert raised.value.response.status_code == 500
+        assert isinstance(raised.value, OSError)
+        assert scheduler.stats.retried == 2
+        assert scheduler.stats.failed == 1
+
+    def test_counts_raised_requests_as_failed(self, clock):
+        scheduler = make_scheduler(clock)
+
+        def send():
+            raise ConnectionError("connection reset")
+
+        with pytest.raises(ConnectionError):
+            scheduler.request(send)
+        assert scheduler.stats.sent == 1
+        assert scheduler.stats.failed == 1
+
+    def test_backoff_grows_exponentially_with_jitter(self, clock):
+        scheduler = make_scheduler(clock)
+        for attempt in range(5):
+            delay = scheduler.backoff_delay(attempt)
+            assert 0 <= delay <= scheduler.base_delay * 2**attempt
+
+    def test_backoff_is_capped(self, clock):
+        scheduler = make_scheduler(clock)
+        assert scheduler.backoff_delay(20) <= scheduler.max_delay
+
+    def test_backoff_honors_retry_after(self, clock):
+        scheduler = make_scheduler(clock)
+        response = FakeResponse(429, headers={"Retry-After": "7"})
+        assert scheduler.backoff_delay(0, response) == 7
+
+    def test_throttles_to_rate(self, clock):
+        scheduler = make_scheduler(clock)
+        for _ in range(11):
+            scheduler.request(responder([200]))
+        assert clock.now == pytest.approx(1.0)
+
+    def test_pauses_until_daily_budget_resets(self, clock):
+        scheduler = make_scheduler(clock, daily_budget=DailyBudget(1, clock=clock))
+        scheduler.request(responder([200]))
+        response = scheduler.request(responder([200]))
+        assert response.status_code == 200
+        assert clock.now >= SECONDS_PER_DAY
+        assert scheduler.stats.sent == 2
@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+from src.coverage import lat_lon_to_pixel, pixel_to_lat_lon
+from src.roof_index import RoofIndex, pixel_boxes_to_lat_lon, tile_boxes_to_lat_lon
+from src.scraping import GoogleMapsScraper, MapType
+
+PARAMS = GoogleMapsScraper("API_KEY", None, None, None)._create_params(
+    MapType.STREET, 0, 0
+)
+CENTER = (28.765846, -81.267981)
+
+
+def test_tile_boxes_to_lat_lon_maps_center_pixel_to_tile_center():
+    # tiles are 2560 image pixels at scale 2, centered on pixel 1280
+    [box] = tile_boxes_to_lat_lon([[1280, 1280, 1280, 1280]], *CENTER, PARAMS)
+    assert box == pytest.approx([*CENTER, *CENTER], abs=1e-9)
+
+
+def test_tile_boxes_to_lat_lon_orients_north_up():
+    [box] = tile_boxes_to_lat_lon([[0, 0, 2560, 2560]], *CENTER, PARAMS)
+    min_lat, min_lon, max_lat, max_lon = box
+    x, y = lat_lon_to_pixel(*CENTER, 19)
+    assert (max_lat, min_lon) == pytest.approx(pixel_to_lat_lon(x - 640, y - 640, 19))
+    assert (min_lat, max_lon) == pytest.approx(pixel_to_lat_lon(x + 640, y + 640, 19))
+
+
+def test_overlapping_tiles_agree_on_shared_roof():
+    x, y = lat_lon_to_pixel(*CENTER, 19)
+    neighbour = pixel_to_lat_lon(x + 600, y, 19)  # 1200 image pixels east
+    roof = [[1000, 2000, 1100, 2200]]
+    shifted_roof = [[1000, 800, 1100, 1000]]
+
+    assert tile_boxes_to_lat_lon(roof, *CENTER, PARAMS) == pytest.approx(
+        tile_boxes_to_lat_lon(shifted_roof, *neighbour, PARAMS)
+    )
+
+
+def test_pixel_boxes_to_lat_lon_handles_empty_boxes():
+    assert pixel_boxes_to_lat_lon(np.empty((0, 4)), 0, 0, 19, 2).shape == (0, 4)
+
+
+@pytest.fixture
+def index():
+    index = RoofIndex()
+    yield index
+    index.close()
+
+
+def test_insert_and_query_range(index):
+    ids = index.insert([[1.0, 1.0, 1.1, 1.1], [2.0, 2.0, 2.1, 2.1]])
+    assert len(index) == 2
+
+    [roof] = index.query(0.9, 0.9, 1.05, 1.05)
+    assert roof.id == ids[0]
+    assert index.query(1.5, 1.5, 1.6, 1.6) == []
+
+
+def test_insert_merges_duplicate_roofs(index):
+    first, second, other = index.insert(
+        [
+            [1.0, 1.0, 1.1, 1.1],
+            [1.0, 1.01, 1.1, 1.11],
+            [1.05, 1.05, 1.2, 1.2],
+        ]
+    )
+    assert first == second != other
+    roof = index.get(first)
+    assert roof.observations == 2
+    assert roof.min_lon == pytest.approx(1.005)
+    assert len(index) == 2
+
+
+def test_insert_tile_merges_roofs_seen_by_overlapping_tiles(index):
+    x, y = lat_lon_to_pixel(*CENTER, 19)
+    neighbour = pixel_to_lat_lon(x + 600, y, 19)
+
+    index.insert_tile([[1000, 2000, 1100, 2200], [100, 100, 200, 200]], *CENTER, PARAMS)
+    index.insert_tile([[1000, 802, 1100, 1001]], *neighbour, PARAMS)
+
+    assert len(index) == 2
+    assert sorted(roof.observations for roof in index.query(-90, -180, 90, 180)) == [
+        1,
+        2,
+    ]
+
+
+def test_nearest_orders_by_distance(index):
+    index.insert(
+        [
+            [28.0000, -81.0000, 28.0001, -80.9999],
+            [28.0010, -81.0000, 28.0011, -80.9999],
+            [28.1000, -81.0000, 28.1001, -80.9999],
+        ]
+    )
+
+    roofs = index.nearest(28.0, -81.0, k=2)
+    assert [roof.min_lat for roof, _ in roofs] == [28.0, 28.001]
+    assert roofs[0][1] < roofs[1][1]
+
+    [(far, meters)] = index.nearest(28.2, -81.0)
+    assert far.min_lat == 28.1
+    assert meters == pytest.approx(11120, rel=0.01)
+
+
+def test_nearest_respects_max_distance(index):
+    index.insert([[28.1, -81.0, 28.1001, -80.9999]])
+    assert index.nearest(28.0, -81.0, max_meters=1000) == []
+    assert RoofIndex().nearest(0, 0) == []
+
+
+def test_index_persists(tmp_path):
+    path = str(tmp_path / "roofs.sqlite")
+    index = RoofIndex(path)
+    index.insert([[1.0, 1.0, 1.1, 1.1]])
+    index.close()
+
+    assert len(RoofIndex(path)) == 1
@@ -3,7 +3,11 @@ from dataclasses import dataclass
 
 import pytest
 
-from src.scraping import GoogleMapsScraper, MapType
+from src import profiling
+from src.manifest import ScrapeManifest
+from src.rate_limiting import RateLimitScheduler
+from src.scraping import BackgroundSaver, GoogleMapsScraper, MapType
+from src.tile_cache import TileCache
 
 
 class FakeFileSystem:
@@ -26,14 +30,16 @@ class FakeRequests:
     def __init__(self, responses=None):
         self.prev_requests = []
         self.prev_params = []
+        self.prev_kwargs = []
         self.responses = responses or []
 
     def set_responses(self, responses):
         self.responses = responses
 
-    def get(self, url, params):
+    def get(self, url, params, **kwargs):
         self.prev_requests.append(url)
         self.prev_params.append(params)
+        self.prev_kwargs.append(kwargs)
         return self.responses.pop() if self.responses else None
 
 
@@ -105,3 +111,118 @@ def test_scraper_handles_successful_request(requests, filesystem):
     filename = scraper.scrape_map_image(MapType.STREET, 41, -12)
     print(filename)
     assert filename is not None
+
+
+def test_scraper_passes_timeout_to_requests(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=200, content=b"")])
+    scraper = GoogleMapsScraper("API_KEY", "data", requests, filesystem, timeout=5)
+    scraper.scrape_map_image(MapType.STREET, 41, -12)
+    assert requests.prev_kwargs == [{"timeout": 5}]
+
+
+def test_scraper_retries_throttled_request_with_scheduler(requests, filesystem):
+    requests.set_responses(
+        [
+            FakeResponse(status_code=200, content=b""),
+            FakeResponse(status_code=429, content=b""),
+        ]
+    )
+    scheduler = RateLimitScheduler(base_delay=0, sleep=lambda seconds: None)
+    scraper = GoogleMapsScraper(
+        "API_KEY", "data", requests, filesystem, scheduler=scheduler
+    )
+    filename = scraper.scrape_map_image(MapType.STREET, 41, -12)
+    assert filename is not None
+    assert len(requests.prev_requests) == 2
+    assert scheduler.stats.throttled == 1
+
+
+def test_scraper_records_saved_images_in_manifest(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=200, content=b"png")])
+    manifest = ScrapeManifest()
+    scraper = GoogleMapsScraper(
+        "API_KEY", "data", requests, filesystem, manifest=manifest
+    )
+    scraper.scrape_map_image(MapType.STREET, 41, -12)
+    params = scraper._create_params(MapType.STREET, 41, -12)
+    assert manifest.contains(MapType.STREET, 41, -12, params)
+
+
+def test_scraper_skips_manifest_on_errored_request(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=404, content=b"")])
+    manifest = ScrapeManifest()
+    scraper = GoogleMapsScraper(
+        "API_KEY", "data", requests, filesystem, manifest=manifest
+    )
+    scraper.scrape_map_image(MapType.STREET, 41, -12)
+    assert len(manifest) == 0
+
+
+def test_scraper_fetches_image_without_saving(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=200, content=b"png")])
+    scraper = GoogleMapsScraper("API_KEY", "data", requests, filesystem)
+    assert scraper.fetch_map_image(MapType.STREET, 41, -12) == b"png"
+    assert filesystem.files == {}
+
+
+def test_scraper_fetch_handles_errored_request(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=500, content=b"")])
+    scraper = GoogleMapsScraper("API_KEY", "data", requests, filesystem)
+    assert scraper.fetch_map_image(MapType.STREET, 41, -12) is None
+
+
+def test_background_saver_saves_and_records_payloads(filesystem):
+    manifest = ScrapeManifest()
+    scraper = GoogleMapsScraper("API_KEY", "data", None, filesystem, manifest=manifest)
+
+    with BackgroundSaver(scraper, max_pending=1) as saver:
+        futures = [
+            saver.submit(MapType.STREET, 41, -12, b"street"),
+            saver.submit(MapType.SATELLITE, 41, -12, b"satellite"),
+        ]
+
+    assert [future.result() for future in futures] == [
+        "data/street_41_-12.png",
+        "data/satellite_41_-12.png",
+    ]
+    assert filesystem.files["data/satellite_41_-12.png"] == b"satellite"
+    assert sorted(saver.saved) == [
+        "data/satellite_41_-12.png",
+        "data/street_41_-12.png",
+    ]
+    assert len(manifest) == 2
+
+
+def test_background_saver_counts_failed_saves():
+    class FailingFileSystem:
+        def save_to_path(self, save_dir, filename, payload):
+            return None
+
+    scraper = GoogleMapsScraper("API_KEY", "data", None, FailingFileSystem())
+    with BackgroundSaver(scraper) as saver:
+        saver.submit(MapType.STREET, 41, -12, b"street")
+    assert saver.failed == 1
+    assert saver.saved == []
+
+
+def test_scraper_serves_repeated_requests_from_cache(requests, filesystem, tmp_path):
+    requests.set_responses([FakeResponse(status_code=200, content=b"png")])
+    cache = TileCache(str(tmp_path / "cache"))
+    scraper = GoogleMapsScraper("API_KEY", "data", requests, filesystem, cache=cache)
+
+    assert scraper.fetch_map_image(MapType.STREET, 41, -12) == b"png"
+    assert scraper.scrape_map_image(MapType.STREET, 41, -12) == "data/street_41_-12.png"
+    assert len(requests.prev_requests) == 1
+    assert cache.stats.hits == 1
+    assert cache.stats.cost_saved() == pytest.approx(0.002)
+
+
+def test_scraper_times_request_and_save(requests, filesystem):
+    requests.set_responses([FakeResponse(status_code=200, content=b"png")])
+    scraper = GoogleMapsScraper("API_KEY", "data", requests, filesystem)
+    registry = profiling.enable()
+    try:
+        scraper.scrape_map_image(MapType.STREET, 41, -12)
+    finally:
+        profiling.disable()
+    assert set(registry.as_dict()) == {"scrape", "scrape.request", "scrape.save"}
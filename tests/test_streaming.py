@@ -0,0 +1,180 @@
+import asyncio
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.crawling import iter_crawl_locations
+from src.crop_store import CropShardReader, CropShardWriter
+from src.extraction import TilePair, crop_tile
+from src.scraping import BackgroundSaver, MapType
+from src.streaming import StreamingPipeline
+
+
+class FakeScraper:
+    """
+    Writes a copy of the test images in place of each requested map.
+    """
+
+    def __init__(self, directory, fail_at=(), delay=0.0):
+        self.directory = directory
+        self.fail_at = set(fail_at)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def scrape_map_image(self, map_type, lat, lon):
+        with self.lock:
+            self.requests.append((map_type, lat, lon))
+        time.sleep(self.delay)
+        if (lat, lon) in self.fail_at and map_type == MapType.SATELLITE:
+            return None
+        source = (
+            "street_map_close" if map_type == MapType.STREET else "satellite_map_close"
+        )
+        path = self.directory / f"{map_type.value}_{lat}_{lon}.png"
+        shutil.copy(f"data/{source}.png", path)
+        return str(path)
+
+
+def collect(pipeline, locations):
+    async def run():
+        return [tile_crops async for tile_crops in pipeline.stream(locations)]
+
+    return asyncio.run(run())
+
+
+def test_stream_yields_crops_of_every_location(tmp_path):
+    locations = [(1.0, 2.0), (1.5, 2.5), (2.0, 3.0)]
+    pipeline = StreamingPipeline(
+        FakeScraper(tmp_path), fetch_workers=2, segment_executor=ThreadPoolExecutor(2)
+    )
+
+    results = collect(pipeline, locations)
+
+    assert sorted(result.name for result in results) == [
+        "1.0_2.0",
+        "1.5_2.5",
+        "2.0_3.0",
+    ]
+    expected_bboxes, expected_crops = crop_tile(
+        TilePair(0, 0, "data/street_map_close.png", "data/satellite_map_close.png")
+    )
+    for result in results:
+        assert (result.bboxes == expected_bboxes).all()
+        assert len(result.crops) == len(expected_crops)
+    report = pipeline.report()
+    assert report["crawl"]["processed"] == 3
+    assert report["fetch"]["processed"] == 3
+    assert report["segment"]["processed"] == 3
+    assert report["output"]["processed"] == 3
+
+
+def test_stream_drops_tiles_that_failed_to_fetch(tmp_path, capsys):
+    pipeline = StreamingPipeline(
+        FakeScraper(tmp_path, fail_at=[(1.5, 2.5)]),
+        fetch_workers=2,
+        segment_executor=ThreadPoolExecutor(1),
+    )
+
+    results = collect(pipeline, [(1.0, 2.0), (1.5, 2.5)])
+
+    assert [result.name for result in results] == ["1.0_2.0"]
+    assert pipeline.report()["fetch"]["dropped"] == 1
+
+
+def test_stream_consumes_lazy_locations_with_bounded_queues(tmp_path):
+    scraper = FakeScraper(tmp_path)
+    pipeline = StreamingPipeline(
+        scraper,
+        fetch_workers=1,
+        segment_workers=1,
+        queue_size=1,
+        segment_executor=ThreadPoolExecutor(1),
+    )
+    locations = iter_crawl_locations([(1.0, 2.0)], 1000, 100, 0.001, 3)
+
+    async def take_first():
+        stream = pipeline.stream(locations)
+        first = await stream.__anext__()
+        await asyncio.sleep(0.2)
+        await stream.aclose()
+        return first
+
+    first = asyncio.run(take_first())
+
+    assert first.name == "1.0_2.0"
+    # backpressure stops fetching a few tiles ahead of the consumer
+    assert len(scraper.requests) < 20
+    for stats in pipeline.report().values():
+        assert stats["max_queue_size"] <= 1
+
+
+def test_run_passes_crops_to_sink(tmp_path):
+    tiles = tmp_path / "tiles"
+    tiles.mkdir()
+    pipeline = StreamingPipeline(
+        FakeScraper(tiles), fetch_workers=2, segment_executor=ThreadPoolExecutor(2)
+    )
+
+    with CropShardWriter(str(tmp_path / "crops")) as writer:
+        report = asyncio.run(pipeline.run([(1.0, 2.0), (3.0, 4.0)], writer.write))
+
+    reader = CropShardReader(str(tmp_path / "crops"))
+    assert report["output"]["processed"] == 2
+    assert len(reader.tile_crops("1.0_2.0")) > 0
+    assert len(reader.tile_crops("3.0_4.0")) > 0
+
+
+class FakeFetchingScraper(FakeScraper):
+    def fetch_map_image(self, map_type, lat, lon):
+        with self.lock:
+            self.requests.append((map_type, lat, lon))
+        source = (
+            "street_map_close" if map_type == MapType.STREET else "satellite_map_close"
+        )
+        with open(f"data/{source}.png", "rb") as f:
+            return f.read()
+
+    def save_map_image(self, map_type, lat, lon, payload):
+        path = self.directory / f"{map_type.value}_{lat}_{lon}.png"
+        path.write_bytes(payload)
+        return str(path)
+
+
+def test_in_memory_stream_matches_saved_tiles(tmp_path):
+    on_disk = StreamingPipeline(
+        FakeScraper(tmp_path), segment_executor=ThreadPoolExecutor(1)
+    )
+    in_memory = StreamingPipeline(
+        FakeFetchingScraper(tmp_path / "unused"),
+        in_memory=True,
+        segment_executor=ThreadPoolExecutor(1),
+    )
+
+    [expected] = collect(on_disk, [(1.0, 2.0)])
+    [result] = collect(in_memory, [(1.0, 2.0)])
+
+    assert result.name == expected.name
+    assert (result.bboxes == expected.bboxes).all()
+    for crop, expected_crop in zip(result.crops, expected.crops):
+        assert (crop == expected_crop).all()
+    assert not (tmp_path / "unused").exists()
+
+
+def test_in_memory_stream_saves_in_background(tmp_path):
+    scraper = FakeFetchingScraper(tmp_path)
+    with BackgroundSaver(scraper) as saver:
+        pipeline = StreamingPipeline(
+            scraper,
+            in_memory=True,
+            saver=saver,
+            segment_executor=ThreadPoolExecutor(1),
+        )
+        results = collect(pipeline, [(1.0, 2.0)])
+
+    assert [result.name for result in results] == ["1.0_2.0"]
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "satellite_1.0_2.0.png",
+        "street_1.0_2.0.png",
+    ]
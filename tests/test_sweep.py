@@ -0,0 +1,121 @@
+import io
+
+import numpy as np
+import pytest
+
+from src import profiling
+from src.bounding_boxes import find_roof_boxes
+from src.sweep import (
+    SweepResult,
+    param_grid,
+    run_sweep,
+    sweep_image,
+    sweep_tile,
+    write_table,
+)
+from src.utils import load_image
+
+STREET_MAP = "data/street_map_close.png"
+
+
+@pytest.fixture
+def registry():
+    yield profiling.enable()
+    profiling.disable()
+
+
+def test_param_grid_expands_combinations_with_defaults():
+    grid = param_grid(min_area=[100, 200], gaussian_sigma=[5, 10])
+
+    assert len(grid) == 4
+    assert {(params["min_area"], params["gaussian_sigma"]) for params in grid} == {
+        (100, 5),
+        (100, 10),
+        (200, 5),
+        (200, 10),
+    }
+    assert all(params["method"] == "canny" for params in grid)
+    assert param_grid() == [param_grid(min_area=[500])[0]]
+
+
+def test_param_grid_rejects_unknown_parameters_and_methods():
+    with pytest.raises(TypeError):
+        param_grid(sigma=[1])
+    with pytest.raises(ValueError):
+        param_grid(method=["watershed"])
+
+
+def test_sweep_image_matches_find_roof_boxes():
+    image = load_image(STREET_MAP)
+    grid = param_grid(
+        method=["canny", "components"],
+        gaussian_sigma=[6, 10],
+        min_area=[300, 800],
+        buffer=[5, 50],
+    )
+
+    results = sweep_image(image, grid, "tile")
+
+    assert [result.params for result in results] == grid
+    for result in results:
+        _, expected = find_roof_boxes(image, **result.params)
+        np.testing.assert_array_equal(result.bboxes, expected)
+
+
+def test_sweep_image_shares_intermediate_stages(registry):
+    grid = param_grid(
+        epsilon=[0.0001, 0.01],
+        method=["canny", "components"],
+        canny_sigma=[1, 2],
+        min_area=[300, 500, 800],
+        logo_margin=[50, 100],
+    )
+
+    sweep_image(load_image(STREET_MAP), grid)
+
+    counts = {stage: timings.count for stage, timings in registry.stages.items()}
+    assert counts["sweep.pack"] == 1
+    # one blur per epsilon and method
+    assert counts["find_roof_boxes.gaussian"] == 4
+    # Canny labels per sigma, components labels once
+    assert counts["find_roof_boxes.label"] == 2 * (2 + 1)
+    assert counts["sweep.filter"] == len(grid) == 48
+
+
+def test_sweep_image_handles_non_rgb_images():
+    image = load_image(STREET_MAP)[:, :, :3].astype(np.float64) / 255
+    [result] = sweep_image(image, param_grid(method=["components"]))
+
+    _, expected = find_roof_boxes(image, method="components")
+    np.testing.assert_array_equal(result.bboxes, expected)
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_run_sweep_across_tiles(tmp_path, processes, capsys):
+    grid = param_grid(method=["components"], min_area=[300, 800])
+    missing = str(tmp_path / "street_0_0.png")
+
+    results = run_sweep([STREET_MAP, missing, STREET_MAP], grid, processes)
+
+    assert len(results) == 4
+    assert [result.tile for result in results] == ["street_map_close"] * 4
+    assert "street_0_0.png failed" in capsys.readouterr().out
+    expected = sweep_tile(STREET_MAP, grid)
+    for result, single in zip(results, expected * 2):
+        np.testing.assert_array_equal(result.bboxes, single.bboxes)
+
+
+def test_write_table_summarizes_results():
+    params = param_grid()[0]
+    results = [
+        SweepResult("a", params, np.array([[0, 0, 10, 20], [0, 0, 10, 40]])),
+        SweepResult("b", params, np.empty((0, 4), dtype=np.int32)),
+    ]
+    output = io.StringIO()
+
+    write_table(results, output)
+
+    header, first, second = output.getvalue().splitlines()
+    assert header.split(",")[-2:] == ["roofs", "mean_area"]
+    assert first.startswith("a,") and first.endswith(",2,300.0")
+    assert second.endswith(",0,0.0")
@@ -0,0 +1,123 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from src.scraping import GoogleMapsScraper, MapType
+from src.tile_cache import TileCache, cache_key
+
+
+def params(lat, lon, key="API_KEY"):
+    return GoogleMapsScraper(key, None, None, None)._create_params(
+        MapType.STREET, lat, lon
+    )
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"))
+    yield cache
+    cache.close()
+
+
+def test_cache_key_ignores_api_key_and_float_noise():
+    assert cache_key(params(28.765846, -81.2, "A")) == cache_key(
+        params(28.7658460001, -81.2, "B")
+    )
+    assert cache_key(params(28.765846, -81.2)) != cache_key(params(28.765847, -81.2))
+
+
+def test_get_returns_put_payload(cache):
+    assert cache.get(params(1.0, 2.0)) is None
+    cache.put(params(1.0, 2.0), b"tile")
+    assert cache.get(params(1.0, 2.0)) == b"tile"
+    assert (cache.stats.hits, cache.stats.misses) == (1, 1)
+    assert cache.stats.hit_rate == 0.5
+
+
+def test_identical_content_is_stored_once(cache, tmp_path):
+    cache.put(params(1.0, 2.0), b"ocean")
+    cache.put(params(1.5, 2.5), b"ocean")
+
+    blobs = [
+        name
+        for _, _, names in os.walk(tmp_path / "cache")
+        for name in names
+        if name.endswith(".png")
+    ]
+    assert len(cache) == 2
+    assert len(blobs) == 1
+    assert cache.total_bytes == len(b"ocean")
+    assert cache.stats.deduplicated == 1
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=10)
+    cache.put(params(1.0, 2.0), b"aaaa")
+    cache.put(params(2.0, 2.0), b"bbbb")
+    cache.get(params(1.0, 2.0))
+    cache.put(params(3.0, 2.0), b"cccc")
+
+    assert cache.get(params(2.0, 2.0)) is None
+    assert cache.get(params(1.0, 2.0)) == b"aaaa"
+    assert cache.get(params(3.0, 2.0)) == b"cccc"
+    assert cache.stats.evictions == 1
+    assert cache.total_bytes == 8
+
+
+def test_shared_blob_survives_evicting_one_request(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"), max_bytes=8)
+    cache.put(params(1.0, 2.0), b"same")
+    cache.put(params(2.0, 2.0), b"same")
+    cache.put(params(3.0, 2.0), b"new!")
+    cache.put(params(4.0, 2.0), b"more")
+
+    assert cache.get(params(1.0, 2.0)) is None
+    assert cache.get(params(2.0, 2.0)) is None
+    assert cache.get(params(4.0, 2.0)) == b"more"
+    assert cache.total_bytes <= 8
+
+
+def test_cache_persists_across_instances(tmp_path):
+    cache = TileCache(str(tmp_path / "cache"))
+    cache.put(params(1.0, 2.0), b"tile")
+    cache.close()
+
+    reopened = TileCache(str(tmp_path / "cache"))
+    assert reopened.get(params(1.0, 2.0)) == b"tile"
+    assert reopened.total_bytes == 4
+
+
+def test_instances_share_size_and_recency(tmp_path):
+    first = TileCache(str(tmp_path / "cache"), max_bytes=10)
+    second = TileCache(str(tmp_path / "cache"), max_bytes=10)
+    first.put(params(1.0, 2.0), b"aaaaaaaa")
+    second.put(params(2.0, 2.0), b"bbbbbbbb")
+
+    assert second.stats.evictions == 1
+    assert first.get(params(1.0, 2.0)) is None
+    assert first.get(params(2.0, 2.0)) == b"bbbbbbbb"
+    assert first.total_bytes == second.total_bytes == 8
+
+    first.put(params(3.0, 2.0), b"cc")
+    second.get(params(2.0, 2.0))
+    first.put(params(4.0, 2.0), b"dd")
+    assert first.get(params(3.0, 2.0)) is None
+    assert first.get(params(2.0, 2.0)) == b"bbbbbbbb"
+
+
+def test_import_stays_independent_of_crawling():
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.tile_cache; "
+            "print(sorted(set(sys.modules) "
+            "& {'numpy', 'src.coverage', 'src.crawling', 'src.manifest'}))",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert loaded.strip() == "[]"
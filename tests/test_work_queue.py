@@ -0,0 +1,276 @@
+import multiprocessing
+import os
+import time
+from functools import partial
+
+import pytest
+
+from src.scraping import MapType
+from src.work_queue import (
+    DONE,
+    FAILED,
+    LEASED,
+    PENDING,
+    ScrapeResult,
+    WorkQueue,
+    run_worker,
+    run_workers,
+    select_shard,
+    shard_locations,
+)
+
+LOCATIONS = [
+    (round(28.76 + i * 0.001, 6), round(-81.26 - j * 0.001, 6))
+    for i in range(6)
+    for j in range(5)
+]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeScraper:
+    """
+    Logs every scrape to a file shared by all worker processes.
+    """
+
+    def __init__(self, directory, fail_at=None):
+        self.directory = directory
+        self.fail_at = fail_at
+
+    def scrape_map_image(self, map_type, lat, lon):
+        if (lat, lon) == self.fail_at:
+            raise RuntimeError("scrape failed")
+        with open(os.path.join(self.directory, "scrapes.log"), "a") as f:
+            f.write(f"{lat},{lon},{map_type.value}\n")
+        return f"{map_type.value}_{lat}_{lon}.png"
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.db"), lease_seconds=60, clock=clock)
+    yield queue
+    queue.close()
+
+
+def scrapes(directory):
+    with open(os.path.join(directory, "scrapes.log")) as f:
+        return f.read().splitlines()
+
+
+def test_shard_locations_is_deterministic_and_balanced():
+    locations = [(i * 0.01, j * 0.01) for i in range(100) for j in range(100)]
+    shards = shard_locations(locations, 4)
+
+    assert shards.tolist() == shard_locations(locations, 4).tolist()
+    assert set(shards.tolist()) == {0, 1, 2, 3}
+    assert min((shards == shard).sum() for shard in range(4)) > 2300
+    # rounding noise doesn't move a location to another shard
+    assert shard_locations([(0.1 + 1e-12, 0.2)], 4) == shard_locations([(0.1, 0.2)], 4)
+
+
+def test_select_shard_partitions_locations():
+    parts = [select_shard(LOCATIONS, shard, 3) for shard in range(3)]
+    assert sorted(loc for part in parts for loc in part) == sorted(LOCATIONS)
+
+
+def test_enqueue_chunks_locations_by_shard(queue):
+    assert queue.enqueue(LOCATIONS, chunk_size=4, num_shards=3) >= 8
+
+    chunks = []
+    while chunk := queue.claim("worker"):
+        chunks.append(chunk)
+    assert sorted(loc for chunk in chunks for loc in chunk.locations) == sorted(
+        LOCATIONS
+    )
+    for chunk in chunks:
+        assert len(chunk.locations) <= 4
+        assert set(shard_locations(chunk.locations, 3).tolist()) == {chunk.shard}
+
+
+def test_enqueue_skips_queued_locations(queue):
+    queue.enqueue(LOCATIONS[:10])
+    assert queue.enqueue(LOCATIONS) == 1
+    assert queue.enqueue(LOCATIONS) == 0
+    assert queue.counts()[PENDING] == 2
+
+
+def test_claim_only_from_given_shards(queue):
+    queue.enqueue(LOCATIONS, chunk_size=4, num_shards=3)
+    while chunk := queue.claim("worker", shards=[1]):
+        assert chunk.shard == 1
+    assert queue.claim("worker", shards=[0]) is not None
+
+
+def test_leased_chunks_are_not_claimed_twice(queue, clock):
+    queue.enqueue(LOCATIONS[:2])
+    assert queue.claim("a") is not None
+    clock.now += 59
+    assert queue.claim("b") is None
+
+
+def test_expired_lease_is_recovered_and_fenced(queue, clock):
+    queue.enqueue(LOCATIONS[:2])
+    dead = queue.claim("dead")
+    clock.now += 61
+
+    chunk = queue.claim("alive")
+    assert chunk.id == dead.id
+    assert chunk.lease == dead.lease + 1
+    # the old owner can neither renew nor complete the chunk anymore
+    assert not queue.heartbeat(dead)
+    assert not queue.complete(
+        dead, [ScrapeResult(*dead.locations[0], MapType.STREET, "x")]
+    )
+    assert queue.complete(chunk, [])
+    assert list(queue.results()) == []
+
+
+def test_heartbeat_extends_lease(queue, clock):
+    queue.enqueue(LOCATIONS[:2])
+    chunk = queue.claim("a")
+    clock.now += 50
+    assert queue.heartbeat(chunk)
+    clock.now += 50
+    assert queue.claim("b") is None
+
+
+def test_results_are_recorded_once(queue):
+    queue.enqueue(LOCATIONS[:1])
+    chunk = queue.claim("a")
+    result = ScrapeResult(*LOCATIONS[0], MapType.STREET, "street.png")
+    assert queue.complete(chunk, [result, result])
+
+    assert list(queue.results()) == [result]
+    assert not queue.complete(chunk, [result])
+    assert queue.counts()[DONE] == 1
+
+
+def test_release_retries_then_fails(tmp_path, clock):
+    queue = WorkQueue(str(tmp_path / "queue.db"), max_attempts=2, clock=clock)
+    queue.enqueue(LOCATIONS[:1])
+    assert queue.release(queue.claim("a"), "boom")
+    assert queue.counts()[PENDING] == 1
+    assert queue.release(queue.claim("a"), "boom")
+    assert queue.counts()[FAILED] == 1
+    assert queue.claim("a") is None
+
+
+def test_release_keeps_partial_results(queue):
+    queue.enqueue(LOCATIONS[:2])
+    chunk = queue.claim("a")
+    result = ScrapeResult(*LOCATIONS[0], MapType.STREET, "street.png")
+    assert queue.release(chunk, "1 map images failed", [result])
+
+    retry = queue.claim("b")
+    assert queue.recorded(retry) == {(*LOCATIONS[0], MapType.STREET)}
+    assert list(queue.results()) == [result]
+
+
+def test_run_worker_scrapes_every_location_and_map_type(queue, tmp_path):
+    queue.enqueue(LOCATIONS, chunk_size=7)
+    assert run_worker(queue, FakeScraper(str(tmp_path)), "worker") == 5
+
+    results = list(queue.results())
+    assert len(results) == 2 * len(LOCATIONS)
+    assert {(r.lat, r.lon) for r in results} == set(LOCATIONS)
+    assert len(scrapes(tmp_path)) == 2 * len(LOCATIONS)
+
+
+def test_run_worker_releases_failed_chunks(queue, tmp_path, capsys):
+    queue.enqueue(LOCATIONS[:4], chunk_size=2)
+    scraper = FakeScraper(str(tmp_path), fail_at=LOCATIONS[0])
+    assert run_worker(queue, scraper, "worker") == 1
+    assert "scrape failed" in capsys.readouterr().out
+    assert queue.counts()[FAILED] == 1
+
+
+def test_run_worker_retries_missing_map_images(queue, tmp_path, capsys):
+    class FlakyScraper(FakeScraper):
+        """
+        Fails every third scrape the first time it's asked for it, like a dropped
+        request.
+        """
+
+        def __init__(self, directory):
+            super().__init__(directory)
+            self.attempts = {}
+
+        def scrape_map_image(self, map_type, lat, lon):
+            key = (map_type, lat, lon)
+            self.attempts[key] = self.attempts.get(key, 0) + 1
+            if len(self.attempts) % 3 == 0 and self.attempts[key] == 1:
+                return None
+            return super().scrape_map_image(map_type, lat, lon)
+
+    queue.enqueue(LOCATIONS, chunk_size=7)
+    scraper = FlakyScraper(str(tmp_path))
+    assert run_worker(queue, scraper, "worker") == 5
+
+    assert "missing" in capsys.readouterr().out
+    assert queue.counts()[DONE] == 5
+    assert len(list(queue.results())) == 2 * len(LOCATIONS)
+    # the scrapes that worked aren't repeated when their chunk is retried
+    assert max(scraper.attempts.values()) == 2
+    assert len(scrapes(tmp_path)) == 2 * len(LOCATIONS)
+
+
+def test_run_worker_renews_lease_during_a_long_scrape(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(path, lease_seconds=0.3)
+    queue.enqueue(LOCATIONS[:1])
+    thief = WorkQueue(path, lease_seconds=0.3)
+    stolen = []
+
+    class SlowScraper(FakeScraper):
+        def scrape_map_image(self, map_type, lat, lon):
+            if not stolen:
+                # one request outlasts several leases, as when backing off
+                time.sleep(1.0)
+                stolen.append(thief.claim("thief"))
+            return super().scrape_map_image(map_type, lat, lon)
+
+    assert run_worker(queue, SlowScraper(str(tmp_path)), "worker") == 1
+    assert stolen == [None]
+    assert len(list(queue.results())) == 2
+    thief.close()
+    queue.close()
+
+
+def _claim_and_die(path):
+    queue = WorkQueue(path, lease_seconds=0.5)
+    queue.claim("doomed")
+    os._exit(1)
+
+
+def test_worker_processes_scrape_exactly_once(tmp_path):
+    path = str(tmp_path / "queue.db")
+    queue = WorkQueue(path)
+    queue.enqueue(LOCATIONS, chunk_size=3, num_shards=2)
+
+    # a worker that dies holding a chunk leaves it to the others once its lease ends
+    dying = multiprocessing.Process(target=_claim_and_die, args=(path,))
+    dying.start()
+    dying.join()
+
+    completed = run_workers(
+        path, partial(FakeScraper, str(tmp_path)), processes=3, lease_seconds=0.5
+    )
+    counts = queue.counts()
+    assert completed == counts[DONE]
+    assert counts[PENDING] == counts[LEASED] == counts[FAILED] == 0
+
+    results = list(queue.results())
+    assert len(results) == 2 * len(LOCATIONS)
+    assert len({(r.lat, r.lon, r.map_type) for r in results}) == len(results)
+    queue.close()